@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compare reading DICOM headers only to reading whole DICOM files.
+
+==========
+Attributes
+==========
+
+Input
+-----
+
+DICOM_DIR : str
+    Directory with DICOM files, typically multi-frame Enhanced MR files.
+    Can be overridden by the first command line argument.
+
+Output
+------
+
+Time per file spent in read_metadata(), with and without header_only.
+
+"""
+
+DICOM_DIR = '/neurospin/imagen/FU3/RAW/PSC1/benchmark/ImageData'
+
+REPEAT = 3
+
+import os
+import sys
+import time
+import logging
+logging.basicConfig(level=logging.ERROR)
+
+# import ../imagen_databank
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from imagen_databank.dicom_utils import read_metadata
+
+
+def _list_files(path):
+    files = []
+    for root, dummy_dirs, filenames in os.walk(path):
+        for filename in filenames:
+            if not filename.startswith('DICOMDIR'):
+                files.append(os.path.join(root, filename))
+    return files
+
+
+def _time_per_file(files, header_only):
+    best = None
+    for dummy_i in range(REPEAT):
+        start = time.time()
+        for f in files:
+            try:
+                read_metadata(f, force=True, header_only=header_only)
+            except Exception:  # pylint: disable=broad-except
+                pass
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / len(files)
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DICOM_DIR
+    files = _list_files(path)
+    if not files:
+        print('no DICOM files found: {0}'.format(path))
+        return
+    full = _time_per_file(files, header_only=False)
+    header = _time_per_file(files, header_only=True)
+    print('{0} files'.format(len(files)))
+    print('whole file:  {0:.3f} ms/file'.format(full * 1000))
+    print('header only: {0:.3f} ms/file'.format(header * 1000))
+    print('speedup:     {0:.1f}x'.format(full / header))
+
+
+if __name__ == "__main__":
+    main()
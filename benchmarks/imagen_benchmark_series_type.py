@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compare matching series descriptions to series types with and without cache.
+
+==========
+Attributes
+==========
+
+Input
+-----
+
+DESCRIPTIONS : tuple
+    Series descriptions sent by acquisition centres. Can be replaced by
+    a file listing one series description per line, passed as the first
+    command line argument.
+
+Output
+------
+
+Time per series description spent:
+* trying each regex sequentially,
+* trying each regex sequentially, with results cached.
+
+"""
+
+DESCRIPTIONS = (
+    '3 Plane Localizer', '3Plane Loc SSFSE', 'Localiser', 'ASSET-Cal',
+    'ASSET Cal', 'Survey_SHC', 'Axial T2', 'T2W_TSE', 'Axial T2 FLAIR',
+    'T2W_FLAIR', 'ADNI MPRAGE', 'MPRAGE ADNI', 'short MPRAGE',
+    'EPI short MID', 'EPI short reward', 'EPI reward short', 'EPI faces',
+    'EPI_Faces', 'EPI stop signal', 'EPI_stop-signal', 'EPI SST',
+    'EPI Global', 'B0 Map', 'B0_map', 'FIELDMAP', 'DTI', 'DTI_SENSE',
+    'EPI REST', 'Resting State', 'NODDI', 'MoCoSeries', 'Phoenix ZIP Report',
+)
+
+REPEAT = 200
+
+import os
+import sys
+import time
+
+# import ../imagen_databank
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from imagen_databank import image_data
+
+
+def _sequential(series_description):
+    for regex, series_type in image_data._LOOSE_IMAGE_DATA_REGEXES:  # pylint: disable=W0212
+        if regex.search(series_description):
+            return series_type
+    return None
+
+
+def _time_per_description(function, descriptions):
+    start = time.time()
+    for dummy_i in range(REPEAT):
+        for description in descriptions:
+            function(description)
+    return (time.time() - start) / (REPEAT * len(descriptions))
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            descriptions = [line.rstrip('\n') for line in f if line.strip()]
+    else:
+        descriptions = DESCRIPTIONS
+    for description in descriptions:
+        assert (image_data.series_type_from_description(description) ==
+                _sequential(description)), description
+    sequential = _time_per_description(_sequential, descriptions)
+    cached = _time_per_description(image_data.series_type_from_description,
+                                   descriptions)
+    print('{0} series descriptions'.format(len(descriptions)))
+    print('sequential regexes: {0:.2f} µs/description'.format(sequential * 1e6))
+    print('cached results:     {0:.2f} µs/description'.format(cached * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compare parsing time stamps with a cascade of strptime() formats
+to parsing them with TimestampParser.
+
+==========
+Attributes
+==========
+
+Input
+-----
+
+TIMESTAMPS : dict
+    Time stamps found in behavioral and Cantab files, per centre.
+
+Output
+------
+
+Time per time stamp spent:
+* trying strptime() with each format in sequence,
+* in TimestampParser, without remembering the format of each centre,
+* in TimestampParser, remembering the format of each centre.
+
+"""
+
+FORMATS = (
+    '%d-%b-%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d.%m.%Y %H:%M:%S',
+    '%d %b %Y %H:%M:%S',
+    '%H:%M:%S %d.%m.%Y',
+    '%d/%m/%Y %H:%M:%S',
+    '%m/%d/%Y %I:%M:%S %p',
+)
+
+TIMESTAMPS = {
+    'LONDON': ('01-Feb-2015 12:34:56', '28-Nov-2016 09:05:01'),
+    'NOTTINGHAM': ('01/02/2015 12:34', '28/11/2016 09:05'),
+    'DUBLIN': ('2/1/2015 1:02:03 AM', '11/28/2016 9:05:01 PM'),
+    'BERLIN': ('01.02.2015 12:34:56', '28.11.2016 09:05:01'),
+    'PARIS': ('01 Feb 2015 12:34:56', '28 Nov 2016 09:05:01'),
+    'DRESDEN': ('12:34:56 01.02.2015', '09:05:01 28.11.2016'),
+}
+
+REPEAT = 2000
+
+import os
+import sys
+import time
+from datetime import datetime
+
+# import ../imagen_databank
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from imagen_databank import TimestampParser
+
+
+def _cascade(date_string, center):
+    for date_format in FORMATS:
+        try:
+            return datetime.strptime(date_string, date_format)
+        except ValueError:
+            pass
+    return None
+
+
+def _time_per_timestamp(function):
+    start = time.time()
+    n = 0
+    for dummy_i in range(REPEAT):
+        for center, timestamps in TIMESTAMPS.items():
+            for timestamp in timestamps:
+                function(timestamp, center)
+                n += 1
+    return (time.time() - start) / n
+
+
+def main():
+    parser = TimestampParser(FORMATS)
+    for center, timestamps in TIMESTAMPS.items():
+        for timestamp in timestamps:
+            assert parser.parse(timestamp, center) == _cascade(timestamp, center)
+    cascade = _time_per_timestamp(_cascade)
+    unknown = _time_per_timestamp(lambda t, c: parser.parse(t))
+    detected = _time_per_timestamp(parser.parse)
+    print('strptime() cascade:        {0:.2f} µs/time stamp'.format(cascade * 1e6))
+    print('parser, single format:     {0:.2f} µs/time stamp'.format(unknown * 1e6))
+    print('parser, format per centre: {0:.2f} µs/time stamp'.format(detected * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -30,7 +30,7 @@
 # knowledge of the CeCILL license and that you accept its terms.
 
 __all__ = ['additional_data', 'behavioral', 'cantab', 'core', 'dicom_utils',
-           'image_data', 'scanning', 'sanity']
+           'image_data', 'scanning', 'sanity', 'timestamps']
 
 from . import core
 from .core import (LONDON, NOTTINGHAM, DUBLIN, BERLIN,
@@ -40,8 +40,11 @@ from .core import CENTER_NAME
 from .core import (PSC2_FROM_PSC1, PSC1_FROM_PSC2,
                    PSC1_FROM_DAWBA, PSC2_FROM_DAWBA,  # PSC2_FROM_DAWBA is obsolete
                    DOB_FROM_PSC1, DOB_FROM_PSC2)  # DOB_FROM_PSC2 is obsolete
-from .core import (detect_psc1, detect_psc2, guess_psc1)
-from .core import Error
+from .core import set_conversion_tables
+from .core import (convert_psc1_to_psc2, age_in_days)
+from .core import (detect_psc1, detect_psc2, guess_psc1, guess_psc1_many)
+from .core import (find_codes, find_codes_in_file)
+from .core import (Error, ErrorCollector)
 
 from . import additional_data
 from .additional_data import (walk_additional_data, report_additional_data)
@@ -53,11 +56,15 @@ from .behavioral import (read_mid, read_ft, read_ss, read_recog)
 from . import cantab
 from .cantab import (CANTAB_CCLAR, DETAILED_DATASHEET_CSV, DATASHEET_CSV,
                      REPORT_HTML)
-from .cantab import (read_cant, read_datasheet, read_detailed_datasheet,
-                     read_report)
+from .cantab import (read_cant, read_cant_many,
+                     read_datasheet, read_detailed_datasheet, read_report,
+                     read_subject_ids_many)
+from .cantab import sniff_csv
+from .cantab import (load_datasheet, load_datasheets)
 
 from . import dicom_utils
 from .dicom_utils import read_metadata
+from .dicom_utils import MetadataCache
 
 from . import image_data
 from .image_data import (SEQUENCE_LOCALIZER_CALIBRATION,
@@ -69,14 +76,19 @@ from .image_data import (SEQUENCE_LOCALIZER_CALIBRATION,
                          SEQUENCE_NODDI)
 from .image_data import SEQUENCE_NAME
 from .image_data import NONSTANDARD_DICOM
-from .image_data import series_type_from_description
-from .image_data import walk_image_data, report_image_data
+from .image_data import (series_type_from_description,
+                         series_types_from_descriptions)
+from .image_data import (walk_image_data, walk_image_data_parallel,
+                         SeriesAccumulator, report_image_data)
 
 from . import scanning
 from .scanning import read_scanning
 
 from . import sanity
 
+from . import timestamps
+from .timestamps import TimestampParser
+
 __author__ = 'Dimitri Papadopoulos'
 __copyright__ = 'Copyright (c) 2014-2018 CEA'
 __license__ = 'CeCILL'
@@ -29,9 +29,11 @@
 # knowledge of the CeCILL license and that you accept its terms.
 
 import csv
-from datetime import datetime
 
 from .core import Error
+from .core import ErrorCollector
+from .core import _typed_column
+from .timestamps import TimestampParser
 
 import logging
 logger = logging.getLogger(__name__)
@@ -48,7 +50,14 @@ SS_CSV = 'ss'
 RECOG_CSV = 'recog'
 
 
-def _parse_behavioral_datetime(date_string):
+_BEHAVIORAL_TIMESTAMPS = TimestampParser((
+    '%d.%m.%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M:%S',
+    '%m/%d/%Y %I:%M:%S %p',
+))
+
+
+def _parse_behavioral_datetime(date_string, center=None):
     """Read date in the format found in CSV files.
 
     * LONDON      01/02/2015 01:02:03
@@ -60,19 +69,10 @@ def _parse_behavioral_datetime(date_string):
     * PARIS       01/02/2015 01:02:03
     * DRESDEN     01.02.2015 01:02:03
 
+    The format detected for each center is tried first.
+
     """
-    DATE_FORMATS = (
-        '%d.%m.%Y %H:%M:%S',
-        '%d/%m/%Y %H:%M:%S',
-        '%m/%d/%Y %I:%M:%S %p',
-    )
-    for date_format in DATE_FORMATS:
-        try:
-            dt = datetime.strptime(date_string, date_format)
-            return dt
-        except ValueError:
-            pass
-    return None
+    return _BEHAVIORAL_TIMESTAMPS.parse(date_string, center)
 
 
 def _fix_spurious_quotes(s):
@@ -87,6 +87,15 @@ def _fix_spurious_quotes(s):
     return s
 
 
+def _fix_quoted_line(s):
+    """Fix a wholly quoted line, that is a line read as a single column."""
+    if s.startswith('"'):
+        row = next(csv.reader([s], delimiter='\t'), [])
+        if len(row) < 2:
+            s = _fix_spurious_quotes(s)
+    return s
+
+
 def _fix_terminal_tab(s):
     last = s.rfind('\t')
     if last > 0:
@@ -153,24 +162,30 @@ RECOG_COLUMNS = (
 # * list of columns in the 2nd line
 # * column from which to extract the last ascending numerical sequence
 # * True if the numerical sequence is strictly ascending
+# * expected number of trials
+# * True if trials are counted by the number of the last trial, False if
+#   they are counted by the length of the last ascending sequence of trials
 _TASK_SPECIFICS = {
-    MID_CSV: ('MID_TASK', MID_COLUMNS, 0, True),
-    FT_CSV: ('FACE_TASK', FT_COLUMNS, 0, True),
-    SS_CSV: ('STOP_SIGNAL_TASK', SS_COLUMNS, 0, False),
-    RECOG_CSV: ('RECOGNITION_TASK', RECOG_COLUMNS, 0, True),
+    MID_CSV: ('MID_TASK', MID_COLUMNS, 0, True, 42, True),
+    FT_CSV: ('FACE_TASK', FT_COLUMNS, 0, True, 24, False),
+    SS_CSV: ('STOP_SIGNAL_TASK', SS_COLUMNS, 0, False, 360, True),
+    RECOG_CSV: ('RECOGNITION_TASK', RECOG_COLUMNS, 0, True, 5, False),
 }
 
 
-def _read_generic_behavioral(path, task, strict=True):
+def _read_generic_behavioral(path, task, strict=True, table=False):
     """Read behavioral files and return part of the contents and errors.
 
     Sometimes complete lines are enclosed in quotes. Such quotes
-    must be fixed before the contents can be read as CSV.
+    must be fixed before the contents can be read as CSV. Lines are
+    fixed one by one, only if they read as a single column, so that
+    the file is read, fixed and checked in a single pass.
 
     Parameters
     ----------
-    path : str
-        Path to the behavioral file to read from.
+    path : str or file-like
+        Path to the behavioral file to read from, or text stream
+        with the contents of the behavioral file.
 
     task : ?
         Type of task.
@@ -179,6 +194,9 @@ def _read_generic_behavioral(path, task, strict=True):
         Be more lenient and let wholly quoted lines through if False,
         else do report the error.
 
+    table : bool
+        Also return the whole trial table if True.
+
     Returns
     -------
     psc1 : str
@@ -187,8 +205,14 @@ def _read_generic_behavioral(path, task, strict=True):
         Time stamp extracted from the header.
     trials : array_like
         Last ascending sequence of trials.
-    errors : array_like
-        List of Error.
+    errors : ErrorCollector
+        Errors, only the first ones in case of repeated line errors.
+    table : numpy.ndarray
+        Only if table is True, structured array with a field for each
+        column of the task and a record for each line of data with the
+        expected number of columns. Fields contain integers, floating-point
+        numbers (NaN for empty cells) or strings, depending on the values
+        found in the column.
 
     Raises
     ------
@@ -196,27 +220,59 @@ def _read_generic_behavioral(path, task, strict=True):
         If path does not exist.
 
     """
+    if hasattr(path, 'read'):
+        return _parse_generic_behavioral(path, getattr(path, 'name', None),
+                                         task, strict, table)
+    with open(path, 'r') as behavioral:  # add newline='' in Python 3
+        return _parse_generic_behavioral(behavioral, path, task, strict, table)
+
+
+def _trial_table(rows, columns):
+    """Build a structured array from lines of data.
+
+    Parameters
+    ----------
+    rows : list
+        Lines of data, each a list of strings with one item per column.
+    columns : tuple
+        Names of the columns.
+
+    Returns
+    -------
+    numpy.ndarray
+        Structured array with a field for each column.
+
+    """
+    import numpy as np
+    if rows:
+        arrays = [_typed_column(values) for values in zip(*rows)]
+    else:
+        arrays = [np.array([], dtype=np.float64) for dummy_c in columns]
+    table = np.empty(len(rows), dtype=[(c, a.dtype) for c, a in zip(columns, arrays)])
+    for c, a in zip(columns, arrays):
+        table[c] = a
+    return table
+
+
+def _parse_generic_behavioral(lines, path, task, strict, table=False):
+    """Parse lines of a behavioral file, see _read_generic_behavioral."""
     psc1 = None
     timestamp = None
     sequence = []
-    errors = []
-
-    with open(path, 'r') as behavioral:  # add newline='' in Python 3
-        lines = behavioral.readlines()
+    errors = ErrorCollector()
 
     # attempt to handle broken CSV files with fully quoted lines
-    reader = csv.reader(lines, delimiter='\t')
-    if not strict and max(len(row) for row in reader) < 2:
-        lines = [_fix_spurious_quotes(line) for line in lines]
+    if not strict:
+        lines = (_fix_quoted_line(line) for line in lines)
 
     # remove spurious terminal tab
-    lines = [_fix_terminal_tab(line) for line in lines]
+    lines = (_fix_terminal_tab(line) for line in lines)
 
-    # now re-read file contents
+    # now read file contents
     reader = csv.reader(lines, delimiter='\t')
 
     # 1st line
-    header = next(reader)
+    header = next(reader, None)
     if header:
         header = [x.strip() for x in header]
         if len(header) != 4:
@@ -237,7 +293,7 @@ def _read_generic_behavioral(path, task, strict=True):
                                           'with "{1}"'
                                           .format(header[2], COLUMN), header))
         if len(header) > 1:
-            timestamp = _parse_behavioral_datetime(header[1])
+            timestamp = _parse_behavioral_datetime(header[1], psc1[:2] if psc1 else None)
             if not timestamp:
                 errors.append(Error(path, 'Column 2 of line 1 "{0}" is not a standard time stamp'
                                           .format(header[1]), header))
@@ -268,23 +324,26 @@ def _read_generic_behavioral(path, task, strict=True):
         errors.append(Error(path, 'Missing 2nd line'))
 
     # data
+    COLUMNS, column, strictly_ascending = _TASK_SPECIFICS[task][1:4]
+    rows = [] if table else None
     last = None
     for n, row in enumerate(reader, 3):
         row = [x.strip() for x in row]
-        COLUMNS = _TASK_SPECIFICS[task][1]
         if not any(row):  # get rid of empty rows
             continue
         elif (len(row) != len(COLUMNS)):
             errors.append(Error(path, 'Line {0} contains {1} columns instead of {2}'
                                       .format(n, len(row), len(COLUMNS)),
-                                      row))
+                                      row, 'columns'))
+        elif rows is not None:
+            rows.append(row)
         # column to check for ascending numerical sequence
-        current = row[_TASK_SPECIFICS[task][2]].strip()
+        current = row[column].strip()
         try:
             # expect ascending numerical sequences
             current = int(current)
             if last:
-                if _TASK_SPECIFICS[task][3]:  # strictly ascending
+                if strictly_ascending:
                     if current <= last:
                         sequence = []  # start new ascending sequence
                 else:
@@ -295,14 +354,17 @@ def _read_generic_behavioral(path, task, strict=True):
         except ValueError:
             errors.append(Error(path, 'Column {0} of line {1} "{2}" should contain '
                                       'only numbers'
-                                      .format(_TASK_SPECIFICS[task][2] + 1, n, current), row))
+                                      .format(column + 1, n, current),
+                                row, 'numbers'))
             if last:
                 last = None
 
+    if table:
+        return psc1, timestamp, sequence, errors, _trial_table(rows, COLUMNS)
     return psc1, timestamp, sequence, errors
 
 
-def read_mid(path, strict=True):
+def read_mid(path, strict=True, table=False):
     """Return "Subject ID" and other information extracted from mid_*.csv.
 
     Sometimes complete lines are enclosed in quotes. In that case
@@ -310,13 +372,16 @@ def read_mid(path, strict=True):
 
     Parameters
     ----------
-    path : unicode
-        Path to the mid_*.csv file to read from.
+    path : unicode or file-like
+        Path to the mid_*.csv file to read from, or text stream.
 
     strict : bool
         Be more lenient and let wholly quoted lines through if False,
         else do report the error.
 
+    table : bool
+        Also return the whole trial table if True.
+
     Returns
     -------
     psc1 : str
@@ -325,8 +390,11 @@ def read_mid(path, strict=True):
         Time stamp extracted from the header.
     trials : array_like
         The last ascending sequence of trials ('Trials' column).
-    errors : array_like
-        List of Error.
+    errors : ErrorCollector
+        Errors, only the first ones in case of repeated line errors,
+        see _read_generic_behavioral.
+    table : numpy.ndarray
+        Only if table is True, see _read_generic_behavioral.
 
     Raises
     ------
@@ -334,10 +402,10 @@ def read_mid(path, strict=True):
         If path does not exist.
 
     """
-    return _read_generic_behavioral(path, MID_CSV, strict)
+    return _read_generic_behavioral(path, MID_CSV, strict, table)
 
 
-def read_ft(path, strict=True):
+def read_ft(path, strict=True, table=False):
     """Return "Subject ID" and other information extracted from ft_*.csv.
 
     Sometimes complete lines are enclosed in quotes. In that case
@@ -345,13 +413,16 @@ def read_ft(path, strict=True):
 
     Parameters
     ----------
-    path : unicode
-        Path to the ft_*.csv file to read from.
+    path : unicode or file-like
+        Path to the ft_*.csv file to read from, or text stream.
 
     strict : bool
         Be more lenient and let wholly quoted lines through if False,
         else do report the error.
 
+    table : bool
+        Also return the whole trial table if True.
+
     Returns
     -------
     psc1 : str
@@ -360,8 +431,11 @@ def read_ft(path, strict=True):
         Time stamp extracted from the header.
     trials : array_like
         The last ascending sequence of trials ('Trials' column).
-    errors : array_like
-        List of Error.
+    errors : ErrorCollector
+        Errors, only the first ones in case of repeated line errors,
+        see _read_generic_behavioral.
+    table : numpy.ndarray
+        Only if table is True, see _read_generic_behavioral.
 
     Raises
     ------
@@ -369,10 +443,10 @@ def read_ft(path, strict=True):
         If path does not exist.
 
     """
-    return _read_generic_behavioral(path, FT_CSV, strict)
+    return _read_generic_behavioral(path, FT_CSV, strict, table)
 
 
-def read_ss(path, strict=True):
+def read_ss(path, strict=True, table=False):
     """Return "Subject ID" and other information extracted from ss_*.csv.
 
     Sometimes complete lines are enclosed in quotes. In that case
@@ -380,13 +454,16 @@ def read_ss(path, strict=True):
 
     Parameters
     ----------
-    path : unicode
-        Path to the ss_*.csv file to read from.
+    path : unicode or file-like
+        Path to the ss_*.csv file to read from, or text stream.
 
     strict : bool
         Be more lenient and let wholly quoted lines through if False,
         else do report the error.
 
+    table : bool
+        Also return the whole trial table if True.
+
     Returns
     -------
     psc1 : str
@@ -395,8 +472,11 @@ def read_ss(path, strict=True):
         Time stamp extracted from the header.
     trials : array_like
         The last ascending sequence of trials ('Trials' column).
-    errors : array_like
-        List of Error.
+    errors : ErrorCollector
+        Errors, only the first ones in case of repeated line errors,
+        see _read_generic_behavioral.
+    table : numpy.ndarray
+        Only if table is True, see _read_generic_behavioral.
 
     Raises
     ------
@@ -404,10 +484,10 @@ def read_ss(path, strict=True):
         If path does not exist.
 
     """
-    return _read_generic_behavioral(path, SS_CSV, strict)
+    return _read_generic_behavioral(path, SS_CSV, strict, table)
 
 
-def read_recog(path, strict=True):
+def read_recog(path, strict=True, table=False):
     """Return "Subject ID" and other information extracted from recog_*.csv.
 
     Sometimes complete lines are enclosed in quotes. In that case
@@ -415,13 +495,16 @@ def read_recog(path, strict=True):
 
     Parameters
     ----------
-    path : unicode
-        Path to the recog_*.csv file to read from.
+    path : unicode or file-like
+        Path to the recog_*.csv file to read from, or text stream.
 
     strict : bool
         Be more lenient and let wholly quoted lines through if False,
         else do report the error.
 
+    table : bool
+        Also return the whole trial table if True.
+
     Returns
     -------
     psc1 : str
@@ -430,8 +513,11 @@ def read_recog(path, strict=True):
         Time stamp extracted from the header.
     times : array_like
         The last ascending sequence of trials ('TimePassed' column).
-    errors : array_like
-        List of Error.
+    errors : ErrorCollector
+        Errors, only the first ones in case of repeated line errors,
+        see _read_generic_behavioral.
+    table : numpy.ndarray
+        Only if table is True, see _read_generic_behavioral.
 
     Raises
     ------
@@ -439,7 +525,7 @@ def read_recog(path, strict=True):
         If path does not exist.
 
     """
-    return _read_generic_behavioral(path, RECOG_CSV, strict)
+    return _read_generic_behavioral(path, RECOG_CSV, strict, table)
 
 
 def main():
@@ -30,21 +30,32 @@
 
 from zipfile import ZipFile
 from lxml import etree
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import os
+import mmap
 import datetime
+from collections import OrderedDict
 import csv
 import re
 import sys
+from io import StringIO, BytesIO
+from itertools import chain
 
 if sys.version_info < (3, 0):
     from codecs import open as open  # pylint: disable=redefined-builtin
 
+from .timestamps import TimestampParser
+from .core import _typed_column
+from .core import _bounded_map
+
 import logging
 logger = logging.getLogger(__name__)
 
 __all___ = ['CANTAB_CCLAR', 'DETAILED_DATASHEET_CSV', 'DATASHEET_CSV',
             'REPORT_HTML',
-            'read_cant', 'read_datasheet', 'read_detailed_datasheet',
-            'read_report']
+            'read_cant', 'read_cant_many', 'sniff_csv', 'read_datasheet',
+            'load_datasheet', 'load_datasheets', 'read_detailed_datasheet',
+            'read_report', 'read_subject_ids_many']
 
 
 #
@@ -55,7 +66,42 @@ DETAILED_DATASHEET_CSV = 'detailed_datasheet'
 DATASHEET_CSV = 'datasheet'
 REPORT_HTML = 'report'
 
-_ID_XPATH = ".//{http://www.camcog.com/proteus/entity/xml}attribute[@name='ID']"
+_ATTRIBUTE_TAG = '{http://www.camcog.com/proteus/entity/xml}attribute'
+
+
+def _iter_cant_ids(f):
+    """Generate values of "ID" attributes found in an index.xml file.
+
+    The file is parsed incrementally and elements are discarded as soon
+    as they have been processed, so that memory does not grow with the
+    size of the file.
+
+    Parameters
+    ----------
+    f : file-like
+        Contents of the index.xml file.
+
+    Yields
+    ------
+    str
+        "ID" values.
+
+    """
+    for dummy_event, element in etree.iterparse(f, events=('end',),
+                                                tag=_ATTRIBUTE_TAG):
+        if element.get('name') == 'ID':
+            value = element.get('value')
+            if value:
+                yield value
+        element.clear()
+        # discard processed elements, before this one and its ancestors
+        node = element
+        parent = node.getparent()
+        while parent is not None:
+            while node.getprevious() is not None:
+                del parent[0]
+            node = parent
+            parent = node.getparent()
 
 
 def read_cant(path):
@@ -73,17 +119,74 @@ def read_cant(path):
 
     """
     subject_ids = set()
-    cantfile = ZipFile(path, 'r')
-    for name in cantfile.namelist():
-        if name.endswith('index.xml'):
-            root = etree.fromstring(cantfile.read(name))
-            for element in root.findall(_ID_XPATH):
-                subject_ids.add(element.attrib['value'])
-    cantfile.close()
+    with ZipFile(path, 'r') as cantfile:
+        for name in cantfile.namelist():
+            if name.endswith('index.xml'):
+                with cantfile.open(name) as f:
+                    subject_ids.update(_iter_cant_ids(f))
     return subject_ids
 
 
-def _parse_csv_datetime(date_string):
+def _read_cant(path):
+    try:
+        return path, read_cant(path), None
+    except Exception as e:  # pylint: disable=broad-except
+        return path, None, e
+
+
+def read_cant_many(paths, workers=4, processes=False, max_in_flight=None):
+    """Return "Subject ID" values found in many cant_*.cclar files.
+
+    Files are read concurrently and results are generated as soon as they
+    are available, not in the order of paths. Files that cannot be read
+    are skipped and an error message is logged.
+
+    Parameters
+    ----------
+    paths : iterable
+        Paths to the cant_*.cclar files to read from.
+    workers : int
+        Number of worker threads or processes.
+    processes : bool
+        Use a pool of processes if True, else a pool of threads.
+    max_in_flight : int, optional
+        Maximal number of files submitted to workers but not yet
+        generated, by default 4 times the number of workers.
+
+    Yields
+    ------
+    tuple
+        Yields a pair (path, subject_ids) where subject_ids is the set of
+        "Subject ID" values found in the file.
+
+    """
+    if max_in_flight is None:
+        max_in_flight = 4 * workers
+
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    with executor:
+        for path, subject_ids, error in _bounded_map(
+                executor, _read_cant, ((path,) for path in paths),
+                max_in_flight):
+            if error:
+                logger.error('cannot read Cantab file: %s: %s', path, error)
+            else:
+                yield path, subject_ids
+
+
+_CSV_TIMESTAMPS = TimestampParser((
+    '%d-%b-%Y %H:%M:%S',  # 01-Feb-2015 12:34:56
+    '%d/%m/%Y %H:%M',     # 01/02/2015 12:34
+    '%d.%m.%Y %H:%M:%S',  # 01.02.2015 12:34:56
+    '%d %b %Y %H:%M:%S',  # 01 Feb 2015 12:34:56
+    '%H:%M:%S %d.%m.%Y',  # 12:34:56 01.02.2015
+))
+
+
+def _parse_csv_datetime(date_string, center=None):
     """Read date in the format found in CSV files.
 
     * LONDON      01-Feb-2015 12:34:56
@@ -95,20 +198,77 @@ def _parse_csv_datetime(date_string):
     * PARIS       01 Feb 2015 12:34:56
     * DRESDEN     12:34:56 01.02.2015
 
+    The format detected for each center is tried first.
+
     """
-    DATE_FORMATS = (
-        '%d-%b-%Y %H:%M:%S',  # 01-Feb-2015 12:34:56
-        '%d/%m/%Y %H:%M',     # 01/02/2015 12:34
-        '%d.%m.%Y %H:%M:%S',  # 01.02.2015 12:34:56
-        '%d %b %Y %H:%M:%S',  # 01 Feb 2015 12:34:56
-        '%H:%M:%S %d.%m.%Y',  # 12:34:56 01.02.2015
-    )
-    for date_format in DATE_FORMATS:
-        try:
-            dt = datetime.datetime.strptime(date_string, date_format)
-            return dt
-        except ValueError:
-            pass
+    return _CSV_TIMESTAMPS.parse(date_string, center)
+
+
+#
+# number of characters read to detect the dialect of CSV files
+#
+_SNIFF_SIZE = 64 * 1024
+
+#
+# dialect of CSV files detected for each center and header line
+#
+_CSV_DIALECTS = {}
+
+
+def sniff_csv(csvfile, center=None):
+    """Detect the dialect of a CSV file from its first lines.
+
+    Only the first lines of the file are read to detect the dialect.
+    If a center is specified, the dialect previously detected for this
+    center is reused for files with the same header line.
+
+    Parameters
+    ----------
+    csvfile : file-like
+        Text file open for reading, at the beginning of the file. Under
+        Python 2, also a file open without an encoding, which reads bytes.
+    center : hashable, optional
+        Remember the detected dialect for this center.
+
+    Returns
+    -------
+    tuple
+        The tuple (dialect, lines) where lines iterates over all lines of
+        the file, including the lines read to detect the dialect, so that
+        the file is read only once.
+
+    Raises
+    ------
+    csv.Error
+        If the dialect cannot be detected.
+
+    """
+    sample = csvfile.read(_SNIFF_SIZE)
+    if len(sample) >= _SNIFF_SIZE:
+        sample += csvfile.readline()  # complete the last line
+    key = (center, sample.split('\n', 1)[0]) if center is not None else None
+    dialect = _CSV_DIALECTS.get(key) if key is not None else None
+    if dialect is None:
+        dialect = csv.Sniffer().sniff(sample)
+        if key is not None:
+            _CSV_DIALECTS[key] = dialect
+    if isinstance(sample, bytes):  # Python 2 files open without an encoding
+        sample = BytesIO(sample)
+    else:
+        sample = StringIO(sample, newline='')
+    return dialect, chain(sample, csvfile)
+
+
+#
+# PSC1 code within the name of a Cantab file
+#
+_PSC1_IN_NAME_REGEX = re.compile(r'(?<!\d)(\d{12})(?!\d)')
+
+
+def _center_from_path(path):
+    match = _PSC1_IN_NAME_REGEX.search(os.path.basename(path))
+    if match:
+        return match.group(1)[:2]
     return None
 
 
@@ -130,11 +290,11 @@ def read_datasheet(path):
         * list of column titles.
 
     """
+    center = _center_from_path(path)
     with open(path) as csvfile:
         # read header
-        dialect = csv.Sniffer().sniff(csvfile.read())
-        csvfile.seek(0)
-        reader = csv.reader(csvfile, dialect)
+        dialect, lines = sniff_csv(csvfile, center)
+        reader = csv.reader(lines, dialect)
         rows = 0
         columns_max = columns_min = 0
         fields = {}
@@ -154,7 +314,8 @@ def read_datasheet(path):
                     subject_id = row[0]
                 subject_ids.add(subject_id)
             if "Session start time" in fields:
-                session_start_time = _parse_csv_datetime(row[fields["Session start time"]])
+                session_start_time = _parse_csv_datetime(row[fields["Session start time"]],
+                                                         center)
                 if session_start_time is not None:
                     if session_start_time < datetime.datetime(2007, 1, 1):
                         logger.warning('"Session start time" for %s anterior to 2007: %s',
@@ -167,9 +328,218 @@ def read_datasheet(path):
 
 
 #
-# match lines with "Subject ID"
+# columns of datasheet_*.csv files converted to dates and times
+#
+_DATASHEET_TIMESTAMP_COLUMNS = ('Session start time',)
+
+#
+# columns of datasheet_*.csv files kept as strings, such as PSC1 codes
+# which must retain their leading zeros
 #
-_DETAILED_DATASHEET_REGEX = re.compile(r'"?Subject ID : (\w*)"?')
+_DATASHEET_STRING_COLUMNS = ('Subject ID',)
+
+
+def _datetime_column(values, center=None):
+    import numpy as np
+    dates = []
+    for value in values:
+        date = _parse_csv_datetime(value, center) if value else None
+        dates.append(np.datetime64(date, 's') if date else np.datetime64('NaT'))
+    return np.array(dates, dtype='datetime64[s]')
+
+
+def load_datasheet(path):
+    """Load the whole table of a datasheet_*.csv file into typed columns.
+
+    Columns of integers or floating-point numbers are converted to NumPy
+    arrays of numbers, with NaN for missing values. "Session start time"
+    is converted to an array of datetime64, with NaT for missing or
+    unreadable values. "Subject ID" and other columns are returned as
+    arrays of strings.
+    Duplicate column titles are renamed "title.1", "title.2"...
+
+    Parameters
+    ----------
+    path : unicode
+        Path to the datasheet_*.csv file to read from.
+
+    Returns
+    -------
+    OrderedDict
+        Maps column titles to NumPy arrays of the same length, in the
+        order of the columns in the file.
+
+    """
+    import numpy as np
+    center = _center_from_path(path)
+    with open(path) as csvfile:
+        dialect, lines = sniff_csv(csvfile, center)
+        reader = csv.reader(lines, dialect)
+        header = next(reader, None)
+        if not header:
+            return OrderedDict()
+        rows = []
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < len(header):
+                row.extend([''] * (len(header) - len(row)))
+            rows.append(row[:len(header)])
+
+    titles = []
+    seen = {}
+    for title in header:
+        if title in seen:
+            seen[title] += 1
+            title = '{0}.{1}'.format(title, seen[title])
+        else:
+            seen[title] = 0
+        titles.append(title)
+
+    columns = OrderedDict()
+    values = zip(*rows) if rows else [()] * len(titles)
+    for title, column in zip(titles, values):
+        if title in _DATASHEET_TIMESTAMP_COLUMNS:
+            columns[title] = _datetime_column(column, center)
+        elif title in _DATASHEET_STRING_COLUMNS:
+            columns[title] = np.array(column, dtype=str)
+        else:
+            columns[title] = _typed_column(column)
+    return columns
+
+
+def _concatenate_columns(arrays):
+    """Concatenate columns, filling columns missing in some files."""
+    import numpy as np
+    present = [a for a in arrays if a.dtype != object]
+    kinds = set(a.dtype.kind for a in present)
+    if kinds <= {'i'} and len(present) == len(arrays):
+        dtype, fill = np.int64, None
+    elif kinds <= {'i', 'f'}:
+        dtype, fill = np.float64, np.nan
+    elif kinds == {'M'}:
+        dtype, fill = 'datetime64[s]', np.datetime64('NaT')
+    else:
+        dtype, fill = str, ''
+    parts = []
+    for a in arrays:
+        if a.dtype == object:  # placeholder for a missing column
+            parts.append(np.full(len(a), fill, dtype=dtype))
+        elif dtype is str and a.dtype.kind == 'f':
+            parts.append(np.array(['' if np.isnan(x) else str(x) for x in a],
+                                  dtype=str))
+        else:
+            parts.append(a.astype(dtype))
+    if not parts:
+        return np.array([], dtype=dtype)
+    return np.concatenate(parts)
+
+
+def _load_datasheet(path):
+    try:
+        return path, load_datasheet(path), None
+    except Exception as e:  # pylint: disable=broad-except
+        return path, None, e
+
+
+def load_datasheets(paths, workers=None, processes=False):
+    """Load and concatenate the tables of many datasheet_*.csv files.
+
+    Each file is loaded by load_datasheet() and rows are concatenated
+    in the order of paths. Columns missing from some files are filled
+    with NaN, NaT or empty strings; columns with different types across
+    files are converted to the most general type. Files that cannot be
+    read are skipped and an error message is logged.
+
+    Parameters
+    ----------
+    paths : iterable
+        Paths to the datasheet_*.csv files to read from.
+    workers : int, optional
+        Number of worker threads or processes, by default read files
+        sequentially.
+    processes : bool
+        Use a pool of processes if True, else a pool of threads.
+
+    Returns
+    -------
+    OrderedDict
+        Maps column titles to NumPy arrays of the same length.
+
+    """
+    import numpy as np
+    paths = list(paths)
+    if workers:
+        if processes:
+            executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+        with executor:
+            results = list(executor.map(_load_datasheet, paths))
+    else:
+        results = [_load_datasheet(path) for path in paths]
+
+    tables = []
+    titles = OrderedDict()
+    for path, table, error in results:
+        if error:
+            logger.error('cannot read Cantab datasheet: %s: %s', path, error)
+            continue
+        tables.append(table)
+        for title in table:
+            titles[title] = None
+
+    columns = OrderedDict()
+    for title in titles:
+        arrays = []
+        for table in tables:
+            if title in table:
+                arrays.append(table[title])
+            else:
+                length = len(next(iter(table.values()))) if table else 0
+                arrays.append(np.empty(length, dtype=object))
+        columns[title] = _concatenate_columns(arrays)
+    return columns
+
+
+#
+# match "Subject ID" in detailed_datasheet_*.csv files
+#
+# regex'es start with a literal string for fast scanning of whole files,
+# matches not at the beginning of a line are then discarded
+#
+# word characters of latin-1 encoded text
+_LATIN1_WORD = br'[\w\xaa\xb2\xb3\xb5\xb9\xba\xbc-\xbe\xc0-\xd6\xd8-\xf6\xf8-\xff]'
+_DETAILED_DATASHEET_REGEX = re.compile(
+    br'Subject ID : (' + _LATIN1_WORD + br'*)')
+
+
+def _at_line_start(buffer, start, prefix=b''):
+    """Check whether a match, optionally preceded by a prefix, starts a line."""
+    if prefix and buffer[start - len(prefix):start] == prefix:
+        start -= len(prefix)
+    return start == 0 or buffer[start - 1:start] in (b'\n', b'\r')
+
+
+def _scan_subject_ids(path, regex, prefix=b''):
+    """Return the first group of matches of a bytes regex in a file.
+
+    The file is mapped into memory and scanned in a single pass, only
+    matched groups are decoded.
+
+    """
+    subject_ids = set()
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return subject_ids
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for match in regex.finditer(buffer):
+                if _at_line_start(buffer, match.start(), prefix):
+                    subject_ids.add(match.group(1).decode('latin-1'))
+        finally:
+            buffer.close()
+    return subject_ids
 
 
 def read_detailed_datasheet(path):
@@ -186,16 +556,11 @@ def read_detailed_datasheet(path):
         "Subject ID" values found in the file.
 
     """
-    with open(path, encoding='latin1') as f:
-        subject_ids = set()
-        for line in f:
-            match = _DETAILED_DATASHEET_REGEX.match(line)
-            if match:
-                subject_ids.add(match.group(1))
-        return subject_ids
+    return _scan_subject_ids(path, _DETAILED_DATASHEET_REGEX, b'"')
 
 
-_REPORT_REGEX = re.compile('<th>Subject ID</th><td>(.*)</td><th>Gender</th><td>(.*)</td>')
+_REPORT_REGEX = re.compile(br'<th>Subject ID</th><td>([^\r\n]*)</td>'
+                           br'<th>Gender</th><td>[^\r\n]*</td>')
 
 
 def read_report(path):
@@ -212,10 +577,74 @@ def read_report(path):
         "Subject ID" values found in the file.
 
     """
-    with open(path, encoding='latin-1') as report_html:
-        subject_ids = set()
-        for line in report_html:
-            match = _REPORT_REGEX.match(line)
-            if match:
-                subject_ids.add(match.group(1))
-        return subject_ids
+    return _scan_subject_ids(path, _REPORT_REGEX)
+
+
+#
+# files from which "Subject ID" values can be read, by name
+#
+_SUBJECT_ID_READERS = (
+    (re.compile(r'(\w+_)?detailed[_ ]datasheet(_\w+)?\.csv', re.IGNORECASE),
+     read_detailed_datasheet),
+    (re.compile(r'(\w+_)?report(_\w+)?\.html', re.IGNORECASE), read_report),
+)
+
+
+def _find_subject_id_files(path):
+    for root, dummy_dirs, files in os.walk(path):
+        for filename in files:
+            for regex, reader in _SUBJECT_ID_READERS:
+                if regex.match(filename):
+                    yield os.path.join(root, filename), reader
+                    break
+
+
+def _read_subject_ids(path, reader):
+    try:
+        return path, reader(path), None
+    except Exception as e:  # pylint: disable=broad-except
+        return path, None, e
+
+
+def read_subject_ids_many(path, workers=4, processes=False, max_in_flight=None):
+    """Return "Subject ID" values found in Cantab files under a directory.
+
+    Files detailed_datasheet_*.csv and report_*.html are looked for
+    recursively and read concurrently. Results are generated as soon as
+    they are available, not in the order of files. Files that cannot be
+    read are skipped and an error message is logged.
+
+    Parameters
+    ----------
+    path : unicode
+        Directory to look for Cantab files into.
+    workers : int
+        Number of worker threads or processes.
+    processes : bool
+        Use a pool of processes if True, else a pool of threads.
+    max_in_flight : int, optional
+        Maximal number of files submitted to workers but not yet
+        generated, by default 4 times the number of workers.
+
+    Yields
+    ------
+    tuple
+        Yields a pair (path, subject_ids) where subject_ids is the set of
+        "Subject ID" values found in the file.
+
+    """
+    if max_in_flight is None:
+        max_in_flight = 4 * workers
+
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    with executor:
+        for f_path, subject_ids, error in _bounded_map(
+                executor, _read_subject_ids, _find_subject_id_files(path),
+                max_in_flight):
+            if error:
+                logger.error('cannot read Cantab file: %s: %s', f_path, error)
+            else:
+                yield f_path, subject_ids
@@ -28,8 +28,21 @@
 # The fact that you are presently reading this means that you have had
 # knowledge of the CeCILL license and that you accept its terms.
 
+import os
 import re
 import datetime
+import struct
+import mmap
+import hashlib
+import tempfile
+from collections import OrderedDict
+from collections import Counter
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping  # Python 2
 
 import logging
 logger = logging.getLogger(__name__)
@@ -41,8 +54,11 @@ __all___ = ['LONDON', 'NOTTINGHAM', 'DUBLIN', 'BERLIN',
             'PSC2_FROM_PSC1', 'PSC1_FROM_PSC2',
             'PSC1_FROM_DAWBA', 'PSC2_FROM_DAWBA',  # PSC2_FROM_DAWBA is obsolete
             'DOB_FROM_PSC1',
-            'detect_psc1', 'detect_psc2', 'guess_psc1',
-            'Error']
+            'set_conversion_tables',
+            'convert_psc1_to_psc2', 'age_in_days',
+            'detect_psc1', 'detect_psc2', 'guess_psc1', 'guess_psc1_many',
+            'find_codes', 'find_codes_in_file',
+            'Error', 'ErrorCollector']
 
 
 #
@@ -86,7 +102,7 @@ _PSC2PSC = '/neurospin/imagen/src/scripts/psc_tools/psc2psc.csv'
 _DOB = '/neurospin/imagen/src/scripts/psc_tools/DOB.csv'
 
 
-def _initialize_psc1_dawba_psc2():
+def _initialize_psc1_dawba_psc2(path):
     """Returns dictionnaries to map PSC1 to PSC2 and DAWBA codes to PSC1.
 
     Parameters
@@ -102,7 +118,7 @@ def _initialize_psc1_dawba_psc2():
     """
     psc2_from_psc1 = {}
     psc1_from_dawba = {}
-    with open(_PSC2PSC, 'rU') as f:
+    with open(path, 'rU') as f:
         for line in f:
             psc1, dawba, psc2 = line.strip('\n').split('=')
             # 1st line is: PSC1=DAWBA=PSC2
@@ -110,7 +126,7 @@ def _initialize_psc1_dawba_psc2():
                 continue
             if psc2 in psc2_from_psc1:
                 if psc2_from_psc1[psc1] != psc2:
-                    logger.critical('inconsistent PSC1/PSC2 mapping: %s', _PSC2PSC)
+                    logger.critical('inconsistent PSC1/PSC2 mapping: %s', path)
                     raise Exception('inconsistent PSC1/PSC2 mapping')
             else:
                 psc2_from_psc1[psc1] = psc2
@@ -121,7 +137,7 @@ def _initialize_psc1_dawba_psc2():
 _REGEX_DOB = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
 
 
-def _initialize_dob():
+def _initialize_dob(path):
     """Returns dictionnary to map PSC1 code to date of birth.
 
     Parameters
@@ -136,7 +152,7 @@ def _initialize_dob():
 
     """
     dob_from_psc1 = {}
-    with open(_DOB, 'rU') as f:
+    with open(path, 'rU') as f:
         for line in f:
             psc1, dob, dummy_when = line.strip('\n').split(',')
             match = _REGEX_DOB.match(dob)
@@ -152,13 +168,526 @@ def _initialize_dob():
     return dob_from_psc1
 
 
-PSC2_FROM_PSC1, PSC1_FROM_DAWBA = _initialize_psc1_dawba_psc2()
-PSC2_FROM_DAWBA = {k: PSC2_FROM_PSC1[v]  # obsolete
-                   for k, v in PSC1_FROM_DAWBA.items() if v in PSC2_FROM_PSC1}
-PSC1_FROM_PSC2 = {v: k for k, v in PSC2_FROM_PSC1.items()}
-DOB_FROM_PSC1 = _initialize_dob()
-DOB_FROM_PSC2 = {PSC2_FROM_PSC1[k]: v  # obsolete
-                 for k, v in DOB_FROM_PSC1.items() if k in PSC2_FROM_PSC1}
+#
+# conversion tables are compiled into a binary file of sorted fixed-width
+# records the first time they are required
+#
+# the binary file is then mapped into memory and searched in place, so
+# that processes share a single copy through the page cache
+#
+_CONVERSION_TABLE_PATHS = {
+    'psc2psc': _PSC2PSC,
+    'dob': _DOB,
+    'cache': None,
+}
+_CONVERSION_TABLES = {}
+
+_CACHE_MAGIC = b'IMAGENDB'
+_CACHE_VERSION = 2
+# magic, version, SHA-1 digest of psc2psc.csv and DOB.csv, section sizes
+_CACHE_HEADER = struct.Struct('<8sI20sIIIIII')
+# 12-byte PSC1 or DAWBA key followed by 12-byte PSC1 or PSC2 value
+_CODE_RECORD = struct.Struct('<12s12s')
+# 12-byte PSC1 key followed by date of birth as a proleptic Gregorian ordinal
+_DOB_RECORD = struct.Struct('<12si')
+_KEY_SIZE = 12
+
+
+def _encode_code(code):
+    """Convert a PSC1, PSC2 or DAWBA code to a fixed-width binary key.
+
+    Parameters
+    ----------
+    code : str
+        PSC1, PSC2 or DAWBA code.
+
+    Returns
+    -------
+    bytes
+        ASCII encoded code, or None if the code cannot be encoded.
+
+    """
+    try:
+        key = code.encode('ascii')
+    except (AttributeError, UnicodeError):
+        return None
+    if len(key) > _KEY_SIZE:
+        return None
+    return key
+
+
+def _decode_code(key):
+    return key.rstrip(b'\0').decode('ascii')
+
+
+class _BinaryMapping(Mapping):
+    """Read-only dictionnary backed by a section of sorted binary records.
+
+    Attributes
+    ----------
+    buffer : buffer
+        Memory-mapped file or bytes.
+    offset : int
+        Position of the first record in buffer.
+    count : int
+        Number of records.
+    record : struct.Struct
+        Layout of records: fixed-width key followed by value.
+    decode : callable
+        Converts the binary value of a record to a Python value.
+
+    """
+
+    def __init__(self, buffer, offset, count, record, decode):
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+        self._record = record
+        self._decode = decode
+
+    def _key(self, i):
+        start = self._offset + i * self._record.size
+        return self._buffer[start:start + _KEY_SIZE]
+
+    def _find(self, key):
+        key = _encode_code(key)
+        if key is None:
+            return -1
+        key = key.ljust(_KEY_SIZE, b'\0')
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._key(lo) == key:
+            return lo
+        return -1
+
+    def __getitem__(self, key):
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        dummy_key, value = self._record.unpack_from(self._buffer,
+                                                    self._offset + i * self._record.size)
+        return self._decode(value)
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield _decode_code(self._key(i))
+
+    def __len__(self):
+        return self._count
+
+    def _array(self, dtype):
+        """View the records as a sorted NumPy structured array, without copy."""
+        import numpy as np
+        return np.frombuffer(self._buffer, dtype=dtype,
+                             count=self._count, offset=self._offset)
+
+
+#
+# sections of the binary file, in order, after the header
+#
+_CACHE_SECTIONS = (
+    ('psc2_from_psc1', _CODE_RECORD, _decode_code),
+    ('dob_from_psc1', _DOB_RECORD, datetime.date.fromordinal),
+    ('psc1_from_dawba', _CODE_RECORD, _decode_code),
+    ('psc1_from_psc2', _CODE_RECORD, _decode_code),
+    ('psc2_from_dawba', _CODE_RECORD, _decode_code),
+    ('dob_from_psc2', _DOB_RECORD, datetime.date.fromordinal),
+)
+
+
+class _ConversionTables(object):
+    """Conversion tables read from a binary buffer.
+
+    Attributes
+    ----------
+    psc2_from_psc1 : Mapping
+        PSC1→PSC2 table.
+    dob_from_psc1 : Mapping
+        PSC1→date of birth table.
+    psc1_from_dawba : Mapping
+        DAWBA→PSC1 table.
+    psc1_from_psc2 : Mapping
+        PSC2→PSC1 table.
+    psc2_from_dawba : Mapping
+        DAWBA→PSC2 table.
+    dob_from_psc2 : Mapping
+        PSC2→date of birth table.
+
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        counts = _CACHE_HEADER.unpack_from(buffer)[3:]
+        offset = _CACHE_HEADER.size
+        for (name, record, decode), count in zip(_CACHE_SECTIONS, counts):
+            setattr(self, name, _BinaryMapping(buffer, offset, count,
+                                               record, decode))
+            offset += count * record.size
+
+
+def _source_signature(psc2psc, dob):
+    """SHA-1 digest of the contents of the conversion table source files.
+
+    Any change in the contents of these files triggers a rebuild of the
+    binary file, even if their size and modification time are unchanged.
+    Touching them without changing their contents does not.
+
+    """
+    digest = hashlib.sha1()
+    for path in (psc2psc, dob):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+        digest.update(b'\0')
+    return digest.digest()
+
+
+def _cache_path(psc2psc, dob):
+    """Default location of the binary file compiled from psc2psc and dob.
+
+    """
+    directory = os.environ.get('XDG_CACHE_HOME',
+                               os.path.join(os.path.expanduser('~'), '.cache'))
+    sources = '\0'.join((os.path.abspath(psc2psc), os.path.abspath(dob)))
+    digest = hashlib.sha1(sources.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directory, 'imagen_databank',
+                        'conversion_tables_{0}.bin'.format(digest))
+
+
+def _compile_conversion_tables(psc2psc, dob, signature):
+    """Compile text conversion tables into sorted fixed-width records.
+
+    Parameters
+    ----------
+    psc2psc  : unicode
+        File containing PSC1=DAWBA=PSC2 mappings.
+    dob  : unicode
+        DOB.csv file left over by initial Imagen team.
+    signature : bytes
+        SHA-1 digest of the contents of psc2psc and dob.
+
+    Returns
+    -------
+    bytes
+        Contents of the binary file.
+
+    """
+    psc2_from_psc1, psc1_from_dawba = _initialize_psc1_dawba_psc2(psc2psc)
+    dob_from_psc1 = _initialize_dob(dob)
+
+    def key(code):
+        encoded = _encode_code(code)
+        if encoded is None:
+            raise Exception('unexpected code in conversion table: {0}'.format(code))
+        return encoded
+
+    # reverse tables, with the last PSC1 code in sorted order winning
+    # in the unlikely case of a PSC2 code mapped from many PSC1 codes
+    psc1_from_psc2 = {v: k for k, v in sorted(psc2_from_psc1.items())}
+    psc2_from_dawba = {k: psc2_from_psc1[v]
+                       for k, v in psc1_from_dawba.items()
+                       if v in psc2_from_psc1}
+    dob_from_psc2 = {psc2_from_psc1[k]: v
+                     for k, v in sorted(dob_from_psc1.items())
+                     if k in psc2_from_psc1}
+
+    def code_records(table):
+        return sorted(_CODE_RECORD.pack(key(k), key(v))
+                      for k, v in table.items())
+
+    def dob_records(table):
+        return sorted(_DOB_RECORD.pack(key(k), v.toordinal())
+                      for k, v in table.items())
+
+    sections = [
+        code_records(psc2_from_psc1),
+        dob_records(dob_from_psc1),
+        code_records(psc1_from_dawba),
+        code_records(psc1_from_psc2),
+        code_records(psc2_from_dawba),
+        dob_records(dob_from_psc2),
+    ]
+    header = _CACHE_HEADER.pack(_CACHE_MAGIC, _CACHE_VERSION, signature,
+                                *[len(records) for records in sections])
+    return b''.join([header] + [r for records in sections for r in records])
+
+
+def _valid_cache(buffer, signature):
+    """Check a binary file is complete and up-to-date."""
+    if len(buffer) < _CACHE_HEADER.size:
+        return False
+    header = _CACHE_HEADER.unpack_from(buffer)
+    if header[0] != _CACHE_MAGIC or header[1] != _CACHE_VERSION:
+        return False
+    if header[2] != signature:
+        return False
+    size = _CACHE_HEADER.size
+    for (dummy_name, record, dummy_decode), count in zip(_CACHE_SECTIONS,
+                                                         header[3:]):
+        size += count * record.size
+    return len(buffer) == size
+
+
+def _map_cache(path):
+    try:
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError):  # ValueError: empty file
+        return None
+
+
+def _write_cache(path, data):
+    """Atomically replace the binary file, in case of concurrent processes."""
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.conversion_tables_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _conversion_tables():
+    """Read conversion tables the first time they are required.
+
+    Map the binary file compiled from psc2psc.csv and DOB.csv into memory,
+    after compiling it anew if it is missing or outdated.
+
+    Returns
+    -------
+    _ConversionTables
+
+    """
+    if 'tables' not in _CONVERSION_TABLES:
+        psc2psc = _CONVERSION_TABLE_PATHS['psc2psc']
+        dob = _CONVERSION_TABLE_PATHS['dob']
+        cache = _CONVERSION_TABLE_PATHS['cache'] or _cache_path(psc2psc, dob)
+        signature = _source_signature(psc2psc, dob)
+        buffer = _map_cache(cache)
+        if buffer is not None and not _valid_cache(buffer, signature):
+            buffer.close()
+            buffer = None
+        if buffer is None:
+            logger.info('compile conversion tables: %s', cache)
+            data = _compile_conversion_tables(psc2psc, dob, signature)
+            try:
+                _write_cache(cache, data)
+            except (IOError, OSError) as e:
+                logger.warning('cannot write conversion tables (%s): %s',
+                               str(e), cache)
+                buffer = data
+            else:
+                buffer = _map_cache(cache) or data
+        _CONVERSION_TABLES['tables'] = _ConversionTables(buffer)
+    return _CONVERSION_TABLES['tables']
+
+
+def set_conversion_tables(psc2psc=None, dob=None, cache=None):
+    """Read conversion tables from alternative files.
+
+    Conversion tables already read from disk are discarded and will be
+    read again from the new files on next access.
+
+    Parameters
+    ----------
+    psc2psc : unicode, optional
+        File containing PSC1=DAWBA=PSC2 mappings.
+    dob : unicode, optional
+        File mapping PSC1 codes to date of birth.
+    cache : unicode, optional
+        Binary file compiled from the above files. By default it is
+        located under $XDG_CACHE_HOME/imagen_databank.
+
+    """
+    if psc2psc:
+        _CONVERSION_TABLE_PATHS['psc2psc'] = psc2psc
+    if dob:
+        _CONVERSION_TABLE_PATHS['dob'] = dob
+    if cache:
+        _CONVERSION_TABLE_PATHS['cache'] = cache
+    _CONVERSION_TABLES.clear()
+    _GUESS_PSC1_CACHE.clear()
+    for mapping in (PSC2_FROM_PSC1, PSC1_FROM_PSC2,
+                    PSC1_FROM_DAWBA, PSC2_FROM_DAWBA,
+                    DOB_FROM_PSC1, DOB_FROM_PSC2):
+        mapping._reset()  # pylint: disable=W0212
+
+
+class _LazyMapping(Mapping):
+    """Read-only dictionnary built on first access.
+
+    Attributes
+    ----------
+    initialize : callable
+        Function that returns the actual dictionnary.
+
+    """
+
+    def __init__(self, initialize):
+        self._initialize = initialize
+        self._mapping = None
+
+    def _reset(self):
+        self._mapping = None
+
+    @property
+    def _data(self):
+        if self._mapping is None:
+            self._mapping = self._initialize()
+        return self._mapping
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        if self._mapping is None:
+            return '<{0} (not yet initialized)>'.format(self.__class__.__name__)
+        return repr(self._mapping)
+
+
+PSC2_FROM_PSC1 = _LazyMapping(lambda: _conversion_tables().psc2_from_psc1)
+PSC1_FROM_DAWBA = _LazyMapping(lambda: _conversion_tables().psc1_from_dawba)
+PSC2_FROM_DAWBA = _LazyMapping(lambda: _conversion_tables().psc2_from_dawba)  # obsolete
+PSC1_FROM_PSC2 = _LazyMapping(lambda: _conversion_tables().psc1_from_psc2)
+DOB_FROM_PSC1 = _LazyMapping(lambda: _conversion_tables().dob_from_psc1)
+DOB_FROM_PSC2 = _LazyMapping(lambda: _conversion_tables().dob_from_psc2)  # obsolete
+
+
+def _vectorized_lookup(table, codes):
+    """Look up an array of codes in a sorted structured array.
+
+    Parameters
+    ----------
+    table : numpy.ndarray
+        Structured array with sorted 'key' and 'value' fields.
+    codes : array_like
+        Codes to look up.
+
+    Returns
+    -------
+    tuple
+        Pair of arrays: values and boolean mask of codes found in table.
+
+    """
+    import numpy as np
+    codes = np.asarray(codes, dtype=str)
+    keys = np.char.encode(codes, 'ascii', 'replace').astype('S{0}'.format(_KEY_SIZE))
+    valid = np.char.str_len(codes) <= _KEY_SIZE
+    if len(table) == 0:
+        return (np.zeros(codes.shape, dtype=table.dtype['value']),
+                np.zeros(codes.shape, dtype=bool))
+    index = np.searchsorted(table['key'], keys)
+    index = np.minimum(index, len(table) - 1)
+    found = valid & (table['key'][index] == keys)
+    return table['value'][index], found
+
+
+def convert_psc1_to_psc2(psc1):
+    """Convert PSC1 codes to PSC2 in a single vectorized pass.
+
+    Parameters
+    ----------
+    psc1 : array_like
+        PSC1 codes.
+
+    Returns
+    -------
+    numpy.ma.MaskedArray
+        PSC2 codes. Unknown PSC1 codes are masked.
+
+    """
+    import numpy as np
+    table = _conversion_tables().psc2_from_psc1._array(  # pylint: disable=W0212
+        [('key', 'S12'), ('value', 'S12')])
+    psc2, found = _vectorized_lookup(table, psc1)
+    return np.ma.masked_array(np.char.decode(psc2, 'ascii'), mask=~found)
+
+
+#
+# offset between Python date ordinals and NumPy datetime64 days
+#
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def age_in_days(psc1, dates):
+    """Compute age at given dates in a single vectorized pass.
+
+    Parameters
+    ----------
+    psc1 : array_like
+        PSC1 codes.
+    dates : array_like
+        Dates of events, either as datetime64, datetime.date or strings
+        starting with an ISO 8601 date such as '2015-02-01 12:34:56'.
+
+    Returns
+    -------
+    numpy.ma.MaskedArray
+        Age in days. Ages are masked for unknown PSC1 codes, PSC1 codes
+        without date of birth, and missing dates.
+
+    """
+    import numpy as np
+    table = _conversion_tables().dob_from_psc1._array(  # pylint: disable=W0212
+        [('key', 'S12'), ('value', '<i4')])
+    dob, found = _vectorized_lookup(table, psc1)
+    dates = np.asarray(dates)
+    if dates.dtype.kind in 'US':
+        dates = dates.astype('U10')
+    dates = dates.astype('datetime64[D]')
+    days = dates.astype('int64') - (dob.astype('int64') - _EPOCH_ORDINAL)
+    return np.ma.masked_array(days, mask=~found | np.isnat(dates))
+
+
+def _typed_column(values):
+    """Convert a column of strings read from a file to the narrowest type.
+
+    Parameters
+    ----------
+    values : sequence
+        Strings read from a file.
+
+    Returns
+    -------
+    numpy.ndarray
+        Integers if all values are integers, floating-point numbers if all
+        values are numbers or empty (NaN), else strings.
+
+    """
+    import numpy as np
+    try:
+        return np.array([int(x) for x in values], dtype=np.int64)
+    except ValueError:
+        pass
+    try:
+        return np.array([float(x) if x else np.nan for x in values],
+                        dtype=np.float64)
+    except ValueError:
+        return np.array(values, dtype=str)
 
 
 #
@@ -226,7 +755,8 @@ def detect_psc2(string):
         return None
 
 
-def guess_psc1(subject_id, center):
+def _strip_subject_id(subject_id):
+    """Remove time point prefixes and suffixes from a subject identifier."""
     subject_id = subject_id.split('_')[0]
     if subject_id.upper().startswith('FU2'):
         subject_id = subject_id[3:]
@@ -236,6 +766,11 @@ def guess_psc1(subject_id, center):
         subject_id = subject_id[:-3]
     elif subject_id.upper().endswith('FU'):
         subject_id = subject_id[:-2]
+    return subject_id
+
+
+def _pad_subject_id(subject_id, center):
+    """Pad a truncated subject identifier to 12 characters."""
     # this is very empirical and based on cases seen so far!
     if len(subject_id) < 10:
         subject_id = '0' + str(center) + subject_id.rjust(10, '0')
@@ -245,13 +780,263 @@ def guess_psc1(subject_id, center):
         subject_id = '0' + str(center) + subject_id
     elif len(subject_id) < 12:
         subject_id = subject_id[0:2] + '0' + subject_id[2:]
-    # check this is an existing PSC1 code
-    if subject_id in PSC2_FROM_PSC1:
-        return subject_id
-    return None
+    return subject_id
+
+
+#
+# the same messy subject identifiers are found again and again in
+# Cantab, scanning and behavioral files
+#
+_GUESS_PSC1_CACHE = OrderedDict()
+_GUESS_PSC1_CACHE_SIZE = 4096
+
+
+def guess_psc1(subject_id, center):
+    """Guess the PSC1 code from a messy subject identifier.
+
+    Results are kept in a bounded least recently used cache.
+
+    Parameters
+    ----------
+    subject_id : str
+        Subject identifier, possibly truncated or with a time point suffix.
+    center : int
+        Acquisition center, used to complete truncated identifiers.
+
+    Returns
+    -------
+    str
+        Existing PSC1 code or None.
+
+    """
+    key = (subject_id, center)
+    if key in _GUESS_PSC1_CACHE:
+        psc1 = _GUESS_PSC1_CACHE.pop(key)
+    else:
+        psc1 = _pad_subject_id(_strip_subject_id(subject_id), center)
+        # check this is an existing PSC1 code
+        if psc1 not in PSC2_FROM_PSC1:
+            psc1 = None
+        if len(_GUESS_PSC1_CACHE) >= _GUESS_PSC1_CACHE_SIZE:
+            _GUESS_PSC1_CACHE.popitem(last=False)
+    _GUESS_PSC1_CACHE[key] = psc1
+    return psc1
+
+
+def _psc1_variants():
+    """Index all truncated forms of existing PSC1 codes that guess_psc1 resolves.
+
+    Returns
+    -------
+    dict
+        Map a pair (subject_id, center) to PSC1 codes. The center is None
+        for those forms that do not depend on the center.
+
+    """
+    if 'variants' not in _CONVERSION_TABLES:
+        variants = {}
+        for psc1 in PSC2_FROM_PSC1:
+            if len(psc1) < 12:
+                continue
+            variants[(psc1, None)] = psc1
+            if len(psc1) > 12:
+                continue
+            # 11 characters: missing 0 after the center
+            if psc1[2] == '0':
+                variants[(psc1[:2] + psc1[3:], None)] = psc1
+            # 10 characters or less: missing center and leading zeros
+            center = psc1[1]
+            digits = psc1[2:]
+            for n in range(len(digits.lstrip('0')), len(digits) + 1):
+                variants[(digits[len(digits) - n:], center)] = psc1
+        _CONVERSION_TABLES['variants'] = variants
+    return _CONVERSION_TABLES['variants']
+
+
+def guess_psc1_many(subject_ids, center):
+    """Guess PSC1 codes from many messy subject identifiers at once.
+
+    Subject identifiers are resolved in constant time using an index of
+    all truncated forms of existing PSC1 codes, built on first use.
+
+    Parameters
+    ----------
+    subject_ids : iterable
+        Subject identifiers, possibly truncated or with a time point suffix.
+    center : int
+        Acquisition center, used to complete truncated identifiers.
+
+    Returns
+    -------
+    list
+        Existing PSC1 code or None for each subject identifier.
+
+    """
+    variants = _psc1_variants()
+    center = str(center)
+    psc1_list = []
+    for subject_id in subject_ids:
+        subject_id = _strip_subject_id(subject_id)
+        psc1 = variants.get((subject_id, None))
+        if psc1 is None:
+            psc1 = variants.get((subject_id, center))
+        psc1_list.append(psc1)
+    return psc1_list
+
+
+#
+# kinds of codes reported by find_codes
+#
+_CODE_KINDS = (
+    ('PSC1', lambda: PSC2_FROM_PSC1),
+    ('PSC2', lambda: PSC1_FROM_PSC2),
+    ('DAWBA', lambda: PSC1_FROM_DAWBA),
+)
+
 
+def _code_index():
+    """Index all known codes once for find_codes.
 
-class Error:
+    Returns
+    -------
+    tuple
+        Pair of a compiled regex that matches sequences of digits as long
+        as known codes, and a dictionnary that maps ASCII encoded codes to
+        their kind.
+
+    """
+    if 'index' not in _CONVERSION_TABLES:
+        kind_from_code = {}
+        for kind, mapping in reversed(_CODE_KINDS):  # PSC1 takes precedence
+            for code in mapping():
+                kind_from_code[code.encode('ascii')] = kind
+        lengths = set(len(code) for code in kind_from_code) or {_KEY_SIZE}
+        regex = re.compile(b'(?<![0-9])[0-9]{%d,%d}(?![0-9])' %
+                           (min(lengths), max(lengths)))
+        _CONVERSION_TABLES['index'] = (regex, kind_from_code)
+    return _CONVERSION_TABLES['index']
+
+
+def find_codes(buffer):
+    """Find all known PSC1, PSC2 and DAWBA codes in a buffer in a single pass.
+
+    Codes are sequences of digits, delimited by non-digit characters.
+
+    Parameters
+    ----------
+    buffer : bytes
+        Bytes or any object supporting the buffer protocol, such as mmap.
+
+    Yields
+    ------
+    tuple
+        Triplet (offset, code, kind) where kind is 'PSC1', 'PSC2' or 'DAWBA'.
+
+    """
+    regex, kind_from_code = _code_index()
+    for match in regex.finditer(buffer):
+        code = match.group()
+        kind = kind_from_code.get(code)
+        if kind:
+            yield match.start(), code.decode('ascii'), kind
+
+
+def find_codes_in_file(path):
+    """Find all known PSC1, PSC2 and DAWBA codes in a file in a single pass.
+
+    The file is mapped into memory instead of being read line by line.
+
+    Parameters
+    ----------
+    path : unicode
+        File to scan.
+
+    Yields
+    ------
+    tuple
+        Triplet (offset, code, kind) where kind is 'PSC1', 'PSC2' or 'DAWBA'.
+
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for result in find_codes(buffer):
+                yield result
+        finally:
+            buffer.close()
+
+
+def _bounded_map(executor, fn, iterable, max_in_flight, ordered=False):
+    """Apply a function to arguments in a pool, with few tasks in flight.
+
+    Arguments are consumed from the iterable only as tasks complete, so
+    that at most max_in_flight tasks are submitted but not yet generated.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor
+        Pool of threads or processes to submit tasks to.
+    fn : callable
+        Function to apply.
+    iterable : iterable
+        Tuples of arguments to apply the function to. Items that are
+        already instances of Future, such as results found in a cache,
+        are not submitted but generated as they are.
+    max_in_flight : int
+        Maximal number of tasks submitted but not yet generated.
+    ordered : bool
+        Generate results in the order of the arguments if True, else as
+        soon as they are available.
+
+    Yields
+    ------
+    object
+        Results of the function.
+
+    """
+    def collect(pending):
+        if ordered:
+            done = [pending.popleft()]
+        else:
+            done, dummy_not_done = wait(pending, return_when=FIRST_COMPLETED)
+            pending.difference_update(done)
+        for future in done:
+            yield future.result()
+
+    if ordered:
+        pending = deque()
+        submit = pending.append
+    else:
+        pending = set()
+        submit = pending.add
+    for args in iterable:
+        while len(pending) >= max_in_flight:
+            for result in collect(pending):
+                yield result
+        if isinstance(args, Future):
+            submit(args)
+        else:
+            submit(executor.submit(fn, *args))
+    while pending:
+        for result in collect(pending):
+            yield result
+
+
+try:
+    from sys import intern
+except ImportError:
+    pass  # Python 2 builtin
+
+
+def _intern(s):
+    if type(s) is str:
+        return intern(s)
+    return s
+
+
+class Error(object):
     """Error while parsing files.
 
     Returned by functions that parse Cantab and behavioral files.
@@ -264,14 +1049,19 @@ class Error:
         Message explaining the error.
     sample : str
         Part of the file that generated the error.
+    category : str
+        Optional category, used to limit the number of similar errors.
 
     """
+    __slots__ = ('path', 'message', 'sample', 'category')
+
     _SAMPLE_LEN = 30
 
-    def __init__(self, path, message, sample=None):
-        self.path = path
-        self.message = message
+    def __init__(self, path, message, sample=None, category=None):
+        self.path = _intern(path)
+        self.message = _intern(message)
         self.sample = sample
+        self.category = category
 
     def __str__(self):
         if self.path:
@@ -284,3 +1074,119 @@ class Error:
                 return '{0}: {1}'.format(self.message, self.path)
         else:
             return '{0}'.format(self.message)
+
+
+def _common_directory(path, other):
+    """Return the longest directory that contains both paths.
+
+    Paths may be file system paths or names of ZIP file members.
+
+    """
+    if path == other:
+        return path
+    prefix = os.path.commonprefix([path, other])
+    return prefix[:max(prefix.rfind('/'), prefix.rfind(os.sep)) + 1]
+
+
+class ErrorCollector(object):
+    """Accumulate errors, keeping only a limited number per file and category.
+
+    Errors beyond the limits are counted but not kept. Iterating over the
+    collector yields the errors kept, followed by errors that summarize
+    the number of errors left out for each file, and for each category.
+    Errors of a category left out are summarized by a single error, whose
+    path is the path shared by all these errors or their common directory.
+
+    Attributes
+    ----------
+    max_per_path : int
+        Maximal number of errors kept per file, or None.
+    max_per_category : int
+        Maximal number of errors kept per category within each file, or None.
+    max_total_per_category : int
+        Maximal number of errors kept per category across all files, or None.
+        Bounds errors of a category that are reported on many distinct paths.
+    count : int
+        Total number of errors, including those left out.
+    count_by_path : dict
+        Number of errors per file, including those left out.
+    count_by_category : dict
+        Number of errors per category, including those left out.
+
+    """
+
+    def __init__(self, max_per_path=100, max_per_category=10,
+                 max_total_per_category=100):
+        self.max_per_path = max_per_path
+        self.max_per_category = max_per_category
+        self.max_total_per_category = max_total_per_category
+        self.count = 0
+        self.count_by_path = Counter()
+        self.count_by_category = Counter()
+        self._errors = []
+        self._kept_by_path = Counter()
+        self._kept_by_path_category = Counter()
+        self._kept_by_category = Counter()
+        self._left_out_by_path = Counter()
+        self._left_out_by_category = Counter()
+        self._left_out_path = {}
+
+    def _leave_out_category(self, error):
+        category = error.category
+        self._left_out_by_category[category] += 1
+        path = self._left_out_path.get(category)
+        if path is None:
+            self._left_out_path[category] = error.path
+        else:
+            self._left_out_path[category] = _common_directory(path, error.path)
+
+    def append(self, error):
+        self.count += 1
+        self.count_by_path[error.path] += 1
+        category = error.category
+        if category is not None:
+            self.count_by_category[category] += 1
+            if ((self.max_per_category is not None and
+                    self._kept_by_path_category[error.path, category] >=
+                    self.max_per_category) or
+                    (self.max_total_per_category is not None and
+                     self._kept_by_category[category] >=
+                     self.max_total_per_category)):
+                self._leave_out_category(error)
+                return
+        if (self.max_per_path is not None and
+                self._kept_by_path[error.path] >= self.max_per_path):
+            self._left_out_by_path[error.path] += 1
+            return
+        if category is not None:
+            self._kept_by_path_category[error.path, category] += 1
+            self._kept_by_category[category] += 1
+        self._kept_by_path[error.path] += 1
+        self._errors.append(error)
+
+    def extend(self, errors):
+        for error in errors:
+            self.append(error)
+
+    def _summary(self):
+        for path, count in self._left_out_by_path.items():
+            yield Error(path, '{0} more errors not reported'.format(count))
+        for category, count in self._left_out_by_category.items():
+            yield Error(self._left_out_path[category],
+                        '{0} more "{1}" errors not reported'
+                        .format(count, category))
+
+    def __iter__(self):
+        for error in self._errors:
+            yield error
+        for error in self._summary():
+            yield error
+
+    def __len__(self):
+        return (len(self._errors) + len(self._left_out_by_path) +
+                len(self._left_out_by_category))
+
+    def __bool__(self):
+        return self.count > 0
+
+    __nonzero__ = __bool__  # Python 2
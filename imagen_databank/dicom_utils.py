@@ -28,8 +28,11 @@
 # The fact that you are presently reading this means that you have had
 # knowledge of the CeCILL license and that you accept its terms.
 
+import os
 import re
 import datetime
+import pickle
+import sqlite3
 import dateutil.tz
 import dicom
 from dicom.filereader import InvalidDicomError
@@ -37,7 +40,7 @@ from dicom.filereader import InvalidDicomError
 import logging
 logger = logging.getLogger(__name__)
 
-__all__ = ['read_metadata']
+__all__ = ['read_metadata', 'MetadataCache']
 
 
 #
@@ -172,7 +175,14 @@ def _time_from_tm(tm):
         return None
 
 
-def read_metadata(path, force=False):
+#
+# read_metadata needs only a few short header tags: stop reading at PixelData
+# and skip values larger than this size, unless they are accessed
+#
+_DEFER_SIZE = 1024
+
+
+def read_metadata(path, force=False, header_only=True):
     """Read select metadata from a DICOM file.
 
     We always attempt to read the following DICOM tags. An exception is raised
@@ -197,17 +207,30 @@ def read_metadata(path, force=False):
 
     Parameters
     ----------
-    path : str
-        Path name of the DICOM file.
+    path : str or file-like
+        Path name of the DICOM file, or file-like object to read from.
     force : bool
         If True read nonstandard files, typically without "Part 10" headers.
+    header_only : bool
+        If True stop reading before pixel data and defer reading large
+        values, else read the whole file.
 
     Returns
     -------
     dict
 
     """
-    dataset = dicom.read_file(path, force=force)
+    if header_only:
+        if hasattr(path, 'read'):
+            # deferred values are read again from the file name
+            defer_size = None
+        else:
+            defer_size = _DEFER_SIZE
+        dataset = dicom.read_file(path, force=force,
+                                  stop_before_pixels=True,
+                                  defer_size=defer_size)
+    else:
+        dataset = dicom.read_file(path, force=force)
 
     # missing compulsory tags will raise exceptions
     if 'SeriesDescription' in dataset:
@@ -267,3 +290,196 @@ def read_metadata(path, force=False):
         metadata['PatientID'] = dataset.PatientID
 
     return metadata
+
+
+#
+# exceptions raised by read_metadata for unreadable files, cached as well
+#
+# IOError is not cached: it may be a transient failure, for example on NFS,
+# and the file must be read again next time
+#
+_CACHED_EXCEPTIONS = (InvalidDicomError, AttributeError)
+
+_METADATA_CACHE_VERSION = 2
+_METADATA_CACHE_COMMIT = 1000
+
+
+def _file_key(path):
+    """Size, modification time and inode, to detect modified files."""
+    st = os.stat(path)
+    mtime_ns = getattr(st, 'st_mtime_ns', None)
+    if mtime_ns is None:  # Python 2
+        mtime_ns = int(st.st_mtime * 1000000000)
+    return st.st_size, mtime_ns, st.st_ino
+
+
+class MetadataCache(object):
+    """Persistent cache of metadata read from DICOM files.
+
+    Metadata read by read_metadata are stored in an SQLite database, along
+    with size, modification time and inode of each file. Files are read
+    again only if they are new or have been modified since. Invalid DICOM
+    files are cached as such, files that could not be read because of an
+    IOError are not.
+
+    The whole cache is invalidated when the version of pydicom changes.
+
+    Attributes
+    ----------
+    path : str
+        SQLite database.
+    hits : int
+        Number of files found in the cache.
+    misses : int
+        Number of files read from disk.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._uncommitted = 0
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS info ('
+                                 'key TEXT PRIMARY KEY, value TEXT)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS metadata ('
+                                 'path TEXT PRIMARY KEY, size INTEGER, '
+                                 'mtime_ns INTEGER, inode INTEGER, '
+                                 'force INTEGER, value BLOB)')
+        version = '{0}/{1}'.format(_METADATA_CACHE_VERSION,
+                                   getattr(dicom, '__version__', None))
+        row = self._connection.execute('SELECT value FROM info WHERE key = ?',
+                                       ('version',)).fetchone()
+        if row is None or row[0] != version:
+            logger.info('invalidate DICOM metadata cache: %s', path)
+            self._connection.execute('DELETE FROM metadata')
+            self._connection.execute('INSERT OR REPLACE INTO info VALUES (?, ?)',
+                                     ('version', version))
+        self._connection.commit()
+
+    def lookup(self, path, force=False):
+        """Find metadata of a file in the cache.
+
+        Parameters
+        ----------
+        path : str
+            Path name of the DICOM file.
+        force : bool
+            If True read nonstandard files, typically without "Part 10" headers.
+
+        Returns
+        -------
+        tuple
+            The pair (metadata, exception) read from the cache, where either
+            metadata or exception is None, or None if the file is not found
+            in the cache or has been modified since.
+
+        """
+        path = os.path.abspath(path)
+        row = self._connection.execute('SELECT size, mtime_ns, inode, force, value '
+                                       'FROM metadata WHERE path = ?',
+                                       (path,)).fetchone()
+        if row is not None:
+            try:
+                key = _file_key(path)
+            except OSError:
+                key = None
+            if key == tuple(row[:3]) and bool(row[3]) == bool(force):
+                self.hits += 1
+                return pickle.loads(bytes(row[4]))
+        self.misses += 1
+        return None
+
+    def store(self, path, force, metadata, exception=None):
+        """Store metadata of a file, or the exception raised while reading it.
+
+        Parameters
+        ----------
+        path : str
+            Path name of the DICOM file.
+        force : bool
+            If True read nonstandard files, typically without "Part 10" headers.
+        metadata : dict
+            Metadata returned by read_metadata, or None.
+        exception : Exception, optional
+            Exception raised by read_metadata, or None. Exceptions other
+            than those raised for invalid DICOM files, such as IOError,
+            are not stored.
+
+        """
+        if exception is not None and not isinstance(exception, _CACHED_EXCEPTIONS):
+            return
+        path = os.path.abspath(path)
+        try:
+            size, mtime_ns, inode = _file_key(path)
+        except OSError:
+            return
+        value = sqlite3.Binary(pickle.dumps((metadata, exception), 2))
+        self._connection.execute('INSERT OR REPLACE INTO metadata '
+                                 'VALUES (?, ?, ?, ?, ?, ?)',
+                                 (path, size, mtime_ns, inode, int(bool(force)), value))
+        self._uncommitted += 1
+        if self._uncommitted >= _METADATA_CACHE_COMMIT:
+            self.flush()
+
+    def read_metadata(self, path, force=False):
+        """Read select metadata from a DICOM file, unless found in the cache.
+
+        Same as read_metadata().
+
+        """
+        cached = self.lookup(path, force)
+        if cached is None:
+            try:
+                metadata = read_metadata(path, force=force)
+            except _CACHED_EXCEPTIONS as e:
+                self.store(path, force, None, e)
+                raise
+            self.store(path, force, metadata)
+            return metadata
+        metadata, exception = cached
+        if exception is not None:
+            raise exception
+        return metadata
+
+    def invalidate(self, path=None):
+        """Remove a file, or all files if path is None, from the cache."""
+        if path is None:
+            self._connection.execute('DELETE FROM metadata')
+        else:
+            self._connection.execute('DELETE FROM metadata WHERE path = ?',
+                                     (os.path.abspath(path),))
+        self._connection.commit()
+
+    def prune(self):
+        """Remove files that do not exist any more from the cache."""
+        paths = [row[0] for row in
+                 self._connection.execute('SELECT path FROM metadata')]
+        for path in paths:
+            if not os.path.exists(path):
+                self._connection.execute('DELETE FROM metadata WHERE path = ?',
+                                         (path,))
+        self._connection.commit()
+
+    def report(self):
+        """Log and return the hit rate of the cache since it was opened."""
+        total = self.hits + self.misses
+        hit_rate = float(self.hits) / total if total else 0.0
+        logger.info('DICOM metadata cache: %d hits, %d misses (%.1f%% hit rate): %s',
+                    self.hits, self.misses, 100 * hit_rate, self.path)
+        return hit_rate
+
+    def flush(self):
+        self._connection.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc, value, tb):
+        self.close()
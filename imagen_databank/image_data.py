@@ -32,10 +32,15 @@ import os
 import re
 import time
 import datetime
+import threading
+from collections import OrderedDict
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor,
+                                Future)
 
 from .core import (LONDON, NOTTINGHAM, DUBLIN, BERLIN,
                    HAMBURG, MANNHEIM, PARIS, DRESDEN,
                    SOUTHAMPTON, AACHEN)
+from .core import _bounded_map
 from .dicom_utils import read_metadata
 from .dicom_utils import InvalidDicomError
 
@@ -50,8 +55,9 @@ __all__ = ['SEQUENCE_LOCALIZER_CALIBRATION', 'SEQUENCE_T2',
            'SEQUENCE_NODDI',
            'SEQUENCE_NAME',
            'NONSTANDARD_DICOM',
-           'series_type_from_description',
-           'walk_image_data', 'report_image_data']
+           'series_type_from_description', 'series_types_from_descriptions',
+           'walk_image_data', 'walk_image_data_parallel',
+           'SeriesAccumulator', 'report_image_data']
 
 
 #
@@ -185,6 +191,13 @@ _IGNORED_SOP_CLASS_UIDS = {
 }
 
 
+#
+# the same few series descriptions are found in every dataset
+#
+_SERIES_TYPE_CACHE = {}
+_SERIES_TYPE_CACHE_SIZE = 10000
+
+
 def series_type_from_description(series_description):
     """Match series description to those listed in Imagen FU2 SOPs.
 
@@ -202,13 +215,113 @@ def series_type_from_description(series_description):
         in the SOPs, return this series type, else return None.
 
     """
-    for regex, series_type in _LOOSE_IMAGE_DATA_REGEXES:
+    try:
+        return _SERIES_TYPE_CACHE[series_description]
+    except KeyError:
+        pass
+    series_type = None
+    for regex, loose_series_type in _LOOSE_IMAGE_DATA_REGEXES:
         if regex.search(series_description):
-            return series_type
-    return None
+            series_type = loose_series_type
+            break
+    if len(_SERIES_TYPE_CACHE) >= _SERIES_TYPE_CACHE_SIZE:
+        _SERIES_TYPE_CACHE.clear()
+    _SERIES_TYPE_CACHE[series_description] = series_type
+    return series_type
+
+
+def series_types_from_descriptions(series_descriptions):
+    """Match many series descriptions to those listed in Imagen FU2 SOPs.
+
+    Parameters
+    ----------
+    series_descriptions : iterable
+        The series descriptions to match.
+
+    Returns
+    -------
+    list
+        For each series description, the series type it loosely matches
+        or None, as returned by series_type_from_description.
+
+    """
+    return [series_type_from_description(x) for x in series_descriptions]
+
 
+def _walk_files(path):
+    """Generate DICOM files to read in a directory.
 
-def walk_image_data(path, force=False):
+    Parameters
+    ----------
+    path : unicode
+        Directory to read DICOM files from.
+
+    Yields
+    ------
+    tuple
+        Yields a pair (abspath, relpath).
+
+    """
+    for root, dummy_dirs, files in os.walk(path):
+        for filename in files:
+            # skip DICOMDIR since we are going to read all DICOM files anyway
+            # beware, Nottigham had sent a DICOMDIR2 file!
+            if filename.startswith('DICOMDIR'):
+                continue
+            abspath = os.path.join(root, filename)
+            relpath = os.path.normpath(os.path.relpath(abspath, path))
+            yield abspath, relpath
+
+
+def _read_file(abspath, relpath, force):
+    """Read metadata from a DICOM file, possibly in a worker thread or process.
+
+    Exceptions are returned instead of being raised, to be logged by the caller.
+
+    Returns
+    -------
+    tuple
+        The tuple (metadata, abspath, relpath, error, elapsed, worker)
+        where either metadata or error is None.
+
+    """
+    start = time.time()
+    metadata = None
+    error = None
+    try:
+        metadata = read_metadata(abspath, force=force)
+    except (IOError, InvalidDicomError, AttributeError) as e:
+        error = e
+    worker = '{0}:{1}'.format(os.getpid(), threading.current_thread().name)
+    return metadata, abspath, relpath, error, time.time() - start, worker
+
+
+def _cached_file(abspath, relpath, force, cache):
+    """Find metadata of a DICOM file in a cache.
+
+    Returns
+    -------
+    tuple
+        Same as _read_file, or None if the file is not found in the cache.
+
+    """
+    cached = cache.lookup(abspath, force)
+    if cached is None:
+        return None
+    metadata, error = cached
+    return metadata, abspath, relpath, error, 0.0, None
+
+
+def _log_error(error, relpath):
+    if isinstance(error, IOError):
+        logger.error('cannot read file (%s): %s', str(error), relpath)
+    elif isinstance(error, InvalidDicomError):
+        logger.error('cannot read nonstandard DICOM file: %s: %s', str(error), relpath)
+    else:
+        logger.error('missing attribute: %s: %s', str(error), relpath)
+
+
+def walk_image_data(path, force=False, cache=None):
     """Generate information on DICOM files in a directory.
 
     File that cannot be read are skipped and an error message is logged.
@@ -219,6 +332,9 @@ def walk_image_data(path, force=False):
         Directory to read DICOM files from.
     force : bool
         Try reading nonstandard DICOM files, typically without "PART 10" headers.
+    cache : MetadataCache, optional
+        Read only new or modified files, get metadata of other files from
+        this cache.
 
     Yields
     ------
@@ -232,32 +348,349 @@ def walk_image_data(path, force=False):
 
     logger.info('start processing files under: %s', path)
 
-    for root, dummy_dirs, files in os.walk(path):
-        n += len(files)
-        for filename in files:
-            abspath = os.path.join(root, filename)
-            relpath = os.path.normpath(os.path.relpath(abspath, path))
-            # skip DICOMDIR since we are going to read all DICOM files anyway
-            # beware, Nottigham had sent a DICOMDIR2 file!
-            if filename.startswith('DICOMDIR'):
-                continue
+    for abspath, relpath in _walk_files(path):
+        n += 1
+        result = None
+        if cache:
+            result = _cached_file(abspath, relpath, force, cache)
+        if result is None:
             logger.debug('read file: %s', relpath)
-            try:
-                metadata = read_metadata(abspath, force=force)
-            except IOError as e:
-                logger.error('cannot read file (%s): %s', str(e), relpath)
-            except InvalidDicomError as e:
-                logger.error('cannot read nonstandard DICOM file: %s: %s', str(e), relpath)
-            except AttributeError as e:
-                logger.error('missing attribute: %s: %s', str(e), relpath)
+            result = _read_file(abspath, relpath, force)
+            if cache:
+                cache.store(abspath, force, result[0], result[3])
+        metadata, dummy_a, relpath, error, dummy_e, dummy_w = result
+        if error:
+            _log_error(error, relpath)
+        else:
+            yield (metadata, relpath)
+
+    if cache:
+        cache.flush()
+        cache.report()
+    elapsed = time.time() - start
+    logger.info('processed %d files in %.2f s: %s', n, elapsed, path)
+
+
+def walk_image_data_parallel(path, force=False, workers=4, processes=False,
+                             max_in_flight=None, ordered=True, cache=None):
+    """Generate information on DICOM files in a directory, reading files in parallel.
+
+    File that cannot be read are skipped and an error message is logged.
+    Time spent by each worker is logged once all files have been read.
+
+    Parameters
+    ----------
+    path : unicode
+        Directory to read DICOM files from.
+    force : bool
+        Try reading nonstandard DICOM files, typically without "PART 10" headers.
+    workers : int
+        Number of worker threads or processes.
+    processes : bool
+        Use a pool of processes if True, else a pool of threads.
+    max_in_flight : int, optional
+        Maximal number of files submitted to workers but not yet yielded,
+        by default 4 times the number of workers.
+    ordered : bool
+        Yield files in the order they are found if True, else as soon as
+        they have been read.
+    cache : MetadataCache, optional
+        Read only new or modified files, get metadata of other files from
+        this cache. The cache is accessed from the calling thread only.
+
+    Yields
+    ------
+    tuple
+        Yields a pair (metadata, relpath) where metadata is a dictionary
+        of extracted DICOM metadata.
+
+    """
+    n = 0
+    start = time.time()
+    timing = {}
+    if max_in_flight is None:
+        max_in_flight = 4 * workers
+
+    def tasks():
+        for abspath, relpath in _walk_files(path):
+            result = None
+            if cache:
+                result = _cached_file(abspath, relpath, force, cache)
+            if result is None:
+                logger.debug('read file: %s', relpath)
+                yield abspath, relpath, force
+            else:
+                future = Future()
+                future.set_result(result)
+                yield future
+
+    logger.info('start processing files with %d workers under: %s',
+                workers, path)
+
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    with executor:
+        for result in _bounded_map(executor, _read_file, tasks(),
+                                   max_in_flight, ordered):
+            n += 1
+            metadata, abspath, relpath, error, elapsed, worker = result
+            if worker is not None:  # not found in cache
+                files, seconds = timing.get(worker, (0, 0.0))
+                timing[worker] = (files + 1, seconds + elapsed)
+                if cache:
+                    cache.store(abspath, force, metadata, error)
+            if error:
+                _log_error(error, relpath)
             else:
                 yield (metadata, relpath)
 
+    if cache:
+        cache.flush()
+        cache.report()
     elapsed = time.time() - start
+    for worker, (files, seconds) in sorted(timing.items()):
+        logger.info('worker %s read %d files in %.2f s', worker, files, seconds)
     logger.info('processed %d files in %.2f s: %s', n, elapsed, path)
 
 
-def report_image_data(path, force=False):
+def _psc1_from_image_data(image_data):
+    # FIXME: this is obviously wrong! # find PSC1 code
+    if 'CommentsOnThePerformedProcedureStep' in image_data:  # DUBLIN
+        return image_data['CommentsOnThePerformedProcedureStep']
+    elif 'ImageComments' in image_data:  # HAMBURG, DRESDEN
+        return image_data['ImageComments']
+    elif 'PatientID' in image_data:  # LONDON, NOTTINGHAM, BERLIN, MANNHEIM, PARIS
+        return image_data['PatientID']
+    elif 'PatientName' in image_data:  # LONDON, NOTTINGHAM, BERLIN, MANNHEIM, PARIS
+        return image_data['PatientName']
+    return None
+
+
+def _timestamp_from_image_data(image_data, relpath):
+    if 'AcquisitionDate' in image_data:
+        acquisition_date = image_data['AcquisitionDate']
+        if 'AcquisitionTime' in image_data:
+            acquisition_time = image_data['AcquisitionTime']
+            return datetime.datetime.combine(acquisition_date,
+                                             acquisition_time)
+        else:
+            return datetime.datetime(acquisition_date.year,
+                                     acquisition_date.month,
+                                     acquisition_date.day)
+    else:
+        logger.error('missing acquisition time: %s', relpath)
+        return None
+
+
+#
+# series attributes that must be consistent across images of a series:
+# * key in series data, also used as attribute of _Series
+# * description in error messages
+# * True if the attribute is compulsory, else it is set by the first image
+#   where it is present
+#
+_SERIES_ATTRIBUTES = (
+    ('SeriesNumber', 'series number', True),
+    ('SeriesDescription', 'series description', True),
+    ('StationName', 'station name', False),
+    ('Manufacturer', 'manufacturer', False),
+    ('ManufacturerModelName', 'manufacturer model name', False),
+    ('SoftwareVersions', 'software versions', False),
+    ('DeviceSerialNumber', 'device serial number', False),
+    ('PSC1', 'PSC1 code', False),
+)
+
+
+class _Series(object):
+    """Data aggregated from the images of a series."""
+    __slots__ = (tuple(key for key, dummy_d, dummy_c in _SERIES_ATTRIBUTES) +
+                 ('image_types', 'min_timestamp', 'max_timestamp',
+                  'images', 'first_relpath', 'last'))
+
+    def __init__(self, values, relpath):
+        for (key, dummy_d, dummy_c), value in zip(_SERIES_ATTRIBUTES, values):
+            setattr(self, key, value)
+        self.image_types = set()
+        self.min_timestamp = None
+        self.max_timestamp = None
+        self.images = {}
+        self.first_relpath = relpath
+        self.last = 0
+
+    def update(self, values, relpath):
+        for (key, description, compulsory), value in zip(_SERIES_ATTRIBUTES, values):
+            if not compulsory and not value:
+                continue
+            current = getattr(self, key)
+            if not compulsory and not current:
+                setattr(self, key, value)
+            elif value != current:
+                logger.error('inconsistent %s "%s" / "%s":\n  %s\n  %s',
+                             description, current, value,
+                             self.first_relpath, relpath)
+
+    def series_data(self):
+        series_data = {
+            'SeriesNumber': self.SeriesNumber,  # pylint: disable=no-member
+            'SeriesDescription': self.SeriesDescription,  # pylint: disable=no-member
+            'ImageType': self.image_types,
+            'MinAcquisitionDateTime': self.min_timestamp,
+            'MaxAcquisitionDateTime': self.max_timestamp,
+        }
+        for key, dummy_d, compulsory in _SERIES_ATTRIBUTES:
+            if not compulsory:
+                value = getattr(self, key)
+                if value:
+                    series_data[key] = value
+        return series_data
+
+
+class SeriesAccumulator(object):
+    """Aggregate DICOM images into series, one image at a time.
+
+    Images are added as they are read. Series can be retrieved all at once
+    when all images have been added, or as a stream of series that have
+    not been updated for a while.
+
+    Attributes
+    ----------
+    count : int
+        Number of images added so far.
+
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._series = OrderedDict()  # least recently updated first
+
+    def add(self, image_data, relpath):
+        """Add an image to its series.
+
+        Parameters
+        ----------
+        image_data : dict
+            DICOM metadata of the image, as returned by read_metadata.
+        relpath : str
+            Path of the image.
+
+        """
+        if str(image_data['SOPClassUID']) in _IGNORED_SOP_CLASS_UIDS:
+            return
+        self.count += 1
+        # extract DICOM tags of interest, throw exceptions if missing tags!
+        series_uid = image_data['SeriesInstanceUID']
+        image_uid = image_data['SOPInstanceUID']
+        values = (
+            image_data['SeriesNumber'],
+            image_data['SeriesDescription'],
+            image_data.get('StationName', None),
+            image_data.get('Manufacturer', None),
+            image_data.get('ManufacturerModelName', None),
+            image_data.get('SoftwareVersions', None),
+            image_data.get('DeviceSerialNumber', None),
+            _psc1_from_image_data(image_data),
+        )
+        timestamp = _timestamp_from_image_data(image_data, relpath)
+
+        series = self._series.pop(series_uid, None)
+        if series is None:
+            series = _Series(values, relpath)
+        else:
+            # check consistency within series
+            series.update(values, relpath)
+        self._series[series_uid] = series
+        series.last = self.count
+
+        series.image_types.update(image_data.get('ImageType', []))
+        # populate series with relative path to DICOM files
+        if image_uid not in series.images:
+            series.images[image_uid] = relpath
+        else:
+            logger.error('duplicate image in series (%s):'
+                         '\n  %s\n  %s',
+                         series.SeriesDescription,  # pylint: disable=no-member
+                         series.images[image_uid],
+                         relpath)
+        # update acquisition date/time range by series
+        if timestamp is not None:
+            if series.min_timestamp is None or timestamp < series.min_timestamp:
+                series.min_timestamp = timestamp
+            if series.max_timestamp is None or timestamp > series.max_timestamp:
+                series.max_timestamp = timestamp
+
+    def completed(self, idle):
+        """Remove and return series that have not been updated recently.
+
+        Parameters
+        ----------
+        idle : int
+            Series to which none of the last idle images belongs are
+            considered complete.
+
+        Yields
+        ------
+        tuple
+            Triplet (series_uid, series_data, images).
+
+        """
+        while self._series:
+            series_uid, series = next(iter(self._series.items()))
+            if self.count - series.last < idle:
+                break
+            del self._series[series_uid]
+            yield series_uid, series.series_data(), series.images
+
+    def finish(self):
+        """Remove and return all remaining series.
+
+        Yields
+        ------
+        tuple
+            Triplet (series_uid, series_data, images).
+
+        """
+        return self.completed(0)
+
+    def result(self):
+        """Return series aggregated so far.
+
+        Returns
+        -------
+        dict
+            The key identifies a series while the value is a pair
+            (series_data, images).
+
+        """
+        return {series_uid: (series.series_data(), series.images)
+                for series_uid, series in self._series.items()}
+
+    def columns(self):
+        """Return series aggregated so far as columns.
+
+        Returns
+        -------
+        dict
+            The key is the name of a series attribute, 'SeriesInstanceUID',
+            'MinAcquisitionDateTime', 'MaxAcquisitionDateTime' or 'Images'
+            for the number of images, while the value is a tuple with one
+            entry per series.
+
+        """
+        series_list = list(self._series.values())
+        columns = {
+            'SeriesInstanceUID': tuple(self._series.keys()),
+            'MinAcquisitionDateTime': tuple(s.min_timestamp for s in series_list),
+            'MaxAcquisitionDateTime': tuple(s.max_timestamp for s in series_list),
+            'Images': tuple(len(s.images) for s in series_list),
+        }
+        for key, dummy_d, dummy_c in _SERIES_ATTRIBUTES:
+            columns[key] = tuple(getattr(s, key) for s in series_list)
+        return columns
+
+
+def report_image_data(path, force=False, workers=None, cache=None):
     """Find DICOM files loosely organized according to the Imagen FU2 SOPs.
 
     The Imagen FU2 SOPs define a precise file organization for Image Data. In
@@ -274,6 +707,11 @@ def report_image_data(path, force=False):
         Directory to read DICOM files from.
     force : bool
         Try reading nonstandard DICOM files, typically without "PART 10" headers.
+    workers : int, optional
+        Read DICOM files in parallel using this number of worker threads.
+    cache : MetadataCache, optional
+        Read only new or modified files, get metadata of other files from
+        this cache.
 
     Returns
     -------
@@ -282,165 +720,14 @@ def report_image_data(path, force=False):
         (series_data, images).
 
     """
-    series_dict = {}
+    if workers:
+        image_data_list = walk_image_data_parallel(path, force=force,
+                                                   workers=workers, cache=cache)
+    else:
+        image_data_list = walk_image_data(path, force=force, cache=cache)
 
-    for (image_data, relpath) in walk_image_data(path, force=force):
-        if str(image_data['SOPClassUID']) in _IGNORED_SOP_CLASS_UIDS:
-            continue
-        # extract DICOM tags of interest, throw exceptions if missing tags!
-        series_uid = image_data['SeriesInstanceUID']
-        image_uid = image_data['SOPInstanceUID']
-        series_number = image_data['SeriesNumber']
-        series_description = image_data['SeriesDescription']
-        image_types = image_data.get('ImageType', [])
-        station_name = image_data.get('StationName', None)
-        manufacturer = image_data.get('Manufacturer', None)
-        manufacturer_model_name = image_data.get('ManufacturerModelName', None)
-        software_versions = image_data.get('SoftwareVersions', None)
-        device_serial_number = image_data.get('DeviceSerialNumber', None)
-        if 'AcquisitionDate' in image_data:
-            acquisition_date = image_data['AcquisitionDate']
-            if 'AcquisitionTime' in image_data:
-                acquisition_time = image_data['AcquisitionTime']
-                timestamp = datetime.datetime.combine(acquisition_date,
-                                                      acquisition_time)
-            else:
-                timestamp = datetime.datetime(acquisition_date.year,
-                                              acquisition_date.month,
-                                              acquisition_date.day)
-        else:
-            logger.error('missing acquisition time: %s', relpath)
-        # FIXME: this is obviously wrong! # find PSC1 code
-        if 'CommentsOnThePerformedProcedureStep' in image_data:  # DUBLIN
-            psc1 = image_data['CommentsOnThePerformedProcedureStep']
-        elif 'ImageComments' in image_data:  # HAMBURG, DRESDEN
-            psc1 = image_data['ImageComments']
-        elif 'PatientID' in image_data:  # LONDON, NOTTINGHAM, BERLIN, MANNHEIM, PARIS
-            psc1 = image_data['PatientID']
-        elif 'PatientName' in image_data:  # LONDON, NOTTINGHAM, BERLIN, MANNHEIM, PARIS
-            psc1 = image_data['PatientName']
-        else:
-            psc1 = None
-        # build the dictionnary of series using 'SeriesInstanceUID' as a key
-        if series_uid not in series_dict:
-            series_data = {
-                'SeriesNumber': series_number,
-                'SeriesDescription': series_description,
-                'ImageType': set(image_types),
-                'MinAcquisitionDateTime': timestamp,
-                'MaxAcquisitionDateTime': timestamp,
-            }
-            if station_name:
-                series_data['StationName'] = station_name
-            if manufacturer:
-                series_data['Manufacturer'] = manufacturer
-            if manufacturer_model_name:
-                series_data['ManufacturerModelName'] = manufacturer_model_name
-            if software_versions:
-                series_data['SoftwareVersions'] = software_versions
-            if device_serial_number:
-                series_data['DeviceSerialNumber'] = device_serial_number
-            if psc1:
-                series_data['PSC1'] = psc1
-            # populate series with relative path to DICOM files
-            series_dict[series_uid] = (series_data, {image_uid: relpath})
-        else:
-            series_dict[series_uid][0]['ImageType'] |= set(image_types)
-            # check consistency within series:
-            if series_number != series_dict[series_uid][0]['SeriesNumber']:
-                logger.error('inconsistent series number '
-                             '"%s" / "%s":\n  %s\n  %s',
-                             series_dict[series_uid][0]['SeriesNumber'],
-                             series_number,
-                             next(iter(series_dict[series_uid][1].values())),
-                             relpath)
-            elif series_description != series_dict[series_uid][0]['SeriesDescription']:
-                logger.error('inconsistent series description '
-                             '"%s" / "%s":\n  %s\n  %s',
-                             series_dict[series_uid][0]['SeriesDescription'],
-                             series_description,
-                             next(iter(series_dict[series_uid][1].values())),
-                             relpath)
-            if station_name:
-                if 'StationName' in series_dict[series_uid][0]:
-                    if station_name != series_dict[series_uid][0]['StationName']:
-                        logger.error('inconsistent station name '
-                                     '"%s" / "%s":\n  %s\n  %s',
-                                     series_dict[series_uid][0]['StationName'],
-                                     station_name,
-                                     next(iter(series_dict[series_uid][1].values())),
-                                     relpath)
-                else:
-                    series_dict[series_uid][0]['StationName'] = station_name
-            if manufacturer:
-                if 'Manufacturer' in series_dict[series_uid][0]:
-                    if manufacturer != series_dict[series_uid][0]['Manufacturer']:
-                        logger.error('inconsistent manufacturer '
-                                     '"%s" / "%s":\n  %s\n  %s',
-                                     series_dict[series_uid][0]['Manufacturer'],
-                                     manufacturer,
-                                     next(iter(series_dict[series_uid][1].values())),
-                                     relpath)
-                else:
-                    series_dict[series_uid][0]['Manufacturer'] = manufacturer
-            if manufacturer_model_name:
-                if 'ManufacturerModelName' in series_dict[series_uid][0]:
-                    if manufacturer_model_name != series_dict[series_uid][0]['ManufacturerModelName']:
-                        logger.error('inconsistent manufacturer model name '
-                                     '"%s" / "%s":\n  %s\n  %s',
-                                     series_dict[series_uid][0]['ManufacturerModelName'],
-                                     manufacturer_model_name,
-                                     next(iter(series_dict[series_uid][1].values())),
-                                     relpath)
-                else:
-                    series_dict[series_uid][0]['ManufacturerModelName'] = manufacturer_model_name
-            if software_versions:
-                if 'SoftwareVersions' in series_dict[series_uid][0]:
-                    if software_versions != series_dict[series_uid][0]['SoftwareVersions']:
-                        logger.error('inconsistent software versions '
-                                     '"%s" / "%s":\n  %s\n  %s',
-                                     series_dict[series_uid][0]['SoftwareVersions'],
-                                     software_versions,
-                                     next(iter(series_dict[series_uid][1].values())),
-                                     relpath)
-                else:
-                    series_dict[series_uid][0]['SoftwareVersions'] = software_versions
-            if device_serial_number:
-                if 'DeviceSerialNumber' in series_dict[series_uid][0]:
-                    if device_serial_number != series_dict[series_uid][0]['DeviceSerialNumber']:
-                        logger.error('inconsistent device serial number '
-                                     '"%s" / "%s":\n  %s\n  %s',
-                                     series_dict[series_uid][0]['DeviceSerialNumber'],
-                                     device_serial_number,
-                                     next(iter(series_dict[series_uid][1].values())),
-                                     relpath)
-                else:
-                    series_dict[series_uid][0]['DeviceSerialNumber'] = device_serial_number
-
-            if psc1:
-                if 'PSC1' in series_dict[series_uid][0]:
-                    if psc1 != series_dict[series_uid][0]['PSC1']:
-                        logger.error('inconsistent PSC1 code '
-                                     '"%s" / "%s":\n  %s\n  %s',
-                                     series_dict[series_uid][0]['PSC1'],
-                                     psc1,
-                                     next(iter(series_dict[series_uid][1].values())),
-                                     relpath)
-                else:
-                    series_dict[series_uid][0]['PSC1'] = psc1
-            # populate series with relative path to DICOM files
-            if image_uid not in series_dict[series_uid][1]:
-                series_dict[series_uid][1][image_uid] = relpath
-            else:
-                logger.error('duplicate image in series (%s):'
-                             '\n  %s\n  %s',
-                             series_description,
-                             series_dict[series_uid][1][image_uid],
-                             relpath)
-            # update acquisition date/time range by series
-            if timestamp < series_dict[series_uid][0]['MinAcquisitionDateTime']:
-                series_dict[series_uid][0]['MinAcquisitionDateTime'] = timestamp
-            if timestamp > series_dict[series_uid][0]['MaxAcquisitionDateTime']:
-                series_dict[series_uid][0]['MaxAcquisitionDateTime'] = timestamp
-
-    return series_dict
+    accumulator = SeriesAccumulator()
+    for (image_data, relpath) in image_data_list:
+        accumulator.add(image_data, relpath)
+
+    return accumulator.result()
@@ -47,4 +47,5 @@ from . import imaging
 __all__.extend(imaging.__all__)
 from .imaging import check_zip_name
 from .imaging import check_zip_content
+from .imaging import check_zip_files
 from .imaging import ZipTree
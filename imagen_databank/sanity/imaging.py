@@ -29,24 +29,31 @@
 # knowledge of the CeCILL license and that you accept its terms.
 
 import os
-import tempfile
-import shutil
+import json
+import time
+from collections import OrderedDict
+from io import BytesIO
+from io import TextIOWrapper
 from zipfile import ZipFile
+from concurrent.futures import ProcessPoolExecutor
 try:
     from zipfile import BadZipFile
 except ImportError:
     from zipfile import BadZipfile as BadZipFile  # Python 2
-
 from ..core import PSC2_FROM_PSC1
 from ..core import Error
+from ..core import ErrorCollector
+from ..core import _bounded_map
+from ..core import _intern
 from ..behavioral import (MID_CSV, FT_CSV, SS_CSV, RECOG_CSV)
-from ..behavioral import (read_mid, read_ft, read_ss, read_recog)
+from ..behavioral import _TASK_SPECIFICS
+from ..behavioral import _read_generic_behavioral
 from ..dicom_utils import read_metadata
 
 import logging
 logger = logging.getLogger(__name__)
 
-__all__ = ['check_zip_name', 'check_zip_content', 'ZipTree']
+__all__ = ['check_zip_name', 'check_zip_content', 'check_zip_files', 'ZipTree']
 
 
 _BEHAVIORAL_PREFIX_EXTENSION = {
@@ -129,101 +136,193 @@ def check_zip_name(path, timepoint=None, psc1=None):
         return None, [Error(basename, 'Not a valid ZIP file name')]
 
 
-class ZipTree:
+class _ZipMember(object):
+    """Compact replacement for ZipInfo, as read from the central directory.
+
+    Attributes
+    ----------
+    filename : str
+        Full path of the file within the ZIP file.
+    file_size : int
+        Size of the uncompressed file.
+
+    """
+    __slots__ = ('filename', 'file_size')
+
+    def __init__(self, filename, file_size):
+        self.filename = filename
+        self.file_size = file_size
+
+
+class ZipTree(object):
     """Node of a tree structure to represent ZipFile contents.
 
     Attributes
     ----------
+    filename : str
+        Path of this node within the ZIP file, ending with '/'.
     directories : dict
         Dictionnary of subdirectories.
     files : str
-        Dictionnary of files under this node.
+        Dictionnary of files under this node, with filename and file_size
+        attributes like ZipInfo.
+    file_count : int
+        Number of files under this node and its subdirectories.
+    total_size : int
+        Uncompressed size of files under this node and its subdirectories.
+    empty_file_count : int
+        Number of empty files under this node and its subdirectories.
 
     """
+    __slots__ = ('filename', 'directories', 'files',
+                 'file_count', 'total_size', 'empty_file_count')
 
     def __init__(self, filename=''):
         self.filename = filename
         self.directories = {}
         self.files = {}
+        self.file_count = 0
+        self.total_size = 0
+        self.empty_file_count = 0
 
     @staticmethod
     def create(path):
         ziptree = ZipTree()
+        nodes = {'': ziptree}
         with ZipFile(path, 'r') as z:
             for zipinfo in z.infolist():
-                ziptree._add(zipinfo)  # pylint: disable=W0212
+                ziptree._add(zipinfo.filename, zipinfo.file_size, nodes)  # pylint: disable=W0212
+        ziptree._aggregate()  # pylint: disable=W0212
         return ziptree
 
-    def _add(self, zipinfo):
-        d = self
-
-        if zipinfo.filename.endswith('/'):  # directory
-            parts = zipinfo.filename.rstrip('/').split('/')
-            dirname = ''
-            for part in parts:
-                dirname += part + '/'
-                d = d.directories.setdefault(part, ZipTree(dirname))
-        else:  # file
-            parts = zipinfo.filename.split('/')
-            basename = parts.pop()
-            dirname = ''
-            for part in parts:
-                dirname += part + '/'
-                d = d.directories.setdefault(part, ZipTree(dirname))
+    @staticmethod
+    def _directory(dirname, nodes):
+        """Find or create the node of a directory and its missing parents.
+
+        Parameters
+        ----------
+        dirname : str
+            Path of the directory, ending with '/', or '' for the root.
+        nodes : dict
+            Nodes already created, keyed by path.
+
+        """
+        missing = []
+        node = nodes.get(dirname)
+        while node is None:
+            missing.append(dirname)
+            dirname = dirname[:dirname.rfind('/', 0, -1) + 1]
+            node = nodes.get(dirname)
+        while missing:
+            dirname = _intern(missing.pop())
+            part = _intern(dirname[len(node.filename):-1])
+            node = node.directories.setdefault(part, ZipTree(dirname))
+            nodes[dirname] = node
+        return node
+
+    def _add(self, filename, file_size, nodes):
+        dirname, dummy_sep, basename = filename.rpartition('/')
+        if dirname:
+            dirname += '/'
+        d = self._directory(dirname, nodes)
+        if basename:  # file
+            basename = _intern(basename)
             if basename not in d.files:
-                d.files[basename] = zipinfo
+                d.files[basename] = _ZipMember(filename, file_size)
             else:
                 raise BadZipFile('duplicate file entry in zipfile')
 
+    def walk(self):
+        """Generate the directories of the tree, like os.walk() top-down.
+
+        As with os.walk(), dirnames can be modified in place to prune
+        the directories that are visited next.
+
+        Yields
+        ------
+        tuple
+            Yields a 3-tuple (dirpath, dirnames, filenames) where dirpath
+            is the path of a directory within the ZIP file, ending with '/'
+            except for the root, dirnames and filenames are lists of names
+            of subdirectories and files in this directory.
+
+        """
+        stack = [self]
+        while stack:
+            ziptree = stack.pop()
+            dirnames = list(ziptree.directories)
+            yield ziptree.filename, dirnames, list(ziptree.files)
+            stack.extend(ziptree.directories[d] for d in reversed(dirnames)
+                         if d in ziptree.directories)
+
+    def _aggregate(self):
+        """Compute statistics of each node of the tree, from the leaves up."""
+        nodes = []
+        stack = [self]
+        while stack:
+            ziptree = stack.pop()
+            nodes.append(ziptree)
+            stack.extend(ziptree.directories.values())
+        for ziptree in reversed(nodes):  # children before parents
+            ziptree.file_count = len(ziptree.files)
+            ziptree.total_size = 0
+            ziptree.empty_file_count = 0
+            for zipinfo in ziptree.files.values():
+                ziptree.total_size += zipinfo.file_size
+                if zipinfo.file_size == 0:
+                    ziptree.empty_file_count += 1
+            for d in ziptree.directories.values():
+                ziptree.file_count += d.file_count
+                ziptree.total_size += d.total_size
+                ziptree.empty_file_count += d.empty_file_count
+
+    def _children(self):
+        for d, ziptree in self.directories.items():
+            yield d, ziptree
+        for f in self.files:
+            yield f, None
+
     def pprint(self, indent=''):
-        self._print_children(indent)
-
-    def _print_children(self, indent=''):
-        directories = list(self.directories.items())
-        if directories:
-            last_directory = directories.pop()
-            for d, ziptree in directories:
-                ziptree._print(d, indent, False)  # pylint: disable=W0212
-        else:
-            last_directory = None
-        files = list(self.files.items())
-        if files:
-            if last_directory:
-                d, ziptree = last_directory
-                ziptree._print(d, indent, False)  # pylint: disable=W0212
-            last_file = files.pop()
-            for f, dummy_zipinfo in files:
-                print(indent + '├── ' + f)
-            f, dummy_zipinfo = last_file
-            print(indent + '└── ' + f)
-        elif last_directory:
-            d, ziptree = last_directory
-            ziptree._print(d, indent)  # pylint: disable=W0212
-
-    def _print(self, name, indent='', last=True):
-        if last:
-            print(indent + '└── ' + name)
-            indent += '    '
-        else:
-            print(indent + '├── ' + name)
-            indent += '│   '
-        self._print_children(indent)
+        # stack of [children, indentation, number of children left]
+        stack = [[self._children(), indent,
+                  len(self.directories) + len(self.files)]]
+        while stack:
+            level = stack[-1]
+            if not level[2]:
+                stack.pop()
+                continue
+            name, ziptree = next(level[0])
+            level[2] -= 1
+            if level[2]:
+                print(level[1] + '├── ' + name)
+                indent = level[1] + '│   '
+            else:
+                print(level[1] + '└── ' + name)
+                indent = level[1] + '    '
+            if ziptree is not None:
+                stack.append([ziptree._children(), indent,  # pylint: disable=W0212
+                              len(ziptree.directories) + len(ziptree.files)])
 
 
-class TemporaryDirectory(object):
-    """Backport from Python 3.
-    """
-    def __init__(self, suffix='', prefix=tempfile.gettempprefix(), dir=None):
-        self.pathname = tempfile.mkdtemp(suffix, prefix, dir)
+def _open_zipped_text(zip_file, name):
+    """Open a text file within an open ZIP file for reading.
 
-    def __repr__(self):
-        return '<{} {!r}>'.format(self.__class__.__name__, self.name)
+    The file is decompressed on the fly, it is not extracted to disk.
 
-    def __enter__(self):
-        return self.pathname
+    Parameters
+    ----------
+    zip_file : ZipFile
+        Open ZIP file.
+    name : str
+        Name of the text file within the ZIP file.
 
-    def __exit__(self, exc, value, tb):
-        shutil.rmtree(self.pathname)
+    Returns
+    -------
+    file-like
+        Text stream, named after the file within the ZIP file.
+
+    """
+    return TextIOWrapper(zip_file.open(name))
 
 
 def _check_behavioral_name(filename):
@@ -263,6 +362,63 @@ def _check_physiological_name(filename):
     return None, None
 
 
+def _check_behavioral_content(behavioral_file, filename, behavioral_type,
+                              suffix, psc1, date):
+    """Check the contents of a behavioral file against its task specifics.
+
+    The expected number of trials and how trials are counted are read
+    from the table of task specifics of the behavioral module.
+
+    Parameters
+    ----------
+    behavioral_file : str or file-like
+        Behavioral file to read from.
+    filename : str
+        Name of the behavioral file within the ZIP file, used in errors.
+    behavioral_type : str
+        Type of behavioral file, such as MID_CSV.
+    suffix : str, optional
+        Time point identifier, found as a suffix in subject identifiers.
+    psc1 : str, optional
+        Expected 12-digit PSC1 code.
+    date : datetime.date, optional
+        Date of acquisition.
+
+    Returns
+    -------
+    result: tuple
+        Return the tuple (subject_id, errors) where subject_id is the
+        subject identifier found in the file, None if missing.
+
+    """
+    expected_trials, count_last_trial = _TASK_SPECIFICS[behavioral_type][4:]
+    error_list = []
+
+    subject_id, timestamp, trials, errors = _read_generic_behavioral(behavioral_file,
+                                                                     behavioral_type)
+    if subject_id:
+        error_list.extend([Error(filename, 'Incorrect behavioral file content: ' + message)
+                           for message in _check_psc1(subject_id, suffix, psc1)])
+    else:
+        error_list.append(Error(filename, 'Missing subject ID'))
+    if count_last_trial:
+        count = trials[-1] if trials else None
+    else:
+        count = len(trials)
+    if count is not None and count != expected_trials:
+        error_list.append(Error(filename, 'Behavioral file contains {0} trials instead of {1}'
+                                          .format(count, expected_trials)))
+    if timestamp:
+        if date and date != timestamp.date():
+            error_list.append(Error(filename, 'Date was expected to be "{0}" instead of "{1}"'
+                                              .format(date, timestamp.date())))
+    else:
+        error_list.append(Error(filename, 'Missing acquisition date'))
+    error_list.extend(errors)
+
+    return subject_id, error_list
+
+
 def _check_scanning(path, ziptree, suffix, psc1, date, expected):
     """Check the "Scanning" folder of a ZipTree.
 
@@ -287,7 +443,7 @@ def _check_scanning(path, ziptree, suffix, psc1, date, expected):
 
     """
     subject_ids = set()
-    expected_tests = set([x for x in (MID_CSV, FT_CSV, SS_CSV, RECOG_CSV)
+    expected_tests = set([x for x in _TASK_SPECIFICS
                           if expected[x] != 'Missing']) if expected else None
     actual_tests = set()
     error_list = []
@@ -297,108 +453,36 @@ def _check_scanning(path, ziptree, suffix, psc1, date, expected):
             error_list.append(Error(z.filename,
                                     'Folder "Scanning" should not contain subfolders'))
 
-    for f, z in ziptree.files.items():
-        behavioral_type, subject_id = _check_behavioral_name(f)
-        if behavioral_type:
-            if subject_id:
-                subject_ids.add(subject_id)
-                error_list.extend([Error(z.filename, 'Incorrect behavioral file name: ' + message)
-                                   for message in _check_psc1(subject_id, suffix, psc1)])
-            else:
-                error_list.append(Error(z.filename, 'Unexpected behavioral file name'))
-        else:
-            physiological_type, subject_id = _check_physiological_name(f)
-            if physiological_type:
+    with ZipFile(path, 'r') as zip_file:
+        for f, z in ziptree.files.items():
+            behavioral_type, subject_id = _check_behavioral_name(f)
+            if behavioral_type:
                 if subject_id:
                     subject_ids.add(subject_id)
-                    error_list.extend([Error(z.filename, 'Incorrect physiological file name: ' + message)
+                    error_list.extend([Error(z.filename, 'Incorrect behavioral file name: ' + message)
                                        for message in _check_psc1(subject_id, suffix, psc1)])
+                else:
+                    error_list.append(Error(z.filename, 'Unexpected behavioral file name'))
             else:
-                error_list.append(Error(z.filename, 'Unexpected file name in "Scanning"'))
-            continue  # TODO: make a function of the code below this line
-
-        with TemporaryDirectory() as temp_directory:
-            with ZipFile(path, 'r') as zip_file:
-                if expected_tests and behavioral_type not in expected_tests:
-                    error_list.append(Error(z.filename, 'Unexpected behavioral file'))
-                behavioral_path = zip_file.extract(z.filename, path=temp_directory)
-                if behavioral_type == MID_CSV:
-                    actual_tests.add(behavioral_type)
-                    subject_id, timestamp, trials, errors = read_mid(behavioral_path)
-                    if subject_id:
-                        error_list.extend([Error(z.filename, 'Incorrect behavioral file content: ' + message)
-                                           for message in _check_psc1(subject_id, suffix, psc1)])
-                    else:
-                        error_list.append(Error(z.filename, 'Missing subject ID'))
-                    subject_ids.add(subject_id)
-                    if trials and trials[-1] != 42:
-                        error_list.append(Error(z.filename, 'Behavioral file contains {0} trials instead of 42'
-                                                            .format(trials[-1])))
-                    if timestamp:
-                        if date and date != timestamp.date():
-                            error_list.append(Error(z.filename, 'Date was expected to be "{0}" instead of "{1}"'
-                                                                .format(date, timestamp.date())))
-                    else:
-                        error_list.append(Error(z.filename, 'Missing acquisition date'))
-                    error_list.extend(errors)
-                elif behavioral_type == FT_CSV:
-                    actual_tests.add(behavioral_type)
-                    subject_id, timestamp, trials, errors = read_ft(behavioral_path)
-                    if subject_id:
-                        error_list.extend([Error(z.filename, 'Incorrect behavioral file content: ' + message)
-                                           for message in _check_psc1(subject_id, suffix, psc1)])
-                    else:
-                        error_list.append(Error(z.filename, 'Missing subject ID'))
-                    subject_ids.add(subject_id)
-                    if len(trials) != 24:
-                        error_list.append(Error(z.filename, 'Behavioral file contains {0} trials instead of 24'
-                                                            .format(len(trials))))
-                    if timestamp:
-                        if date and date != timestamp.date():
-                            error_list.append(Error(z.filename, 'Date was expected to be "{0}" instead of "{1}"'
-                                                                .format(date, timestamp.date())))
-                    else:
-                        error_list.append(Error(z.filename, 'Missing acquisition date'))
-                    error_list.extend(errors)
-                elif behavioral_type == SS_CSV:
-                    actual_tests.add(behavioral_type)
-                    subject_id, timestamp, trials, errors = read_ss(behavioral_path)
+                physiological_type, subject_id = _check_physiological_name(f)
+                if physiological_type:
                     if subject_id:
-                        error_list.extend([Error(z.filename, 'Incorrect behavioral file content: ' + message)
+                        subject_ids.add(subject_id)
+                        error_list.extend([Error(z.filename, 'Incorrect physiological file name: ' + message)
                                            for message in _check_psc1(subject_id, suffix, psc1)])
-                    else:
-                        error_list.append(Error(z.filename, 'Missing subject ID'))
-                    subject_ids.add(subject_id)
-                    if trials and trials[-1] != 360:
-                        error_list.append(Error(z.filename, 'Behavioral file contains {0} trials instead of 360'
-                                                            .format(trials[-1])))
-                    if timestamp:
-                        if date and date != timestamp.date():
-                            error_list.append(Error(z.filename, 'Date was expected to be "{0}" instead of "{1}"'
-                                                                .format(date, timestamp.date())))
-                    else:
-                        error_list.append(Error(z.filename, 'Missing acquisition date'))
-                    error_list.extend(errors)
-                elif behavioral_type == RECOG_CSV:
-                    actual_tests.add(behavioral_type)
-                    subject_id, timestamp, trials, errors = read_recog(behavioral_path)
-                    if subject_id:
-                        error_list.extend([Error(z.filename, 'Incorrect behavioral file content: ' + message)
-                                           for message in _check_psc1(subject_id, suffix, psc1)])
-                    else:
-                        error_list.append(Error(z.filename, 'Missing subject ID'))
-                    subject_ids.add(subject_id)
-                    if len(trials) != 5:
-                        error_list.append(Error(z.filename, 'Behavioral file contains {0} trials instead of 5'
-                                                            .format(len(trials))))
-                    if timestamp:
-                        if date and date != timestamp.date():
-                            error_list.append(Error(z.filename, 'Date was expected to be "{0}" instead of "{1}"'
-                                                                .format(date, timestamp.date())))
-                    else:
-                        error_list.append(Error(z.filename, 'Missing acquisition date'))
-
-                    error_list.extend(errors)
+                else:
+                    error_list.append(Error(z.filename, 'Unexpected file name in "Scanning"'))
+                continue
+
+            if expected_tests and behavioral_type not in expected_tests:
+                error_list.append(Error(z.filename, 'Unexpected behavioral file'))
+            actual_tests.add(behavioral_type)
+            with _open_zipped_text(zip_file, z.filename) as behavioral_file:
+                subject_id, errors = _check_behavioral_content(behavioral_file, z.filename,
+                                                               behavioral_type,
+                                                               suffix, psc1, date)
+            subject_ids.add(subject_id)
+            error_list.extend(errors)
 
     if expected_tests:
         missing_tests = expected_tests - actual_tests
@@ -468,15 +552,16 @@ def _files(ziptree):
     f: str
 
     """
-    for f in ziptree.files:
-        yield ziptree.filename + f
-    for ziptree in ziptree.directories.values():
-        for f in _files(ziptree):
-            yield f
+    for dirpath, dummy_dirnames, filenames in ziptree.walk():
+        for f in filenames:
+            yield dirpath + f
 
 
 def _check_empty_files(ziptree):
-    """Recursively check for empty files in a ZipTree.
+    """Check for empty files in a ZipTree and its subdirectories.
+
+    Subdirectories without empty files are not visited. Empty files
+    within the same directory are reported as a single error.
 
     Parameters
     ----------
@@ -487,15 +572,144 @@ def _check_empty_files(ziptree):
     error: Error
 
     """
-    for zipinfo in ziptree.files.values():
-        if zipinfo.file_size == 0:
-            yield Error(zipinfo.filename, 'File is empty')
-    for ziptree in ziptree.directories.values():
-        for error in _check_empty_files(ziptree):
-            yield error
+    stack = [ziptree]
+    while stack:
+        ziptree = stack.pop()
+        if not ziptree.empty_file_count:
+            continue
+        empty_files = [zipinfo.filename for zipinfo in ziptree.files.values()
+                       if zipinfo.file_size == 0]
+        if len(empty_files) > 1:
+            yield Error(ziptree.filename,
+                        '{0} files are empty'.format(len(empty_files)),
+                        category='empty')
+        elif empty_files:
+            yield Error(empty_files[0], 'File is empty', category='empty')
+        stack.extend(reversed(list(ziptree.directories.values())))
+
+
+#
+# DICOM headers usually fit in the first bytes of DICOM files
+#
+_DICOM_HEADER_SIZE = 256 * 1024
+
+
+def _read_zipped_metadata(zip_file, name):
+    """Read select metadata from a DICOM file within an open ZIP file.
+
+    Only the first bytes of the file are read and decompressed, unless
+    the DICOM header does not fit in these bytes.
+
+    Parameters
+    ----------
+    zip_file : ZipFile
+        Open ZIP file.
+    name : str
+        Name of the DICOM file within the ZIP file.
+
+    Returns
+    -------
+    dict
+        Same as read_metadata.
+
+    """
+    if zip_file.getinfo(name).file_size > _DICOM_HEADER_SIZE:
+        with zip_file.open(name) as f:
+            header = f.read(_DICOM_HEADER_SIZE)
+        try:
+            return read_metadata(BytesIO(header), force=True)
+        except Exception:  # pylint: disable=broad-except
+            pass  # truncated header, read the whole file
+    return read_metadata(BytesIO(zip_file.read(name)), force=True)
 
 
-def _check_image_data(path, ziptree, suffix, psc1, date, expected):
+#
+# DICOM tags that may contain the PSC1 code, in order of preference
+#
+_PSC1_TAGS = (
+    'StudyComments',  # DUBLIN
+    'PatientName',  # BERLIN, NOTTINGHAM
+    'ImageComments',  # HAMBURG, DRESDEN
+    'StudyDescription',  # LONDON
+    'PerformedProcedureStepDescription',  # LONDON
+    'PatientID',   # BERLIN, MANNHEIM, PARIS
+)
+
+#
+# how to choose DICOM files to check in "ImageData":
+# * 'first' checks the first readable DICOM file only,
+# * 'series' checks a few readable DICOM files per series directory,
+# * 'all' checks all DICOM files
+#
+_SAMPLING_POLICIES = ('first', 'series', 'all')
+
+
+def _validate_sampling(sampling, files_per_series):
+    if sampling not in _SAMPLING_POLICIES:
+        raise ValueError('unknown DICOM sampling policy: {0}'.format(sampling))
+    if files_per_series < 1:
+        raise ValueError('files_per_series must be at least 1: {0}'
+                         .format(files_per_series))
+
+
+def _subject_id_from_metadata(metadata, suffix):
+    """Find the subject identifier in select DICOM metadata.
+
+    Parameters
+    ----------
+    metadata : dict
+        Metadata returned by read_metadata.
+    suffix : str, optional
+        Time point identifier, removed from the subject identifier.
+
+    Returns
+    -------
+    str
+        Subject identifier, None if not found.
+
+    """
+    for tag in _PSC1_TAGS:
+        if tag in metadata:
+            subject_id = metadata[tag]
+            if (subject_id and subject_id != 'anon'):  # LONDON 'PatientName'
+                if suffix and subject_id[-len(suffix):] == suffix:
+                    subject_id = subject_id[:-len(suffix)]
+                return subject_id
+    return None
+
+
+def _sample_dicom_files(ziptree, sampling, files_per_series):
+    """Group the files of a ZipTree and choose how many to check per group.
+
+    Parameters
+    ----------
+    ziptree : ZipTree
+        "ImageData" branch with the meta-data read from the ZIP file.
+    sampling : str
+        One of 'first', 'series' or 'all'.
+    files_per_series : int
+        Number of files to check per series directory if sampling is
+        'series'.
+
+    Yields
+    ------
+    tuple
+        Yields a pair (files, limit) where files is an iterable of paths
+        within the ZIP file and limit the number of readable files to
+        check among them, or None to check all of them.
+
+    """
+    if sampling == 'first':
+        yield _files(ziptree), 1
+    else:
+        limit = files_per_series if sampling == 'series' else None
+        for dirpath, dummy_dirnames, filenames in ziptree.walk():
+            if filenames:
+                yield [dirpath + f for f in filenames], limit
+
+
+def _check_image_data(path, ziptree, suffix, psc1, date, expected,
+                      sampling='first', files_per_series=1):
     #pylint: disable=unused-argument
     """Check the "ImageData" folder of a ZipTree.
 
@@ -513,6 +727,13 @@ def _check_image_data(path, ziptree, suffix, psc1, date, expected):
         Date of acquisition.
     expected : dict.
         Sequences expected to be found in this folder.
+    sampling : str
+        Check the first readable DICOM file only if 'first', the first
+        readable files of each series directory if 'series', all DICOM
+        files if 'all'.
+    files_per_series : int
+        Number of readable DICOM files to check per series directory,
+        if sampling is 'series'.
 
     Returns
     -------
@@ -526,61 +747,78 @@ def _check_image_data(path, ziptree, suffix, psc1, date, expected):
     error_list = []
 
     # check zip tree is not empty and does not contain empty files
-    files = list(_files(ziptree))
-    if len(files) < 1:
+    if ziptree.file_count < 1:
         error_list.append(Error(ziptree.filename, 'Folder is empty'))
     else:
-        error_list.extend(_check_empty_files(ziptree))
-
-        # choose a file from zip tree and check its DICOM tags
-        with TemporaryDirectory('imagen') as tempdir:
-            for f in files:
-                if os.path.basename(f).startswith('DICOMDIR'):
-                    # do not read DICOMDIR files
-                    # in case of multiple sessions I have seen DICOMDIR2 files
-                    continue
-                with ZipFile(path, 'r') as z:
-                    dicom_file = z.extract(f, tempdir)
+        if ziptree.empty_file_count:
+            empty_files = ErrorCollector()
+            empty_files.extend(_check_empty_files(ziptree))
+            error_list.extend(empty_files)
+
+        # choose files from zip tree and check their DICOM tags
+        dicom_errors = ErrorCollector()
+        with ZipFile(path, 'r') as z:
+            for files, limit in _sample_dicom_files(ziptree, sampling, files_per_series):
+                candidates = 0
+                checked = 0
+                psc1_errors = OrderedDict()
+                for f in files:
+                    if os.path.basename(f).startswith('DICOMDIR'):
+                        # do not read DICOMDIR files
+                        # in case of multiple sessions I have seen DICOMDIR2 files
+                        continue
+                    if z.getinfo(f).file_size == 0:
+                        continue  # already reported as empty
+                    candidates += 1
                     try:
-                        metadata = read_metadata(dicom_file, force=True)
+                        metadata = _read_zipped_metadata(z, f)
                     except IOError:
                         continue
                     except AttributeError:
-                        error_list.append(Error(f, 'This is not a valid DICOM file'))
+                        dicom_errors.append(Error(f, 'This is not a valid DICOM file'))
                         break
+                    checked += 1
+                    subject_id = _subject_id_from_metadata(metadata, suffix)
+                    message = None
+                    if subject_id:
+                        subject_ids.add(subject_id)
+                        if psc1 and subject_id != psc1:
+                            message = ('PSC1 code "{0}" was expected to be "{1}"'
+                                       .format(subject_id, psc1))
+                    elif psc1:
+                        message = 'Missing PSC1 code "{0}"'.format(psc1)
                     else:
-                        ORDERED_TAGS = (
-                            'StudyComments',  # DUBLIN
-                            'PatientName',  # BERLIN, NOTTINGHAM
-                            'ImageComments',  # HAMBURG, DRESDEN
-                            'StudyDescription',  # LONDON
-                            'PerformedProcedureStepDescription',  # LONDON
-                            'PatientID',   # BERLIN, MANNHEIM, PARIS
-                        )
-                        for tag in ORDERED_TAGS:
-                            if tag in metadata:
-                                subject_id = metadata[tag]
-                                if (subject_id and subject_id != 'anon'):  # LONDON 'PatientName'
-                                    if subject_id[-len(suffix):] == suffix:
-                                        subject_id = subject_id[:-len(suffix)]
-                                    subject_ids.add(subject_id)
-                                    if subject_id != psc1:
-                                        error_list.append(Error(f, 'PSC1 code "{0}" was expected to be "{1}"'
-                                                                   .format(subject_id, psc1)))
-                                    break
+                        message = 'Missing PSC1 code'
+                    if message:
+                        # report each message once per series directory
+                        if message in psc1_errors:
+                            psc1_errors[message][1] += 1
                         else:
-                            subject_id = None
-                            error_list.append(Error(f, 'Missing PSC1 code "{0}"'
-                                                       .format(psc1)))
-                        break
-            else:
-                error_list.append(Error(f, 'Unable to read DICOM files in dataset "{}"'
-                                           .format(psc1)))
+                            psc1_errors[message] = [f, 1]
+                    if limit and checked >= limit:
+                        break  # early exit
+                else:
+                    if checked < 1 and (candidates or sampling == 'first'):
+                        if psc1:
+                            message = ('Unable to read DICOM files in dataset "{}"'
+                                       .format(psc1))
+                        else:
+                            message = 'Unable to read DICOM files'
+                        dicom_errors.append(Error(f, message))
+                for message, (f, count) in psc1_errors.items():
+                    if count > 1:
+                        dicom_errors.append(Error(f[:f.rfind('/') + 1],
+                                                  '{0} in {1} files'.format(message, count),
+                                                  category='psc1'))
+                    else:
+                        dicom_errors.append(Error(f, message, category='psc1'))
+        error_list.extend(dicom_errors)
 
     return subject_ids, error_list
 
 
-def _check_ziptree(path, ziptree, suffix=None, psc1=None, date=None, expected=None):
+def _check_ziptree(path, ziptree, suffix=None, psc1=None, date=None, expected=None,
+                   sampling='first', files_per_series=1):
     """Check the uppermost folder of a ZipTree.
 
     Parameters
@@ -597,6 +835,10 @@ def _check_ziptree(path, ziptree, suffix=None, psc1=None, date=None, expected=No
         Date of acquisition.
     expected : dict, optional
         Which MRI sequences and tests to expect.
+    sampling : str
+        Which DICOM files to check: 'first', 'series' or 'all'.
+    files_per_series : int
+        Number of DICOM files to check per series if sampling is 'series'.
 
     Returns
     -------
@@ -630,14 +872,15 @@ def _check_ziptree(path, ziptree, suffix=None, psc1=None, date=None, expected=No
             if d != 'AdditionalData' and d != 'ImageData':
                 error_list.append(Error(z.filename,
                                         'Unexpected folder subfolder in the uppermost folder'))
+        # expected PSC1 code, from the uppermost folder name if not given
+        if psc1:
+            expected_psc1 = psc1
+        else:
+            expected_psc1 = subject_id
+            if suffix and expected_psc1.endswith(suffix):
+                expected_psc1 = expected_psc1[:-len(suffix)]
         # AdditionalData
         if 'AdditionalData' in z.directories:
-            if psc1:
-                expected_psc1 = psc1
-            else:
-                expected_psc1 = subject_id
-                if expected_psc1.endswith(suffix):
-                    expected_psc1 = expected_psc1[:-len(suffix)]
             s, e = _check_additional_data(path, z.directories['AdditionalData'],
                                           suffix, expected_psc1, date, expected)
             subject_ids.update(s)
@@ -648,7 +891,8 @@ def _check_ziptree(path, ziptree, suffix=None, psc1=None, date=None, expected=No
         # ImageData
         if 'ImageData' in z.directories:
             s, e = _check_image_data(path, z.directories['ImageData'],
-                                     suffix, psc1, date, expected)
+                                     suffix, expected_psc1, date, expected,
+                                     sampling, files_per_series)
             subject_ids.update(s)
             error_list.extend(e)
         else:
@@ -658,7 +902,8 @@ def _check_ziptree(path, ziptree, suffix=None, psc1=None, date=None, expected=No
     return subject_ids, error_list
 
 
-def check_zip_content(path, timepoint=None, psc1=None, date=None, expected=None):
+def check_zip_content(path, timepoint=None, psc1=None, date=None, expected=None,
+                      sampling='first', files_per_series=1):
     """Rapid sanity check of a ZIP file containing imaging data for a subject.
 
     Expected sequences and tests are described as a dict:
@@ -675,6 +920,10 @@ def check_zip_content(path, timepoint=None, psc1=None, date=None, expected=None)
         SEQUENCE_RESTING_STATE: 'Missing',
     }
 
+    By default the PSC1 code is checked in the first readable DICOM file
+    only. Large uploads can be checked more thoroughly, at the expense of
+    speed, by sampling a few DICOM files per series or all of them.
+
     Parameters
     ----------
     path : str
@@ -687,6 +936,10 @@ def check_zip_content(path, timepoint=None, psc1=None, date=None, expected=None)
         Date of acquisition.
     expected : dict, optional
         Which MRI sequences and tests to expect.
+    sampling : str
+        Which DICOM files to check: 'first', 'series' or 'all'.
+    files_per_series : int
+        Number of DICOM files to check per series if sampling is 'series'.
 
     Returns
     -------
@@ -700,8 +953,12 @@ def check_zip_content(path, timepoint=None, psc1=None, date=None, expected=None)
     ------
     FileNotFoundError
         If the file does not exist.
+    ValueError
+        If sampling is not one of 'first', 'series' or 'all', or if
+        files_per_series is lower than 1.
 
     """
+    _validate_sampling(sampling, files_per_series)
     basename = os.path.basename(path)
     # is the file empty?
     if os.path.getsize(path) == 0:
@@ -715,4 +972,205 @@ def check_zip_content(path, timepoint=None, psc1=None, date=None, expected=None)
             error_list = [Error(basename, 'Cannot read ZIP file: {0}'.format(e))]
             return (set(), error_list)
         # check tree structure
-        return _check_ziptree(path, ziptree, timepoint, psc1, date, expected)
+        return _check_ziptree(path, ziptree, timepoint, psc1, date, expected,
+                              sampling, files_per_series)
+
+
+def _zip_signature(path):
+    """Identify a version of a ZIP file by its size and modification time."""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime]
+
+
+#
+# status of the check of a ZIP file, as recorded in journals
+#
+_CHECK_DONE = 'done'
+_CHECK_FAILED = 'failed'
+
+
+def _check_zip_file(path, timepoint=None, sampling='first', files_per_series=1):
+    """Check name and contents of a ZIP file, in a worker process.
+
+    Parameters
+    ----------
+    path : str
+        Path to the ZIP file.
+    timepoint : str, optional
+        Time point identifier, found as a suffix in subject identifiers.
+    sampling : str
+        Which DICOM files to check: 'first', 'series' or 'all'.
+    files_per_series : int
+        Number of DICOM files to check per series if sampling is 'series'.
+
+    Returns
+    -------
+    dict
+        Result that can be serialized as JSON: path, size and modification
+        time of the ZIP file, settings of the check, status of the check,
+        PSC1 codes found, errors and wall time spent checking the ZIP file.
+
+    """
+    start = time.time()
+    result = {'path': path,
+              'settings': [timepoint, sampling, files_per_series],
+              'status': _CHECK_FAILED}
+    psc1 = set()
+    error_list = []
+    try:
+        result['signature'] = _zip_signature(path)
+        subject_id, error_list = check_zip_name(path, timepoint)
+        expected_psc1 = subject_id
+        if expected_psc1 and timepoint and expected_psc1.endswith(timepoint):
+            expected_psc1 = expected_psc1[:-len(timepoint)]
+        if not error_list and expected_psc1:
+            psc1, errors = check_zip_content(path, timepoint, expected_psc1,
+                                             sampling=sampling,
+                                             files_per_series=files_per_series)
+        else:
+            psc1, errors = check_zip_content(path, timepoint,
+                                             sampling=sampling,
+                                             files_per_series=files_per_series)
+        error_list.extend(errors)
+        result['status'] = _CHECK_DONE
+    except Exception as e:  # pylint: disable=broad-except
+        error_list.append(Error(os.path.basename(path),
+                                'Cannot check ZIP file: {0}'.format(e)))
+    result['psc1'] = sorted(x for x in psc1 if x)
+    result['errors'] = [{'path': e.path, 'message': e.message}
+                        for e in error_list]
+    result['elapsed'] = time.time() - start
+    return result
+
+
+def _read_journal(journal):
+    """Read results of a previous, possibly interrupted, batch check.
+
+    Parameters
+    ----------
+    journal : str
+        Path to the JSON lines file.
+
+    Returns
+    -------
+    dict
+        Size and modification time of ZIP files and settings of their
+        check, keyed by path. Only ZIP files whose check ran to completion
+        are listed, ZIP files whose check failed are to be checked again.
+
+    """
+    done = {}
+    if os.path.exists(journal):
+        with open(journal, 'r') as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue  # line truncated by an interruption
+                if result.get('status') == _CHECK_DONE:
+                    done[result['path']] = [result['signature'],
+                                            result['settings']]
+    return done
+
+
+def _find_zip_files(path):
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for f in sorted(files):
+            if f.endswith('.zip'):
+                yield os.path.join(root, f)
+
+
+def check_zip_files(path, timepoint=None, journal=None, workers=4,
+                    max_in_flight=None, sampling='first', files_per_series=1):
+    """Check all ZIP files under a directory, checking files in parallel.
+
+    Each ZIP file is checked by check_zip_name and check_zip_content in
+    a pool of processes. Results are yielded as soon as they are available,
+    not in the order the ZIP files are found.
+
+    If a journal is given, results are appended to it as JSON lines as
+    soon as they are available. ZIP files already checked successfully
+    with the same settings according to the journal are skipped unless
+    they have been modified since, so that a batch check can be resumed
+    after an interruption.
+
+    Parameters
+    ----------
+    path : str
+        Directory to find ZIP files in, such as the QUARANTINE directory.
+    timepoint : str, optional
+        Time point identifier, found as a suffix in subject identifiers.
+    journal : str, optional
+        JSON lines file to resume from and append results to.
+    workers : int
+        Number of worker processes.
+    max_in_flight : int, optional
+        Maximal number of ZIP files submitted to workers but not yet
+        yielded, by default 4 times the number of workers.
+    sampling : str
+        Which DICOM files to check: 'first', 'series' or 'all'.
+    files_per_series : int
+        Number of DICOM files to check per series if sampling is 'series'.
+
+    Yields
+    ------
+    dict
+        For each ZIP file, a dictionary with keys 'path', 'signature'
+        (size and modification time of the ZIP file), 'settings' (list of
+        timepoint, sampling and files_per_series), 'status' ('done' or
+        'failed' if the check could not run to completion), 'psc1' (list of
+        PSC1 codes found), 'errors' (list of dictionaries with keys 'path'
+        and 'message') and 'elapsed' (wall time spent checking the ZIP
+        file, in seconds).
+
+    Raises
+    ------
+    ValueError
+        If sampling is not one of 'first', 'series' or 'all', or if
+        files_per_series is lower than 1. Nothing is checked or written
+        to the journal.
+
+    """
+    _validate_sampling(sampling, files_per_series)
+    n = 0
+    skipped = [0]  # modified by tasks()
+    start = time.time()
+    if max_in_flight is None:
+        max_in_flight = 4 * workers
+    done = _read_journal(journal) if journal else {}
+    settings = [timepoint, sampling, files_per_series]
+
+    logger.info('start checking ZIP files with %d workers under: %s',
+                workers, path)
+
+    def tasks():
+        for zip_path in _find_zip_files(path):
+            if zip_path in done:
+                try:
+                    if done[zip_path] == [_zip_signature(zip_path), settings]:
+                        skipped[0] += 1
+                        continue
+                except OSError:
+                    pass  # let the worker report the error
+            yield zip_path, timepoint, sampling, files_per_series
+
+    output = open(journal, 'a') if journal else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for result in _bounded_map(executor, _check_zip_file, tasks(),
+                                       max_in_flight):
+                n += 1
+                logger.debug('checked ZIP file in %.2f s: %s',
+                             result['elapsed'], result['path'])
+                if output:
+                    output.write(json.dumps(result, sort_keys=True) + '\n')
+                    output.flush()
+                yield result
+    finally:
+        if output:
+            output.close()
+
+    elapsed = time.time() - start
+    logger.info('checked %d ZIP files in %.2f s, skipped %d ZIP files '
+                'already checked: %s', n, elapsed, skipped[0], path)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2018 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+import re
+from datetime import datetime
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = ['TimestampParser']
+
+
+#
+# regular expressions for strptime() directives, as in module _strptime
+#
+_DIRECTIVE_REGEX = {
+    'd': r'(?P<day>3[01]|[12]\d|0[1-9]|[1-9]| [1-9])',
+    'm': r'(?P<month>1[0-2]|0[1-9]|[1-9])',
+    'b': r'(?P<month_name>[a-zA-Z]{3})',
+    'Y': r'(?P<year>\d\d\d\d)',
+    'H': r'(?P<hour>2[0-3]|[0-1]\d|\d)',
+    'I': r'(?P<hour12>1[0-2]|0[1-9]|[1-9])',
+    'M': r'(?P<minute>[0-5]\d|\d)',
+    'S': r'(?P<second>6[0-1]|[0-5]\d|\d)',
+    'p': r'(?P<am_pm>am|pm|AM|PM|Am|Pm|aM|pM)',
+}
+
+_MONTH_FROM_NAME = {
+    name: month for month, name in enumerate(('jan', 'feb', 'mar', 'apr',
+                                              'may', 'jun', 'jul', 'aug',
+                                              'sep', 'oct', 'nov', 'dec'), 1)
+}
+
+
+def _compile_format(date_format):
+    """Translate a strptime() format into an anchored regular expression.
+
+    Only directives found in Imagen files are supported, with English
+    month names as in the C locale.
+
+    Parameters
+    ----------
+    date_format : str
+        strptime() format.
+
+    Returns
+    -------
+    regex
+        Compiled regular expression with named groups.
+
+    Raises
+    ------
+    ValueError
+        If the format contains an unsupported directive.
+
+    """
+    pattern = []
+    for part in re.split(r'(%.)', date_format):
+        if part.startswith('%') and len(part) == 2:
+            directive = part[1]
+            if directive not in _DIRECTIVE_REGEX:
+                raise ValueError('unsupported directive: ' + part)
+            pattern.append(_DIRECTIVE_REGEX[directive])
+        else:
+            # whitespace matches any whitespace, as in strptime()
+            pattern.extend(r'\s+' if x.isspace() else re.escape(x)
+                           for x in re.split(r'(\s+)', part) if x)
+    return re.compile(''.join(pattern) + r'\Z', re.IGNORECASE)
+
+
+def _datetime_from_match(match):
+    """Build a datetime from the named groups of a matched time stamp."""
+    fields = match.groupdict()
+    if 'month_name' in fields:
+        month = _MONTH_FROM_NAME.get(fields['month_name'].lower())
+        if month is None:
+            return None
+    else:
+        month = int(fields['month'])
+    if 'hour12' in fields:
+        hour = int(fields['hour12']) % 12
+        if fields['am_pm'].lower() == 'pm':
+            hour += 12
+    else:
+        hour = int(fields.get('hour', 0))
+    try:
+        return datetime(int(fields['year']), month, int(fields['day']),
+                        hour, int(fields.get('minute', 0)),
+                        int(fields.get('second', 0)))
+    except ValueError:
+        return None  # such as February 30
+
+
+class TimestampParser(object):
+    """Parse time stamps in one of several known formats.
+
+    Formats are translated once into regular expressions. The format that
+    last matched is remembered for each key, typically an acquisition
+    centre or a file, and tried first next time, so that the other formats
+    are tried only when the format changes.
+
+    Supported directives are %d, %m, %b, %Y, %H, %I, %M, %S and %p.
+    Results are identical to trying datetime.strptime() with each format
+    in order, as long as no time stamp matches more than one format.
+
+    Attributes
+    ----------
+    formats : tuple
+        strptime() formats, in order of preference.
+
+    """
+
+    def __init__(self, formats):
+        self.formats = tuple(formats)
+        self._regexes = tuple(_compile_format(f) for f in self.formats)
+        self._detected = {}
+
+    def detected_format(self, key=None):
+        """Return the format that last matched for a key, or None."""
+        index = self._detected.get(key)
+        if index is None:
+            return None
+        return self.formats[index]
+
+    def parse(self, date_string, key=None):
+        """Parse a time stamp.
+
+        Parameters
+        ----------
+        date_string : str
+            Time stamp.
+        key : hashable, optional
+            Remember the detected format for this key, such as a centre.
+
+        Returns
+        -------
+        datetime.datetime
+            Time stamp, None if date_string does not match any format.
+
+        """
+        detected = self._detected.get(key)
+        if detected is not None:
+            match = self._regexes[detected].match(date_string)
+            if match:
+                dt = _datetime_from_match(match)
+                if dt is not None:
+                    return dt
+        for index, regex in enumerate(self._regexes):
+            if index == detected:
+                continue
+            match = regex.match(date_string)
+            if match:
+                dt = _datetime_from_match(match)
+                if dt is not None:
+                    self._detected[key] = index
+                    return dt
+        return None
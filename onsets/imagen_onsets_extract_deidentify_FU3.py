@@ -3,10 +3,10 @@
 
 import os
 import zipfile
-from datetime import datetime
 from tempfile import TemporaryDirectory
 from multiprocessing import Pool
 from imagen_databank import PSC2_FROM_PSC1, DOB_FROM_PSC1
+from imagen_databank import TimestampParser
 import logging
 
 logging.basicConfig(level=logging.WARNING)
@@ -17,21 +17,17 @@ FU3_DATASETS = '/neurospin/imagen/FU3/RAW/QUARANTINE'
 BEHAVIOURAL = '/neurospin/imagen/FU3/RAW/PSC2/onsets'
 
 
-def _parse_onsets_datetime(date_string):
+_ONSETS_TIMESTAMPS = TimestampParser((
+    '%d.%m.%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M:%S',
+))
+
+
+def _parse_onsets_datetime(date_string, center=None):
     """Read date in the format found in CSV files.
 
     """
-    DATE_FORMATS = (
-        '%d.%m.%Y %H:%M:%S',
-        '%d/%m/%Y %H:%M:%S',
-    )
-    for date_format in DATE_FORMATS:
-        try:
-            dt = datetime.strptime(date_string, date_format)
-            return dt
-        except ValueError:
-            pass
-    return None
+    return _ONSETS_TIMESTAMPS.parse(date_string, center)
 
 
 def _extract_psc1_timestamp_FU3(path):
@@ -77,7 +73,7 @@ def process_behavioural(path, prefix, psc1, psc2):
             # de-identify 1st line
             line = next(iter(content))
             column = line.split('\t')
-            column[1] = str((_parse_onsets_datetime(column[1]).date() -
+            column[1] = str((_parse_onsets_datetime(column[1], psc1[:2]).date() -
                              DOB_FROM_PSC1[psc1]).days)
             column[2] = column[2].replace(psc1, psc2)
             line = '\t'.join(column)
@@ -76,5 +76,7 @@ setup(
     ],
     install_requires=[
         'pydicom',
+        'numpy',
+        'futures; python_version < "3"',  # backport of concurrent.futures
     ],
 )
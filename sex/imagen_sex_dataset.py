@@ -12,6 +12,7 @@ from multiprocessing import Pool
 import dicom
 from imagen_databank import PSC2_FROM_PSC1, DOB_FROM_PSC2
 from imagen_databank import PSC1_FROM_PSC2
+from imagen_databank import sniff_csv
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -106,13 +107,15 @@ _CANTAB_GENDER_MAPPING = {
 }
 
 
-def _sex_from_cantab(path):
+def _sex_from_cantab(path, center=None):
     """Extract sex from a single Cantab file.
 
     Parameters
     ----------
     path  : unicode
         Path to Cantab datasheet_*.csv file.
+    center : str, optional
+        Acquisition center, reuse the CSV dialect detected for this center.
 
     Returns
     -------
@@ -125,9 +128,8 @@ def _sex_from_cantab(path):
     with open(path, encoding='latin1', newline='') as csvfile:
         path = os.path.basename(path)
 
-        dialect = csv.Sniffer().sniff(csvfile.read())
-        csvfile.seek(0)
-        cantab = csv.DictReader(csvfile, dialect=dialect)
+        dialect, lines = sniff_csv(csvfile, center)
+        cantab = csv.DictReader(lines, dialect=dialect)
         for row in cantab:
             if 'Gender' in row:
                 gender = row['Gender']
@@ -214,7 +216,7 @@ def process_dataset_BL(arguments):
                     logging.debug('%s: found Cantab file: %s', psc1, member.name)
                     tar.extract(member, path=tmp)
                     path = os.path.join(tmp, member.name)
-                    cantab_sex = _sex_from_cantab(path)
+                    cantab_sex = _sex_from_cantab(path, psc1[:2])
                     break
             else:
                 logging.warn('%s: missing Cantab file', psc1)
@@ -286,7 +288,7 @@ def process_dataset_FU2(arguments):
     for f in os.listdir(additional_data_path):
         if 'datasheet' in f and 'detailed' not in f:
             datasheet_path = os.path.join(additional_data_path, f)
-            cantab_sex = _sex_from_cantab(datasheet_path)
+            cantab_sex = _sex_from_cantab(datasheet_path, psc1[:2])
             logging.info('%s: sex in Cantab file: %s',
                          psc1, cantab_sex)
             break
@@ -393,7 +395,7 @@ def process_cantab_FU3(arguments):
 
     logging.info('%s: processing FU3 Cantab file...', psc1)
 
-    cantab_sex = _sex_from_cantab(cantab_path)
+    cantab_sex = _sex_from_cantab(cantab_path, psc1[:2])
     logging.info('%s: sex in Cantab file: %s',
                  psc1, cantab_sex)
 
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2018 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+import pytest
+
+from imagen_databank import core
+
+
+#
+# small conversion tables used throughout the tests
+#
+PSC2PSC = """PSC1=DAWBA=PSC2
+010000000001=11111=000000000101
+010000000002=22222=000000000102
+070000123456=33333=000000000103
+"""
+
+DOB = """010000000001,2000-01-15,x
+070000123456,1999-12-31,x
+"""
+
+
+@pytest.fixture
+def conversion_tables(tmp_path):
+    """Read conversion tables from small files, restore defaults afterwards.
+
+    Returns
+    -------
+    tuple
+        Paths to psc2psc.csv, DOB.csv and the compiled binary file.
+
+    """
+    psc2psc = tmp_path / 'psc2psc.csv'
+    psc2psc.write_text(PSC2PSC)
+    dob = tmp_path / 'DOB.csv'
+    dob.write_text(DOB)
+    cache = tmp_path / 'conversion_tables.bin'
+    saved = dict(core._CONVERSION_TABLE_PATHS)  # pylint: disable=W0212
+    core.set_conversion_tables(str(psc2psc), str(dob), str(cache))
+    yield str(psc2psc), str(dob), str(cache)
+    core._CONVERSION_TABLE_PATHS.update(saved)  # pylint: disable=W0212
+    core.set_conversion_tables()
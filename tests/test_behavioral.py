@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2018 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+import io
+from datetime import datetime
+
+import numpy as np
+
+from imagen_databank.behavioral import (read_mid, read_ft,
+                                        MID_COLUMNS, FT_COLUMNS)
+
+
+def _behavioral_file(task, columns, rows, name):
+    lines = ['{0} task\t01.02.2015 12:34:56\tSubject ID: 070000123456FU3\t'
+             'Task type: Scanning'.format(task),
+             '\t'.join(columns)]
+    lines.extend('\t'.join(row) for row in rows)
+    f = io.StringIO('\n'.join(lines) + '\n')
+    f.name = name
+    return f
+
+
+def _mid_rows(n):
+    return [[str(i), 'cat', str(i * 1000), '', 'x', '1.5', '2'] +
+            [str(j) for j in range(10)]
+            for i in range(1, n + 1)]
+
+
+def test_table_mode():
+    rows = _mid_rows(3)
+    rows.append(['4', 'short'])
+    psc1, timestamp, trials, errors, table = read_mid(
+        _behavioral_file('MID_TASK', MID_COLUMNS, rows, 'mid.csv'), table=True)
+    assert psc1 == '070000123456FU3'
+    assert timestamp == datetime(2015, 2, 1, 12, 34, 56)
+    assert list(trials) == [1, 2, 3, 4]
+    assert [str(e) for e in errors] == [
+        "Line 6 contains 2 columns instead of 17: <['4', 'short']>: mid.csv"]
+
+    # lines with the wrong number of columns are left out of the table
+    assert table.dtype.names == MID_COLUMNS
+    assert len(table) == 3
+    assert table['Trial'].dtype == np.int64
+    assert list(table['Trial']) == [1, 2, 3]
+    assert list(table['Trial Start Time (Onset)']) == [1000, 2000, 3000]
+    assert table['Anticipation Phase Start Time'].dtype == np.float64
+    assert list(table['Anticipation Phase Start Time']) == [1.5, 1.5, 1.5]
+    # empty cells are NaN
+    assert np.isnan(table['Pre-determined Onset']).all()
+    assert table['Trial Category'].dtype.kind == 'U'
+    assert list(table['Trial Category']) == ['cat', 'cat', 'cat']
+
+
+def test_table_mode_default():
+    result = read_mid(_behavioral_file('MID_TASK', MID_COLUMNS, _mid_rows(2),
+                                       'mid.csv'))
+    assert len(result) == 4
+
+
+def test_table_mode_no_data():
+    psc1, dummy_t, trials, errors, table = read_ft(
+        _behavioral_file('FACE_TASK', FT_COLUMNS, [], 'ft.csv'), table=True)
+    assert psc1 == '070000123456FU3'
+    assert list(trials) == []
+    assert not errors
+    assert table.dtype.names == FT_COLUMNS
+    assert len(table) == 0
+
+
+def test_table_mode_quoted_lines():
+    rows = [['1', 'clip.avi'], ['2', 'clip.avi']]
+    f = _behavioral_file('FACE_TASK', FT_COLUMNS, rows, 'ft.csv')
+    quoted = io.StringIO(''.join('"{0}"\n'.format(line.rstrip('\n'))
+                                 for line in f))
+    quoted.name = 'ft.csv'
+    dummy_p, dummy_t, trials, errors, table = read_ft(quoted, strict=False,
+                                                      table=True)
+    assert list(trials) == [1, 2]
+    assert not errors
+    assert list(table['Video Clip Name']) == ['clip.avi', 'clip.avi']
+
+
+class _LineStream(object):
+    """Text stream that can only be iterated over, line by line."""
+
+    def __init__(self, f):
+        self.name = f.name
+        self._lines = iter(f.getvalue().splitlines(True))
+        self.consumed = 0
+
+    def read(self, *args):
+        raise AssertionError('file read at once')
+
+    readlines = read
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self._lines)
+        self.consumed += 1
+        return line
+
+    next = __next__  # Python 2
+
+
+def test_streaming():
+    f = _LineStream(_behavioral_file('MID_TASK', MID_COLUMNS, _mid_rows(42),
+                                     'mid.csv'))
+    psc1, dummy_t, trials, errors = read_mid(f)
+    assert psc1 == '070000123456FU3'
+    assert list(trials) == list(range(1, 43))
+    assert not errors
+    assert f.consumed == 44
+
+
+def test_mixed_quoted_lines():
+    lines = list(_behavioral_file('MID_TASK', MID_COLUMNS, _mid_rows(4),
+                                  'mid.csv'))
+    # wholly quoted lines, among lines that are not
+    for i in (0, 3, 5):
+        lines[i] = '"{0}"\n'.format(lines[i].rstrip('\n'))
+    # a quoted cell is not a quoted line
+    lines[4] = '"3"' + lines[4][1:]
+    f = io.StringIO(''.join(lines))
+    f.name = 'mid.csv'
+
+    psc1, dummy_t, trials, errors, table = read_mid(f, strict=False,
+                                                    table=True)
+    assert psc1 == '070000123456FU3'
+    assert list(trials) == [1, 2, 3, 4]
+    assert not errors
+    assert list(table['Trial']) == [1, 2, 3, 4]
+
+    f.seek(0)
+    psc1, dummy_t, trials, errors = read_mid(f)
+    assert psc1 is None
+    messages = [e.message for e in errors]
+    assert messages[0] == 'Line 1 contains 1 columns instead of 4'
+    assert [m for m in messages if 'instead of 17' in m] == [
+        'Line 4 contains 1 columns instead of 17',
+        'Line 6 contains 1 columns instead of 17',
+    ]
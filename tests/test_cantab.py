@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2018 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+import io
+import os
+import re
+import csv
+import zipfile
+import logging
+
+import numpy as np
+import pytest
+from lxml import etree
+
+from imagen_databank import cantab
+from imagen_databank.cantab import sniff_csv, load_datasheet, load_datasheets
+from imagen_databank.cantab import read_cant, read_cant_many
+from imagen_databank.cantab import (read_detailed_datasheet, read_report,
+                                    read_subject_ids_many)
+
+
+def _index_xml(subject_ids):
+    entities = ''.join('<entity><attribute name="ID" value="{0}"/>'
+                       '<attribute name="Name" value="x"/></entity>'
+                       .format(subject_id) for subject_id in subject_ids)
+    return ('<?xml version="1.0"?>'
+            '<proteus xmlns="http://www.camcog.com/proteus/entity/xml">'
+            '<group>{0}</group>{0}'
+            '</proteus>'.format(entities)).encode('ascii')
+
+
+def _ids_xpath(xml):
+    """Find "ID" values as read_cant did before parsing incrementally."""
+    root = etree.fromstring(xml)
+    return {element.attrib['value'] for element in root.findall(
+        ".//{http://www.camcog.com/proteus/entity/xml}attribute[@name='ID']")}
+
+
+def _cclar(path, *index_xmls):
+    with zipfile.ZipFile(str(path), 'w') as z:
+        for i, xml in enumerate(index_xmls):
+            z.writestr('{0}/index.xml'.format(i), xml)
+        z.writestr('other.xml', _index_xml(['999999999999']))
+    return str(path)
+
+
+def test_read_cant(tmp_path):
+    first = _index_xml(['0700001234{0:02}'.format(i) for i in range(50)])
+    second = _index_xml(['010000000001', '070000123400'])
+    path = _cclar(tmp_path / 'cant_070000123456.cclar', first, second)
+    assert read_cant(path) == _ids_xpath(first) | _ids_xpath(second)
+    assert len(read_cant(path)) == 51
+
+
+def test_iter_cant_ids_pruned(monkeypatch):
+    subject_ids = ['{0:012}'.format(i) for i in range(20000)]
+    sizes = []
+
+    class RecordingEtree(object):
+        """Record the size of the tree built so far at each event."""
+
+        @staticmethod
+        def iterparse(*args, **kwargs):
+            for event, element in etree.iterparse(*args, **kwargs):
+                root = element.getroottree().getroot()
+                sizes.append(len(root) + len(root[0]))
+                yield event, element
+
+    monkeypatch.setattr(cantab, 'etree', RecordingEtree)
+    found = list(cantab._iter_cant_ids(io.BytesIO(_index_xml(subject_ids))))  # pylint: disable=W0212
+    assert found == subject_ids * 2
+    # processed elements have been discarded
+    assert len(sizes) == 4 * len(subject_ids)
+    assert max(sizes) < 1000
+
+
+def test_iter_cant_ids_missing_value():
+    xml = _index_xml(['070000123456']).replace(
+        b'<attribute name="Name" value="x"/>',
+        b'<attribute name="ID"/><attribute name="ID" value=""/>', 1)
+    found = list(cantab._iter_cant_ids(io.BytesIO(xml)))  # pylint: disable=W0212
+    assert found == ['070000123456', '070000123456']
+
+
+def test_read_cant_many(tmp_path, caplog):
+    paths = []
+    for i in range(10):
+        xml = _index_xml(['07000012340{0}'.format(i), '010000000001'])
+        paths.append(_cclar(tmp_path / 'cant_{0}.cclar'.format(i), xml))
+    missing = str(tmp_path / 'cant_missing.cclar')
+    with caplog.at_level(logging.ERROR):
+        results = dict(read_cant_many(paths + [missing], workers=3,
+                                      max_in_flight=2))
+    assert 'cannot read Cantab file' in caplog.text
+    assert sorted(results) == sorted(paths)
+    for path, subject_ids in results.items():
+        assert subject_ids == read_cant(path)
+
+
+def _datasheet(header, rows, delimiter='\t'):
+    lines = [delimiter.join('"{0}"'.format(x) for x in header)]
+    lines.extend(delimiter.join('"{0}"'.format(x) for x in row) for row in rows)
+    return '\n'.join(lines) + '\n'
+
+
+HEADER = ('Subject ID', 'Session start time', 'Gender', 'Visit', 'Score, total')
+ROWS = [('070000123456FU3', '01-Feb-2015 12:0{0}:56'.format(i), 'Male',
+         str(i), '{0}.5'.format(i)) for i in range(8)]
+
+
+@pytest.fixture
+def dialects(monkeypatch):
+    """Empty the dialect cache, count calls to csv.Sniffer.sniff()."""
+    monkeypatch.setattr(cantab, '_CSV_DIALECTS', {})
+    calls = []
+    sniff = csv.Sniffer.sniff
+
+    def counting_sniff(self, sample, delimiters=None):
+        calls.append(sample)
+        return sniff(self, sample, delimiters)
+
+    monkeypatch.setattr(csv.Sniffer, 'sniff', counting_sniff)
+    return calls
+
+
+def test_sniff_csv(dialects):
+    text = _datasheet(HEADER, ROWS)
+    dialect, lines = sniff_csv(io.StringIO(text))
+    assert dialect.delimiter == '\t'
+    assert ''.join(lines) == text
+    assert list(csv.reader(io.StringIO(text), dialect))[1][4] == '0.5'
+
+
+def test_sniff_csv_bounded_sample(dialects, monkeypatch):
+    monkeypatch.setattr(cantab, '_SNIFF_SIZE', 100)
+    text = _datasheet(HEADER, ROWS * 10)
+    dialect, lines = sniff_csv(io.StringIO(text))
+    assert dialect.delimiter == '\t'
+    # the sample is completed to the end of a line
+    assert len(dialects) == 1
+    assert 100 <= len(dialects[0]) < 200
+    assert dialects[0].endswith('\n')
+    # all lines are still returned
+    assert ''.join(lines) == text
+
+
+def test_sniff_csv_dialect_cache(dialects):
+    tab = _datasheet(HEADER, ROWS)
+    comma = _datasheet(HEADER, ROWS, delimiter=',')
+    sniff_csv(io.StringIO(tab), '07')
+    assert len(dialects) == 1
+    # same center and header line: reuse the detected dialect
+    dialect, lines = sniff_csv(io.StringIO(tab), '07')
+    assert len(dialects) == 1
+    assert dialect.delimiter == '\t'
+    assert ''.join(lines) == tab
+    # another header line or another center: detect again
+    dialect, dummy_lines = sniff_csv(io.StringIO(comma), '07')
+    assert len(dialects) == 2
+    assert dialect.delimiter == ','
+    sniff_csv(io.StringIO(tab), '01')
+    assert len(dialects) == 3
+    # no center: no cache
+    sniff_csv(io.StringIO(tab))
+    sniff_csv(io.StringIO(tab))
+    assert len(dialects) == 5
+
+
+def test_load_datasheet(tmp_path, dialects):
+    path = tmp_path / 'datasheet_070000123456FU3.csv'
+    rows = [list(row) for row in ROWS]
+    rows[1][1] = 'unreadable'
+    rows[2][4] = ''
+    path.write_text(_datasheet(HEADER + ('Visit',), [r + ['x'] for r in rows]))
+    columns = load_datasheet(str(path))
+    assert list(columns) == list(HEADER) + ['Visit.1']
+    assert list(columns['Subject ID']) == ['070000123456FU3'] * 8
+    assert columns['Session start time'].dtype == np.dtype('datetime64[s]')
+    assert columns['Session start time'][0] == np.datetime64('2015-02-01T12:00:56')
+    assert np.isnat(columns['Session start time'][1])
+    assert columns['Visit'].dtype == np.int64
+    assert list(columns['Visit']) == list(range(8))
+    assert columns['Score, total'].dtype == np.float64
+    assert np.isnan(columns['Score, total'][2])
+    assert list(columns['Visit.1']) == ['x'] * 8
+
+
+def test_load_datasheets(tmp_path, dialects, caplog):
+    first = tmp_path / 'datasheet_070000123456FU3.csv'
+    first.write_text(_datasheet(HEADER, ROWS[:4]))
+    second = tmp_path / 'datasheet_010000000001FU3.csv'
+    second.write_text(_datasheet(('Subject ID', 'Visit', 'Comment'),
+                                 [('010000000001FU3', str(i), 'c{0}'.format(i))
+                                  for i in range(8)]))
+    missing = tmp_path / 'datasheet_010000000002FU3.csv'
+    paths = [str(first), str(missing), str(second)]
+
+    with caplog.at_level(logging.ERROR):
+        columns = load_datasheets(paths)
+    assert 'cannot read Cantab datasheet' in caplog.text
+
+    assert list(columns) == list(HEADER) + ['Comment']
+    assert all(len(c) == 12 for c in columns.values())
+    assert list(columns['Subject ID']) == (['070000123456FU3'] * 4 +
+                                           ['010000000001FU3'] * 8)
+    # integers in all files remain integers
+    assert columns['Visit'].dtype == np.int64
+    assert list(columns['Visit']) == list(range(4)) + list(range(8))
+    # missing values are NaT, NaN or empty strings
+    assert np.isnat(columns['Session start time'][4:]).all()
+    assert np.isnan(columns['Score, total'][4:]).all()
+    assert list(columns['Gender']) == ['Male'] * 4 + [''] * 8
+    assert list(columns['Comment']) == [''] * 4 + ['c{0}'.format(i)
+                                                   for i in range(8)]
+
+    parallel = load_datasheets(paths, workers=2)
+    assert list(parallel) == list(columns)
+    for title in columns:
+        assert parallel[title].dtype == columns[title].dtype
+        np.testing.assert_array_equal(parallel[title], columns[title])
+
+
+def test_load_datasheets_empty():
+    assert load_datasheets([]) == {}
+
+
+#
+# former line by line readers of detailed datasheets and reports
+#
+_DETAILED_DATASHEET_LINE_REGEX = re.compile(r'"?Subject ID : (\w*)"?')
+_REPORT_LINE_REGEX = re.compile('<th>Subject ID</th><td>(.*)</td>'
+                                '<th>Gender</th><td>(.*)</td>')
+
+
+def _read_lines(path, regex):
+    with io.open(path, encoding='latin-1') as f:
+        return {match.group(1) for match in (regex.match(line) for line in f)
+                if match}
+
+
+DETAILED_DATASHEET = (
+    b'"Subject ID : 070000123456FU3"\r\n'
+    b'Subject ID : 010000000001\n'
+    b'"Subject ID : Ren\xe9e_2"\r'
+    b'x "Subject ID : 999999999999"\n'
+    b'"Subject ID : "\n'
+    b'Subject ID: 888888888888\n'
+    b'"Subject ID : 070000123456FU3"\n'
+    b'Subject ID : 020000000002'
+)
+
+REPORT = (
+    b'<html><table>\n'
+    b'<th>Subject ID</th><td>070000123456</td><th>Gender</th><td>Male</td>\n'
+    b'<th>Subject ID</th><td>Ren\xe9e</td><th>Gender</th><td>Female</td>\r\n'
+    b' <th>Subject ID</th><td>999999999999</td><th>Gender</th><td>Male</td>\n'
+    b'<th>Subject ID</th><td>a</td><td>b</td><th>Gender</th><td></td></td>\n'
+    b'<th>Subject ID</th><td>777777777777</td>\n'
+    b'</table></html>'
+)
+
+
+@pytest.mark.parametrize('contents, read, regex', [
+    (DETAILED_DATASHEET, read_detailed_datasheet, _DETAILED_DATASHEET_LINE_REGEX),
+    (REPORT, read_report, _REPORT_LINE_REGEX),
+    (b'', read_detailed_datasheet, _DETAILED_DATASHEET_LINE_REGEX),
+    (b'', read_report, _REPORT_LINE_REGEX),
+])
+def test_scan_subject_ids(tmp_path, contents, read, regex):
+    path = tmp_path / 'file'
+    path.write_bytes(contents)
+    assert read(str(path)) == _read_lines(str(path), regex)
+
+
+def test_scan_subject_ids_values(tmp_path):
+    path = tmp_path / 'detailed_datasheet.csv'
+    path.write_bytes(DETAILED_DATASHEET)
+    assert read_detailed_datasheet(str(path)) == {
+        '070000123456FU3', '010000000001', u'Ren\xe9e_2', '', '020000000002'}
+    path = tmp_path / 'report.html'
+    path.write_bytes(REPORT)
+    assert read_report(str(path)) == {'070000123456', u'Ren\xe9e',
+                                      'a</td><td>b'}
+
+
+def test_read_subject_ids_many(tmp_path, caplog):
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'a' / 'detailed_datasheet_070000123456.csv').write_bytes(
+        DETAILED_DATASHEET)
+    (tmp_path / 'a' / 'report_070000123456.html').write_bytes(REPORT)
+    (tmp_path / 'datasheet_070000123456.csv').write_bytes(DETAILED_DATASHEET)
+    os.symlink(str(tmp_path / 'missing'),
+               str(tmp_path / 'detailed_datasheet_010000000001.csv'))
+    with caplog.at_level(logging.ERROR):
+        results = dict(read_subject_ids_many(str(tmp_path), workers=2))
+    assert 'detailed_datasheet_010000000001.csv' in caplog.text
+    assert sorted(results) == [
+        str(tmp_path / 'a' / 'detailed_datasheet_070000123456.csv'),
+        str(tmp_path / 'a' / 'report_070000123456.html'),
+    ]
+    for path, subject_ids in results.items():
+        read = read_report if path.endswith('.html') else read_detailed_datasheet
+        assert subject_ids == read(path)
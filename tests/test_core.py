@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2018 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+import os
+import datetime
+
+import numpy as np
+import pytest
+
+from imagen_databank import core
+from imagen_databank.core import (PSC2_FROM_PSC1, PSC1_FROM_PSC2,
+                                  PSC1_FROM_DAWBA, PSC2_FROM_DAWBA,
+                                  DOB_FROM_PSC1, DOB_FROM_PSC2)
+from imagen_databank.core import (guess_psc1, guess_psc1_many,
+                                  set_conversion_tables)
+from imagen_databank.core import convert_psc1_to_psc2, age_in_days
+from imagen_databank.core import find_codes, find_codes_in_file
+from imagen_databank.core import Error, ErrorCollector
+
+
+def test_conversion_tables(conversion_tables):
+    assert PSC2_FROM_PSC1['070000123456'] == '000000000103'
+    assert PSC1_FROM_PSC2['000000000103'] == '070000123456'
+    assert PSC1_FROM_DAWBA['33333'] == '070000123456'
+    assert PSC2_FROM_DAWBA['11111'] == '000000000101'
+    assert DOB_FROM_PSC1['010000000001'] == datetime.date(2000, 1, 15)
+    assert DOB_FROM_PSC2['000000000103'] == datetime.date(1999, 12, 31)
+    assert len(PSC2_FROM_PSC1) == 3
+    assert sorted(PSC1_FROM_PSC2) == ['000000000101', '000000000102',
+                                      '000000000103']
+    assert '010000000002' in PSC2_FROM_PSC1
+    assert '010000000002' not in DOB_FROM_PSC1
+    assert '999999999999' not in PSC1_FROM_PSC2
+    assert 12 not in PSC2_FROM_PSC1
+    with pytest.raises(KeyError):
+        PSC2_FROM_PSC1['999999999999']
+
+
+def test_conversion_tables_binary_file(conversion_tables, monkeypatch):
+    psc2psc, dob, cache = conversion_tables
+    compiled = []
+    compile_tables = core._compile_conversion_tables  # pylint: disable=W0212
+
+    def counting_compile(*args):
+        compiled.append(args)
+        return compile_tables(*args)
+
+    monkeypatch.setattr(core, '_compile_conversion_tables', counting_compile)
+
+    # compiled on first access only
+    assert PSC2_FROM_PSC1['010000000001'] == '000000000101'
+    assert os.path.isfile(cache)
+    assert len(compiled) == 1
+
+    # reused by other processes, here after discarding tables in memory
+    set_conversion_tables(psc2psc, dob, cache)
+    assert PSC1_FROM_PSC2['000000000101'] == '010000000001'
+    assert len(compiled) == 1
+
+    # touching the source files does not trigger a rebuild
+    os.utime(psc2psc, None)
+    set_conversion_tables(psc2psc, dob, cache)
+    assert PSC2_FROM_PSC1['010000000001'] == '000000000101'
+    assert len(compiled) == 1
+
+    # changing their contents does, even if size and mtime are unchanged
+    st = os.stat(psc2psc)
+    with open(psc2psc) as f:
+        contents = f.read()
+    with open(psc2psc, 'w') as f:
+        f.write(contents.replace('000000000101', '000000000109'))
+    os.utime(psc2psc, (st.st_atime, st.st_mtime))
+    set_conversion_tables(psc2psc, dob, cache)
+    assert PSC2_FROM_PSC1['010000000001'] == '000000000109'
+    assert PSC1_FROM_PSC2['000000000109'] == '010000000001'
+    assert '000000000101' not in PSC1_FROM_PSC2
+    assert len(compiled) == 2
+
+
+def test_convert_psc1_to_psc2(conversion_tables):
+    psc1 = ['070000123456', '999999999999', '010000000001',
+            '0100000000011234', '']
+    psc2 = convert_psc1_to_psc2(psc1)
+    assert list(psc2.mask) == [False, True, False, True, True]
+    assert list(psc2.compressed()) == ['000000000103', '000000000101']
+    for code, converted in zip(psc1, psc2):
+        if converted is not np.ma.masked:
+            assert converted == PSC2_FROM_PSC1[code]
+    assert convert_psc1_to_psc2([]).shape == (0,)
+
+
+def test_age_in_days(conversion_tables):
+    psc1 = ['010000000001', '010000000001', '070000123456',
+            '010000000002', '999999999999', '010000000001']
+    dates = ['2000-01-25 12:34:56', datetime.date(2001, 1, 15),
+             np.datetime64('2000-01-01'), '2010-01-01', '2010-01-01', 'NaT']
+    ages = age_in_days(psc1, np.array(dates, dtype=object).astype(str))
+    assert list(ages.mask) == [False, False, False, True, True, True]
+    assert list(ages.compressed()) == [10, 366, 1]
+    for code, date, age in zip(psc1[:3], (datetime.date(2000, 1, 25),
+                                          datetime.date(2001, 1, 15),
+                                          datetime.date(2000, 1, 1)),
+                               ages[:3]):
+        assert age == (date - DOB_FROM_PSC1[code]).days
+    # dates as datetime64
+    ages = age_in_days(psc1[:1], np.array(['2000-01-16'], dtype='datetime64[D]'))
+    assert list(ages) == [1]
+
+
+FIND_CODES_TEXT = (b'070000123456,11111;000000000102\n'
+                   b'0700001234567 99999 x070000123456x 22222\n')
+
+
+def test_find_codes(conversion_tables):
+    assert list(find_codes(FIND_CODES_TEXT)) == [
+        (0, '070000123456', 'PSC1'),
+        (13, '11111', 'DAWBA'),
+        (19, '000000000102', 'PSC2'),
+        (53, '070000123456', 'PSC1'),
+        (67, '22222', 'DAWBA'),
+    ]
+    assert list(find_codes(b'')) == []
+
+
+def test_find_codes_in_file(conversion_tables, tmp_path):
+    path = tmp_path / 'codes.txt'
+    path.write_bytes(FIND_CODES_TEXT)
+    assert (list(find_codes_in_file(str(path))) ==
+            list(find_codes(FIND_CODES_TEXT)))
+    path.write_bytes(b'')
+    assert list(find_codes_in_file(str(path))) == []
+
+
+def test_lazy_mapping():
+    calls = []
+
+    def initialize():
+        calls.append(None)
+        return {'a': 1}
+
+    mapping = core._LazyMapping(initialize)  # pylint: disable=W0212
+    assert 'not yet initialized' in repr(mapping)
+    assert not calls
+    assert mapping['a'] == 1
+    assert dict(mapping) == {'a': 1}
+    assert len(calls) == 1
+    mapping._reset()  # pylint: disable=W0212
+    assert 'a' in mapping
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize('subject_id', [
+    '070000123456',
+    '070000123456FU3',
+    '070000123456FU2',
+    '070000123456_1',
+    'FU2070000123456',
+    '07000123456',
+    '0000123456',
+    '000123456',
+    '123456',
+    '010000000002FU',
+    '2',
+    '999999999999',
+    '12345678901234',
+    '',
+])
+def test_guess_psc1_many(conversion_tables, subject_id):
+    for center in (1, 7):
+        expected = guess_psc1(subject_id, center)
+        assert guess_psc1_many([subject_id], center) == [expected]
+
+
+def test_guess_psc1_many_values(conversion_tables):
+    subject_ids = ['123456', '070000123456FU3', '2', '999999999999']
+    assert guess_psc1_many(subject_ids, 7) == ['070000123456', '070000123456',
+                                               None, None]
+    assert guess_psc1_many(subject_ids, 1) == [None, '070000123456',
+                                               '010000000002', None]
+
+
+def test_error_collector_limits():
+    errors = ErrorCollector(max_per_path=3, max_per_category=2)
+    for i in range(5):
+        errors.append(Error('a/mid.csv', 'Line {0} is wrong'.format(i),
+                            category='columns'))
+    for i in range(5):
+        errors.append(Error('a/ss.csv', 'Line {0} is wrong'.format(i),
+                            category='columns'))
+    errors.extend(Error('a/ft.csv', 'Error {0}'.format(i)) for i in range(5))
+
+    assert errors
+    assert errors.count == 15
+    assert errors.count_by_path == {'a/mid.csv': 5, 'a/ss.csv': 5,
+                                    'a/ft.csv': 5}
+    assert errors.count_by_category == {'columns': 10}
+    messages = [str(e) for e in errors]
+    # each file keeps its own errors of each category
+    assert messages == [
+        'Line 0 is wrong: a/mid.csv',
+        'Line 1 is wrong: a/mid.csv',
+        'Line 0 is wrong: a/ss.csv',
+        'Line 1 is wrong: a/ss.csv',
+        'Error 0: a/ft.csv',
+        'Error 1: a/ft.csv',
+        'Error 2: a/ft.csv',
+        '2 more errors not reported: a/ft.csv',
+        '6 more "columns" errors not reported: a/',
+    ]
+    assert len(errors) == len(messages)
+
+
+def test_error_collector_distinct_paths():
+    errors = ErrorCollector(max_total_per_category=10)
+    for i in range(1000):
+        errors.append(Error('a/b/{0:04}.dcm'.format(i), 'File is empty',
+                            category='empty'))
+    errors.append(Error('a/c/0000.dcm', 'File is empty', category='empty'))
+    errors.append(Error('a/d/0000.dcm', 'PSC1 code is wrong',
+                        category='psc1'))
+
+    assert errors.count == 1002
+    assert errors.count_by_category == {'empty': 1001, 'psc1': 1}
+    messages = [str(e) for e in errors]
+    assert len(errors) == len(messages) == 12
+    assert messages[:10] == ['File is empty: a/b/{0:04}.dcm'.format(i)
+                             for i in range(10)]
+    assert messages[10:] == [
+        'PSC1 code is wrong: a/d/0000.dcm',
+        '991 more "empty" errors not reported: a/',
+    ]
+
+    # a single file is reported as is
+    errors = ErrorCollector(max_per_category=1)
+    errors.extend(Error('a/b/1.dcm', 'Error {0}'.format(i), category='x')
+                  for i in range(3))
+    assert [str(e) for e in errors] == [
+        'Error 0: a/b/1.dcm',
+        '2 more "x" errors not reported: a/b/1.dcm',
+    ]
+
+
+def test_error_collector_empty():
+    errors = ErrorCollector()
+    assert not errors
+    assert len(errors) == 0
+    assert list(errors) == []
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2018 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+import os
+
+import pytest
+
+from imagen_databank import dicom_utils
+from imagen_databank.dicom_utils import MetadataCache, InvalidDicomError
+
+
+@pytest.fixture
+def read_files(monkeypatch):
+    """Replace reading DICOM metadata by reading text files, count reads."""
+    paths = []
+
+    def read_metadata(path, force=False):
+        paths.append(path)
+        with open(path) as f:
+            content = f.read()
+        if content == 'invalid':
+            raise InvalidDicomError('not a DICOM file')
+        elif content == 'unreadable':
+            raise IOError('cannot read file')
+        return {'PatientID': content, 'force': force}
+
+    monkeypatch.setattr(dicom_utils, 'read_metadata', read_metadata)
+    return paths
+
+
+def test_metadata_cache(tmp_path, read_files):
+    dcm = tmp_path / 'IM1'
+    dcm.write_text('070000123456')
+    path = str(dcm)
+    database = str(tmp_path / 'cache.sqlite')
+
+    with MetadataCache(database) as cache:
+        assert cache.lookup(path) is None
+        assert cache.read_metadata(path)['PatientID'] == '070000123456'
+        assert cache.read_metadata(path)['PatientID'] == '070000123456'
+        assert len(read_files) == 1
+        # files read with another force setting are read again
+        assert cache.read_metadata(path, force=True)['force']
+        assert len(read_files) == 2
+        assert (cache.hits, cache.misses) == (1, 3)
+
+    # persistent across runs
+    with MetadataCache(database) as cache:
+        assert cache.read_metadata(path, force=True)['PatientID'] == '070000123456'
+        assert len(read_files) == 2
+        assert (cache.hits, cache.misses) == (1, 0)
+
+        # modified files are read again
+        dcm.write_text('070000123456FU3')
+        assert cache.read_metadata(path, force=True)['PatientID'] == '070000123456FU3'
+        assert len(read_files) == 3
+        assert cache.read_metadata(path, force=True)['PatientID'] == '070000123456FU3'
+        assert len(read_files) == 3
+
+        # as are files removed from the cache
+        cache.invalidate(path)
+        cache.read_metadata(path, force=True)
+        assert len(read_files) == 4
+        cache.invalidate()
+        cache.read_metadata(path, force=True)
+        assert len(read_files) == 5
+
+        # files that do not exist any more are pruned
+        os.remove(path)
+        cache.prune()
+        assert cache.lookup(path) is None
+
+
+def test_metadata_cache_exceptions(tmp_path, read_files):
+    invalid = tmp_path / 'invalid'
+    invalid.write_text('invalid')
+    unreadable = tmp_path / 'unreadable'
+    unreadable.write_text('unreadable')
+
+    with MetadataCache(str(tmp_path / 'cache.sqlite')) as cache:
+        # invalid DICOM files are cached as such
+        for dummy_i in range(2):
+            with pytest.raises(InvalidDicomError):
+                cache.read_metadata(str(invalid))
+        assert read_files == [str(invalid)]
+
+        # IOError may be transient and is never cached
+        for dummy_i in range(2):
+            with pytest.raises(IOError):
+                cache.read_metadata(str(unreadable))
+        assert read_files == [str(invalid)] + [str(unreadable)] * 2
+        cache.store(str(unreadable), False, None, IOError('cannot read file'))
+        assert cache.lookup(str(unreadable)) is None
+
+
+def test_metadata_cache_version(tmp_path, read_files, monkeypatch):
+    dcm = tmp_path / 'IM1'
+    dcm.write_text('070000123456')
+    database = str(tmp_path / 'cache.sqlite')
+    with MetadataCache(database) as cache:
+        cache.read_metadata(str(dcm))
+    # the cache is invalidated when the version of pydicom changes
+    monkeypatch.setattr(dicom_utils.dicom, '__version__', 'other', raising=False)
+    with MetadataCache(database) as cache:
+        assert cache.lookup(str(dcm)) is None
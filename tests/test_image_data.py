@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2018 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+import os
+import logging
+import datetime
+import threading
+
+import pytest
+
+from imagen_databank import image_data
+from imagen_databank.image_data import (walk_image_data,
+                                        walk_image_data_parallel,
+                                        SeriesAccumulator, report_image_data)
+from imagen_databank.dicom_utils import InvalidDicomError, MetadataCache
+
+
+def _read_metadata(path, force=False):
+    """Read "DICOM metadata" from text files: series and instance UIDs."""
+    with open(path) as f:
+        content = f.read()
+    if content == 'invalid':
+        raise InvalidDicomError('not a DICOM file')
+    elif content == 'unreadable':
+        raise IOError('cannot read file')
+    series_uid, image_uid = content.split()
+    return {
+        'SOPClassUID': 'MR Image Storage',
+        'SeriesInstanceUID': series_uid,
+        'SOPInstanceUID': image_uid,
+        'SeriesNumber': int(series_uid),
+        'SeriesDescription': 'Series {0}'.format(series_uid),
+    }
+
+
+@pytest.fixture
+def dicom_files(tmp_path, monkeypatch):
+    """Directory with 3 series of "DICOM" files and a few unreadable files.
+
+    Returns
+    -------
+    tuple
+        The directory, relative paths of readable files in the order they
+        are found, and paths of the files read so far.
+
+    """
+    calls = []
+
+    def read_metadata(path, force=False):
+        calls.append(path)
+        return _read_metadata(path, force)
+
+    monkeypatch.setattr(image_data, 'read_metadata', read_metadata)
+    for series in range(1, 4):
+        directory = tmp_path / 'ImageData' / str(series)
+        directory.mkdir(parents=True)
+        for i in range(10):
+            (directory / 'IM{0}'.format(i)).write_text(
+                '{0} {0}.{1}'.format(series, i))
+    (tmp_path / 'ImageData' / 'DICOMDIR').write_text('junk')
+    (tmp_path / 'ImageData' / 'invalid').write_text('invalid')
+    (tmp_path / 'ImageData' / '2' / 'unreadable').write_text('unreadable')
+    path = str(tmp_path / 'ImageData')
+    relpaths = [relpath for dummy_a, relpath in image_data._walk_files(path)  # pylint: disable=W0212
+                if relpath not in ('invalid', os.path.join('2', 'unreadable'))]
+    return path, relpaths, calls
+
+
+def test_walk_image_data(dicom_files, caplog):
+    path, relpaths, calls = dicom_files
+    with caplog.at_level(logging.ERROR):
+        walked = list(walk_image_data(path))
+    assert [relpath for dummy_m, relpath in walked] == relpaths
+    assert len(calls) == 32  # DICOMDIR is not read
+    for metadata, relpath in walked:
+        assert metadata == _read_metadata(os.path.join(path, relpath))
+    assert 'cannot read nonstandard DICOM file' in caplog.text
+    assert 'cannot read file' in caplog.text
+
+
+@pytest.mark.parametrize('workers, max_in_flight', [
+    (1, None),
+    (4, None),
+    (4, 1),
+    (8, 3),
+])
+def test_walk_image_data_parallel(dicom_files, workers, max_in_flight):
+    path, relpaths, dummy_calls = dicom_files
+    expected = list(walk_image_data(path))
+
+    # same results in the same order
+    walked = list(walk_image_data_parallel(path, workers=workers,
+                                           max_in_flight=max_in_flight))
+    assert walked == expected
+
+    # same results in any order
+    walked = list(walk_image_data_parallel(path, workers=workers,
+                                           max_in_flight=max_in_flight,
+                                           ordered=False))
+    assert len(walked) == len(expected)
+    assert (sorted(walked, key=lambda x: x[1]) ==
+            sorted(expected, key=lambda x: x[1]))
+
+
+def test_walk_image_data_parallel_unordered(dicom_files, monkeypatch):
+    path, relpaths, dummy_calls = dicom_files
+    first = os.path.join(path, relpaths[0])
+    yielded = threading.Event()
+
+    def read_metadata(abspath, force=False):
+        # the first file is read only after another file has been yielded
+        if abspath == first:
+            yielded.wait(10)
+        return _read_metadata(abspath, force)
+
+    monkeypatch.setattr(image_data, 'read_metadata', read_metadata)
+    walked = []
+    for dummy_m, relpath in walk_image_data_parallel(path, workers=2,
+                                                     max_in_flight=4,
+                                                     ordered=False):
+        walked.append(relpath)
+        yielded.set()
+    assert sorted(walked) == sorted(relpaths)
+    assert walked[0] != relpaths[0]
+
+
+@pytest.mark.parametrize('walk', [walk_image_data, walk_image_data_parallel])
+def test_walk_image_data_cache(dicom_files, tmp_path, walk):
+    path, dummy_relpaths, calls = dicom_files
+    expected = list(walk_image_data(path))
+    del calls[:]
+    with MetadataCache(str(tmp_path / 'cache.sqlite')) as cache:
+        assert list(walk(path, cache=cache)) == expected
+        assert len(calls) == 32
+        # only the file that raised IOError is read again
+        assert list(walk(path, cache=cache)) == expected
+        assert calls[32:] == [os.path.join(path, '2', 'unreadable')]
+
+
+def _image(series_uid, image_uid, minute=0, **tags):
+    image = {
+        'SOPClassUID': 'MR Image Storage',
+        'SeriesInstanceUID': series_uid,
+        'SOPInstanceUID': image_uid,
+        'SeriesNumber': 1,
+        'SeriesDescription': 'T1',
+        'AcquisitionDate': datetime.date(2015, 2, 1),
+        'AcquisitionTime': datetime.time(12, minute),
+    }
+    image.update(tags)
+    return image
+
+
+def test_series_accumulator(caplog):
+    accumulator = SeriesAccumulator()
+    accumulator.add(_image('A', 'A1', 5, ImageType=['ORIGINAL']), 'a1')
+    accumulator.add(_image('B', 'B1', SeriesNumber=2, StationName='S'), 'b1')
+    accumulator.add(_image('A', 'A2', 1, ImageType=['DERIVED'],
+                           Manufacturer='M'), 'a2')
+    accumulator.add(_image('A', 'A3', 9), 'a3')
+    accumulator.add(_image('X', 'X1', SOPClassUID='Raw Data Storage'), 'x1')
+    assert accumulator.count == 4
+
+    result = accumulator.result()
+    assert sorted(result) == ['A', 'B']
+    series_data, images = result['A']
+    assert images == {'A1': 'a1', 'A2': 'a2', 'A3': 'a3'}
+    assert series_data['SeriesNumber'] == 1
+    assert series_data['ImageType'] == {'ORIGINAL', 'DERIVED'}
+    assert series_data['MinAcquisitionDateTime'] == datetime.datetime(2015, 2, 1, 12, 1)
+    assert series_data['MaxAcquisitionDateTime'] == datetime.datetime(2015, 2, 1, 12, 9)
+    # optional attributes are set by the first image where they are present
+    assert series_data['Manufacturer'] == 'M'
+    assert 'StationName' not in series_data
+    assert result['B'][0]['StationName'] == 'S'
+
+    columns = accumulator.columns()
+    assert columns['SeriesInstanceUID'] == ('B', 'A')  # least recently updated first
+    assert columns['Images'] == (1, 3)
+    assert columns['SeriesNumber'] == (2, 1)
+
+    # images must be consistent within a series
+    with caplog.at_level(logging.ERROR):
+        accumulator.add(_image('A', 'A4', SeriesDescription='T2'), 'a4')
+        accumulator.add(_image('A', 'A5', Manufacturer='N'), 'a5')
+        accumulator.add(_image('A', 'A1'), 'a1bis')
+    assert 'inconsistent series description "T1" / "T2"' in caplog.text
+    assert 'inconsistent manufacturer "M" / "N"' in caplog.text
+    assert 'duplicate image in series (T1)' in caplog.text
+    assert accumulator.result()['A'][1]['A1'] == 'a1'
+
+
+def test_series_accumulator_completed():
+    accumulator = SeriesAccumulator()
+    for series_uid, image_uid in (('A', 'A1'), ('B', 'B1'), ('A', 'A2'),
+                                  ('C', 'C1'), ('A', 'A3')):
+        accumulator.add(_image(series_uid, image_uid), image_uid.lower())
+    # B and C have not been updated by the last 3 and 1 images
+    assert [uid for uid, dummy_s, dummy_i in accumulator.completed(4)] == []
+    completed = list(accumulator.completed(3))
+    assert [uid for uid, dummy_s, dummy_i in completed] == ['B']
+    assert completed[0][2] == {'B1': 'b1'}
+    assert sorted(accumulator.result()) == ['A', 'C']
+    finished = list(accumulator.finish())
+    assert [uid for uid, dummy_s, dummy_i in finished] == ['C', 'A']
+    assert finished[1][2] == {'A1': 'a1', 'A2': 'a2', 'A3': 'a3'}
+    assert accumulator.result() == {}
+
+
+def test_report_image_data(dicom_files):
+    path, dummy_relpaths, dummy_calls = dicom_files
+    report = report_image_data(path)
+    assert sorted(report) == ['1', '2', '3']
+    for series_uid, (series_data, images) in report.items():
+        assert series_data['SeriesNumber'] == int(series_uid)
+        assert sorted(images.values()) == sorted(
+            os.path.join(series_uid, 'IM{0}'.format(i)) for i in range(10))
+    assert report_image_data(path, workers=2) == report
@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2018 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+import io
+import os
+import json
+import datetime
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from imagen_databank.behavioral import _TASK_SPECIFICS, MID_CSV, FT_CSV
+from imagen_databank.sanity import imaging
+from imagen_databank.sanity.imaging import ZipTree, check_zip_content
+
+
+ROOT = '070000123456FU3/'
+
+
+def _make_zip(path, members):
+    with zipfile.ZipFile(str(path), 'w') as z:
+        for name, data in members:
+            z.writestr(name, data)
+    return str(path)
+
+
+@pytest.fixture
+def image_data(tmp_path):
+    """ZIP file with 2 series of 3 "DICOM" files containing a PSC1 code."""
+    members = [(ROOT + 'ImageData/DICOMDIR', b'junk')]
+    for series in ('S1', 'S2'):
+        for i in range(3):
+            members.append((ROOT + 'ImageData/{0}/IM{1}'.format(series, i),
+                            b'070000123456FU3'))
+    members.append((ROOT + 'ImageData/S2/empty', b''))
+    return tmp_path, members
+
+
+@pytest.fixture
+def read_files(monkeypatch):
+    """Replace reading DICOM metadata by reading the PSC1 code as is."""
+    names = []
+
+    def read_zipped_metadata(zip_file, name):
+        names.append(name)
+        return {'PatientID': zip_file.read(name).decode('ascii')}
+
+    monkeypatch.setattr(imaging, '_read_zipped_metadata', read_zipped_metadata)
+    return names
+
+
+@pytest.mark.parametrize('data, compression, reads', [
+    (b'070000123456|', zipfile.ZIP_STORED, [13]),
+    (b'070000123456|' + b'x' * 100, zipfile.ZIP_STORED, [16]),
+    (b'070000123456|' + b'x' * 100, zipfile.ZIP_DEFLATED, [16]),
+    # the header does not fit in the first bytes
+    (b'0' * 20 + b'|' + b'x' * 100, zipfile.ZIP_DEFLATED, [16, 121]),
+])
+def test_read_zipped_metadata(tmp_path, monkeypatch, data, compression, reads):
+    read = []
+
+    def read_metadata(f, force=False):
+        # "DICOM headers" end with "|"
+        data = f.read()
+        read.append(len(data))
+        if b'|' not in data:
+            raise ValueError('truncated header')
+        return {'PatientID': data[:data.index(b'|')].decode('ascii')}
+
+    monkeypatch.setattr(imaging, 'read_metadata', read_metadata)
+    monkeypatch.setattr(imaging, '_DICOM_HEADER_SIZE', 16)
+    path = str(tmp_path / 'a.zip')
+    with zipfile.ZipFile(path, 'w', compression) as z:
+        z.writestr('a/IM1', data)
+    with zipfile.ZipFile(path) as z:
+        metadata = imaging._read_zipped_metadata(z, 'a/IM1')  # pylint: disable=W0212
+    assert metadata['PatientID'] == data[:data.index(b'|')].decode('ascii')
+    assert read == reads
+
+
+def test_ziptree(tmp_path):
+    path = _make_zip(tmp_path / 'a.zip', [
+        ('a/b/c/1', b'12345'),
+        ('a/b/2', b''),
+        ('a/d/3', b'123'),
+        ('a/4', b'1'),
+        ('5', b''),
+    ])
+    ziptree = ZipTree.create(path)
+    assert (ziptree.file_count, ziptree.total_size, ziptree.empty_file_count) == (5, 9, 2)
+    a = ziptree.directories['a']
+    assert (a.file_count, a.total_size, a.empty_file_count) == (4, 9, 1)
+    b = a.directories['b']
+    assert (b.file_count, b.total_size, b.empty_file_count) == (2, 5, 1)
+    assert b.filename == 'a/b/'
+    assert b.files['2'].filename == 'a/b/2'
+
+    walked = [(dirpath, sorted(dirnames), sorted(filenames))
+              for dirpath, dirnames, filenames in ziptree.walk()]
+    assert sorted(walked) == [
+        ('', ['a'], ['5']),
+        ('a/', ['b', 'd'], ['4']),
+        ('a/b/', ['c'], ['2']),
+        ('a/b/c/', [], ['1']),
+        ('a/d/', [], ['3']),
+    ]
+    # top-down: parents before children
+    dirpaths = [w[0] for w in walked]
+    assert dirpaths.index('a/') < dirpaths.index('a/b/') < dirpaths.index('a/b/c/')
+
+
+def test_ziptree_walk_pruned(tmp_path):
+    path = _make_zip(tmp_path / 'a.zip', [
+        ('a/b/c/1', b'1'),
+        ('a/d/2', b'2'),
+    ])
+    dirpaths = []
+    for dirpath, dirnames, dummy_filenames in ZipTree.create(path).walk():
+        dirpaths.append(dirpath)
+        if 'b' in dirnames:
+            dirnames.remove('b')
+    assert sorted(dirpaths) == ['', 'a/', 'a/d/']
+
+
+def test_ziptree_duplicate(tmp_path):
+    path = str(tmp_path / 'a.zip')
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('a/1', b'1')
+        with pytest.warns(UserWarning):
+            z.writestr('a/1', b'2')
+    with pytest.raises(imaging.BadZipFile):
+        ZipTree.create(path)
+
+
+@pytest.mark.parametrize('sampling, files_per_series, expected', [
+    ('first', 1, 1),
+    ('series', 1, 2),
+    ('series', 2, 4),
+    ('series', 10, 6),
+    ('all', 1, 6),
+])
+def test_sampling(conversion_tables, image_data, read_files,
+                  sampling, files_per_series, expected):
+    tmp_path, members = image_data
+    path = _make_zip(tmp_path / '070000123456FU3.zip', members)
+    psc1, errors = check_zip_content(path, 'FU3', '070000123456',
+                                     sampling=sampling,
+                                     files_per_series=files_per_series)
+    assert len(read_files) == expected
+    # neither DICOMDIR nor empty files are read
+    assert not any(n.endswith(('DICOMDIR', 'empty')) for n in read_files)
+    assert psc1 == {'070000123456'}
+    messages = [e.message for e in errors]
+    assert 'File is empty' in messages
+    assert not any('PSC1 code' in m for m in messages)
+
+
+def test_sampling_finds_wrong_psc1(conversion_tables, image_data, read_files):
+    tmp_path, members = image_data
+    members = [(name, b'010000000001FU3' if name.endswith('S2/IM2') else data)
+               for name, data in members]
+    path = _make_zip(tmp_path / '070000123456FU3.zip', members)
+
+    psc1, errors = check_zip_content(path, 'FU3', '070000123456',
+                                     sampling='series')
+    assert psc1 == {'070000123456'}
+
+    psc1, errors = check_zip_content(path, 'FU3', '070000123456',
+                                     sampling='all')
+    assert psc1 == {'070000123456', '010000000001'}
+    wrong = [e for e in errors if e.category == 'psc1']
+    assert len(wrong) == 1
+    assert wrong[0].path == ROOT + 'ImageData/S2/IM2'
+    assert wrong[0].message == ('PSC1 code "010000000001" was expected '
+                                'to be "070000123456"')
+
+
+@pytest.mark.parametrize('sampling, files_per_series', [
+    ('bogus', 1),
+    ('series', 0),
+])
+def test_sampling_invalid(image_data, read_files, sampling, files_per_series):
+    tmp_path, members = image_data
+    path = _make_zip(tmp_path / '070000123456FU3.zip', members)
+    with pytest.raises(ValueError):
+        check_zip_content(path, 'FU3', sampling=sampling,
+                          files_per_series=files_per_series)
+    with pytest.raises(ValueError):
+        next(imaging.check_zip_files(str(tmp_path), 'FU3', sampling=sampling,
+                                     files_per_series=files_per_series))
+    assert not read_files
+
+
+def test_errors_grouped_per_series(conversion_tables, tmp_path, read_files):
+    # more series directories and more files per series than
+    # the maximal number of errors kept per category
+    members = []
+    for series in range(12):
+        for i in range(20):
+            members.append((ROOT + 'ImageData/S{0}/IM{1}'.format(series, i),
+                            b'010000000001FU3'))
+    for i in range(20):
+        members.append((ROOT + 'ImageData/S0/empty{0}'.format(i), b''))
+    members.append((ROOT + 'ImageData/S1/empty', b''))
+    path = _make_zip(tmp_path / '070000123456FU3.zip', members)
+
+    psc1, errors = check_zip_content(path, 'FU3', '070000123456',
+                                     sampling='all')
+    assert psc1 == {'010000000001'}
+    assert len(read_files) == 240
+    empty = [(e.path, e.message) for e in errors if e.category == 'empty']
+    assert empty == [(ROOT + 'ImageData/S0/', '20 files are empty'),
+                     (ROOT + 'ImageData/S1/empty', 'File is empty')]
+    wrong = [(e.path, e.message) for e in errors if e.category == 'psc1']
+    assert sorted(wrong) == sorted(
+        (ROOT + 'ImageData/S{0}/'.format(series),
+         'PSC1 code "010000000001" was expected to be "070000123456" '
+         'in 20 files')
+        for series in range(12))
+    assert not any('not reported' in e.message for e in errors)
+
+
+@pytest.fixture
+def upload(tmp_path, image_data, read_files, monkeypatch):
+    """Directory with a ZIP file and a misnamed ZIP file, checked in threads."""
+    dummy_path, members = image_data
+    members = members + [(ROOT + 'AdditionalData/Scanning/notes.txt', b'x')]
+    directory = tmp_path / 'upload'
+    directory.mkdir()
+    good = _make_zip(directory / '070000123456FU3.zip', members)
+    misnamed = _make_zip(directory / 'misnamed.zip', members)
+    monkeypatch.setattr(imaging, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    return str(directory), good, misnamed
+
+
+def _check(directory, journal, **kwargs):
+    return {r['path']: r for r in
+            imaging.check_zip_files(directory, journal=journal, workers=2,
+                                    **kwargs)}
+
+
+@pytest.mark.parametrize('timepoint', [None, 'FU3'])
+def test_check_zip_files_misnamed(conversion_tables, upload, timepoint):
+    directory, good, misnamed = upload
+    results = _check(directory, None, timepoint=timepoint)
+    assert sorted(results) == sorted([good, misnamed])
+    assert all(r['status'] == 'done' for r in results.values())
+    # suffixes are removed from PSC1 codes only given a time point
+    assert results[good]['psc1'] == ['070000123456' if timepoint else '070000123456FU3']
+    messages = [e['message'] for e in results[misnamed]['errors']]
+    assert any(m.startswith('Incorrect ZIP file name') for m in messages)
+    # contents are still checked
+    assert 'File is empty' in messages
+    assert not any(m.startswith('Cannot check ZIP file') for m in messages)
+    # DICOM files are checked against the uppermost folder name
+    for result in results.values():
+        messages = [e['message'] for e in result['errors']]
+        assert not any('was expected to be' in m for m in messages)
+        assert not any('"None"' in m for m in messages)
+
+
+def test_check_zip_files_journal(conversion_tables, upload, monkeypatch):
+    directory, good, misnamed = upload
+    journal = os.path.join(directory, 'journal.jsonl')
+
+    # the check of the misnamed ZIP file fails
+    check_ziptree = imaging._check_ziptree  # pylint: disable=W0212
+
+    def failing_check_ziptree(path, *args):
+        if path == misnamed:
+            raise RuntimeError('interrupted')
+        return check_ziptree(path, *args)
+
+    monkeypatch.setattr(imaging, '_check_ziptree', failing_check_ziptree)
+    results = _check(directory, journal)
+    assert results[good]['status'] == 'done'
+    assert results[misnamed]['status'] == 'failed'
+    assert results[misnamed]['errors'][-1]['message'] == (
+        'Cannot check ZIP file: interrupted')
+    monkeypatch.setattr(imaging, '_check_ziptree', check_ziptree)
+
+    # resume: only ZIP files whose check failed are checked again
+    results = _check(directory, journal)
+    assert list(results) == [misnamed]
+    assert results[misnamed]['status'] == 'done'
+    assert _check(directory, journal) == {}
+
+    # ZIP files modified since are checked again
+    st = os.stat(good)
+    os.utime(good, (st.st_atime, st.st_mtime + 10))
+    assert list(_check(directory, journal)) == [good]
+
+    # as are all ZIP files if the settings of the check change
+    results = _check(directory, journal, sampling='all')
+    assert sorted(results) == sorted([good, misnamed])
+
+    # every result has been appended to the journal
+    with open(journal) as f:
+        lines = [json.loads(line) for line in f]
+    assert [r['path'] for r in lines].count(misnamed) == 3
+    assert [r['path'] for r in lines].count(good) == 3
+
+
+def _behavioral_file(task, trials):
+    first_word, columns = _TASK_SPECIFICS[task][:2]
+    lines = ['{0} task\t01.02.2015 12:34:56\tSubject ID: 070000123456FU3\t'
+             'Task type: Scanning'.format(first_word),
+             '\t'.join(columns)]
+    lines.extend('\t'.join([str(i)] + ['x'] * (len(columns) - 1))
+                 for i in range(1, trials + 1))
+    return io.StringIO('\n'.join(lines) + '\n')
+
+
+@pytest.mark.parametrize('task', sorted(_TASK_SPECIFICS))
+def test_check_behavioral_content(conversion_tables, task):
+    expected_trials = _TASK_SPECIFICS[task][4]
+    date = datetime.date(2015, 2, 1)
+
+    subject_id, errors = imaging._check_behavioral_content(  # pylint: disable=W0212
+        _behavioral_file(task, expected_trials), 'f.csv', task,
+        'FU3', '070000123456', date)
+    assert subject_id == '070000123456FU3'
+    assert [str(e) for e in errors] == []
+
+    subject_id, errors = imaging._check_behavioral_content(  # pylint: disable=W0212
+        _behavioral_file(task, expected_trials - 1), 'f.csv', task,
+        'FU3', '010000000001', date + datetime.timedelta(1))
+    assert [str(e) for e in errors] == [
+        'Incorrect behavioral file content: PSC1 code "070000123456" '
+        'was expected to be "010000000001": f.csv',
+        'Behavioral file contains {0} trials instead of {1}: f.csv'
+        .format(expected_trials - 1, expected_trials),
+        'Date was expected to be "2015-02-02" instead of "2015-02-01": f.csv',
+    ]
+
+
+def test_behavioral_files_read_in_memory(conversion_tables, tmp_path,
+                                         image_data, read_files, monkeypatch):
+    dummy_path, members = image_data
+    scanning = ROOT + 'AdditionalData/Scanning/'
+    mid = _behavioral_file(MID_CSV, 41).getvalue() + 'x\tshort\n'
+    ft = _behavioral_file(FT_CSV, 24).getvalue()
+    members = members + [
+        (scanning + 'mid_070000123456FU3.csv', mid.encode('ascii')),
+        (scanning + 'ft_070000123456FU3.csv', ft.encode('ascii')),
+    ]
+    path = str(tmp_path / '070000123456FU3.zip')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name, data in members:
+            z.writestr(name, data)
+
+    # behavioral files are never extracted to disk
+    def extract(*args, **kwargs):
+        raise AssertionError('behavioral file extracted to disk')
+
+    monkeypatch.setattr(zipfile.ZipFile, 'extract', extract)
+    monkeypatch.setattr(zipfile.ZipFile, 'extractall', extract)
+
+    with zipfile.ZipFile(path) as z:
+        with imaging._open_zipped_text(z, scanning + 'ft_070000123456FU3.csv') as f:  # pylint: disable=W0212
+            assert f.name == scanning + 'ft_070000123456FU3.csv'
+            assert f.read() == ft
+
+    dummy_psc1, errors = check_zip_content(path, 'FU3', '070000123456')
+    messages = [str(e) for e in errors if e.path.startswith(scanning)]
+    assert messages == [
+        'Behavioral file contains 41 trials instead of 42: ' + scanning +
+        'mid_070000123456FU3.csv',
+        "Line 44 contains 2 columns instead of 17: <['x', 'short']>: " +
+        scanning + 'mid_070000123456FU3.csv',
+        'Column 1 of line 44 "x" should contain only numbers: '
+        "<['x', 'short']>: " + scanning + 'mid_070000123456FU3.csv',
+    ]
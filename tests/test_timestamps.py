@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2018 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+from datetime import datetime
+
+import pytest
+
+from imagen_databank.timestamps import TimestampParser
+
+
+FORMATS = (
+    '%d-%b-%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d.%m.%Y %H:%M:%S',
+    '%m/%d/%Y %I:%M:%S %p',
+)
+
+
+@pytest.mark.parametrize('date_string', [
+    '01-Feb-2015 12:34:56',
+    '1-feb-2015 12:34:56',
+    '01/02/2015 12:34',
+    '01.02.2015 12:34:56',
+    '1.2.2015 2:03:04',
+    '12/31/2015 01:34:56 PM',
+    '12/31/2015 12:34:56 am',
+])
+def test_same_as_strptime(date_string):
+    expected = None
+    for date_format in FORMATS:
+        try:
+            expected = datetime.strptime(date_string, date_format)
+            break
+        except ValueError:
+            pass
+    assert expected is not None
+    assert TimestampParser(FORMATS).parse(date_string) == expected
+
+
+@pytest.mark.parametrize('date_string', [
+    '',
+    '01-Foo-2015 12:34:56',
+    '30.02.2015 12:34:56',
+    '01.02.2015 12:34:56 trailing',
+    '2015-02-01 12:34:56',
+])
+def test_no_match(date_string):
+    assert TimestampParser(FORMATS).parse(date_string) is None
+
+
+def test_detected_format_per_key():
+    parser = TimestampParser(FORMATS)
+    assert parser.detected_format('01') is None
+    parser.parse('01-Feb-2015 12:34:56', '01')
+    parser.parse('01.02.2015 12:34:56', '04')
+    assert parser.detected_format('01') == '%d-%b-%Y %H:%M:%S'
+    assert parser.detected_format('04') == '%d.%m.%Y %H:%M:%S'
+    # a time stamp that matches no format does not change anything
+    assert parser.parse('garbage', '01') is None
+    assert parser.detected_format('01') == '%d-%b-%Y %H:%M:%S'
+    # another format is detected if the format changes
+    parser.parse('01/02/2015 12:34', '01')
+    assert parser.detected_format('01') == '%d/%m/%Y %H:%M'
+    assert parser.detected_format('04') == '%d.%m.%Y %H:%M:%S'
+
+
+def test_detected_format_is_tried_first():
+    parser = TimestampParser(('%d/%m/%Y', '%m/%d/%Y'))
+    # ambiguous time stamps match the first format by default...
+    assert parser.parse('01/02/2015', 'a') == datetime(2015, 2, 1)
+    # ...unless the second format has been detected for this key
+    assert parser.parse('12/31/2015', 'b') == datetime(2015, 12, 31)
+    assert parser.detected_format('b') == '%m/%d/%Y'
+    assert parser.parse('01/02/2015', 'b') == datetime(2015, 1, 2)
+    assert parser.parse('01/02/2015', 'a') == datetime(2015, 2, 1)
+
+
+def test_unsupported_directive():
+    with pytest.raises(ValueError):
+        TimestampParser(('%Y-%j',))